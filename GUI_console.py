@@ -1,36 +1,29 @@
 import asyncio
-import contextlib
-import queue
 import traceback
-from time import perf_counter
 
 from PySide6 import QtCore, QtGui, QtWidgets
-from PySide6.QtSerialPort import QSerialPort
 
-import numpy as np
 import pyqtgraph as pg
-from msgpack import Packer, Unpacker
-from pyqtgraph import PlotDataItem, PlotWidget
+from pyqtgraph import PlotWidget
 
 # import PySide6.QtAsyncio as QtAsyncio     # doesn't support the task used to read the controller yet
 from qasync import QApplication, QEventLoop
 
 from gamepad import Gamepad
-from simple_msgpack_console import parse_messages, rxQueue, get_data_packet
-from pico_interface import (
-    ControlPacket,
-    MotionVector,
-    calc_steer_center,
-    calc_motion_vec,
-    WrapMsgPack,
-    PicoSerial,
-)
+from pico_interface import ControlPacket, MotionVector
 from pico_interface import RCONST
+from control_runtime import ControlFrame, ControlRuntime
+from link_monitor import LinkMonitor
+from tx_scheduler import CONTROL, SAFETY
+from plot_engine import PlotEngine
+from gui_serial import SerialConsoleWidget
+from rover_display import RoverDisplayItem
+from perf_hud import PerfHud
+import flight_recorder
+import profiling
 
-from typing import Dict, Tuple
-
-unpacker = Unpacker()
-packer = Packer()
+from functools import partial
+from typing import Tuple
 
 
 async def removetasks(loop):
@@ -52,32 +45,32 @@ async def shutdown_signal(signal, loop):
     await removetasks(loop)
 
 
-def wheel_angles_to_pg(*args):
-    # wheel angles have CCW (+), with 0 degrees in the +Y direction
-    # pg angles have CW (+), with 0 degrees in the -X direction
-    return [-arg for arg in args]
-
-
 class MainWindow(QtWidgets.QWidget):
     def __init__(self, controller: Gamepad):
         super().__init__()
 
         self.pw = PlotWidget(self)
-        self.cmap_table = pg.colormap.get("CET-C2").getLookupTable(nPts=6)
-        self.legend = self.pw.addLegend()
-        self.data = []
-        self.lines: PlotDataItem = []
-        self.tick: int = 0  # wraps from 0-1000
+        self.plot_engine = PlotEngine(self.pw, capacity=1000, visible=100)
         self.ticksize: float = 0.05
         self.controller = controller
         self.controller_toggle = QtWidgets.QToolButton()
         self.running = False
         self.console = SerialConsoleWidget()
         self.rdisp = pg.PlotWidget()
-        self.arrows: Dict[str : pg.ArrowItem] = None
-        self.sc = pg.TargetItem
+        self.rover_item: RoverDisplayItem = None
         self._task_set = set()
         self.ctrlpacket: ControlPacket = ControlPacket()
+        self.link = LinkMonitor(partial(self.console.send_raw, cls=SAFETY))
+        self.link.add_observer(self.on_link_state)
+        self.console.worker.message_filter = self.link.on_message
+        self.runtime = ControlRuntime(
+            state=controller,
+            tx=partial(self.console.send_raw, cls=CONTROL),
+            period=self.ticksize,
+            packet_interval=5 * self.ticksize,
+            link=self.link,
+        )
+        self.runtime.add_observer(self.on_control_frame)
 
         lay = QtWidgets.QVBoxLayout(self)
         toolbar = QtWidgets.QToolBar()
@@ -85,6 +78,8 @@ class MainWindow(QtWidgets.QWidget):
         self.controller_toggle.setText("Connect &Gamepad")
         self.controller_toggle.setCheckable(True)
         self.controller_toggle.toggled.connect(self.start)
+        self.hud_toggle = QtWidgets.QToolButton(text="&Perf", checkable=True)
+        toolbar.addWidget(self.hud_toggle)
         lay.addWidget(toolbar)
 
         hlay = QtWidgets.QHBoxLayout()
@@ -102,24 +97,15 @@ class MainWindow(QtWidgets.QWidget):
 
         self._roverdisp_setup()
 
+        ## perf overlay, F3 or the toolbar button
+        self.hud = PerfHud(self, control=self.runtime.stats)
+        self.hud_toggle.toggled.connect(self.hud.toggle)
+        QtGui.QShortcut(QtGui.QKeySequence("F3"), self, activated=self.hud_toggle.toggle)
+
     def _roverdisp_setup(self):
-        self.arrows = {"FL": None, "FR": None, "BL": None, "BR": None}
-        pos = {
-            "FL": (-RCONST.SCDX, RCONST.SCDY),
-            "FR": (RCONST.SCDX, RCONST.SCDY),
-            "BL": (-RCONST.SCDX, -RCONST.SCDY),
-            "BR": (RCONST.SCDX, -RCONST.SCDY),
-        }
-
-        for key in self.arrows:
-            arrow = pg.ArrowItem(angle=90)
-            self.arrows[key] = arrow
-            self.rdisp.addItem(arrow)
-            arrow.setPos(*pos[key])
-
-        self.sc = pg.TargetItem()
-        self.sc.setPos(0, 0)
-        self.rdisp.addItem(self.sc)
+        """Displays rover wheel vectors, speeds & steering center"""
+        self.rover_item = RoverDisplayItem()
+        self.rdisp.addItem(self.rover_item)
         # self.rdisp.getPlotItem().enableAutoRange()
         self.rdisp.setXRange(min=RCONST.SCDX * -15, max=RCONST.SCDX * 15)
         self.rdisp.setYRange(min=RCONST.SCDY * -15, max=RCONST.SCDY * 15)
@@ -134,14 +120,9 @@ class MainWindow(QtWidgets.QWidget):
                 self.controller_toggle.setChecked(False)
             self.controller_toggle.setText("Connect &Gamepad")
 
-    def update_motion_vector(self, FL: int, FR: int, BL: int, BR: int, sc: Tuple[int, int]):
-        offset = 90
-        self.arrows["FL"].setStyle(angle=FL + offset)
-        self.arrows["FR"].setStyle(angle=FR + offset)
-        self.arrows["BL"].setStyle(angle=BL + offset)
-        self.arrows["BR"].setStyle(angle=BR + offset)
-
-        self.sc.setPos(*sc)
+    def update_motion_vector(self, mvec: MotionVector, sc: Tuple[float, float]):
+        """Sets wheel vectors & steering center for rover motion display. Repaints only if they changed."""
+        self.rover_item.set_motion(mvec, sc)
 
     def showEvent(self, ev):
         QtCore.QTimer.singleShot(100, self.start)
@@ -150,29 +131,16 @@ class MainWindow(QtWidgets.QWidget):
         self,
         *data,
     ):
-        for idx, vardata in enumerate(data):
-            if idx >= len(self.data):
-                self.data.append(np.zeros(1000))
-                self.data[idx][self.tick] = vardata
-                self.lines.append(
-                    self.pw.plot(self.data[idx], pen=self.cmap_table[idx], name=f"Data {idx}")
-                )
-            self.data[idx][self.tick] = vardata
-        self.pw.setXRange(self.tick - 100, self.tick - 0.05 * 100, padding=0.05)
-
-        self.tick += 1
-        if self.tick >= 1000:
-            self.tick = 0
+        self.plot_engine.push(*data)
 
     def set_names(self, names_list):
-        self.legend.clear()
-        for idx, name in enumerate(names_list[: len(self.data)]):
-            self.legend.addItem(self.lines[idx], name)
+        self.plot_engine.set_names(names_list)
 
     def start(self, state=False):
         if self.running:
             print("Gamepad disabled")
             self.running = False
+            self.controller.rumbler.stop()
             self.set_controller_state(False)
             return
         try:
@@ -194,6 +162,10 @@ class MainWindow(QtWidgets.QWidget):
             self._task_set.add(message_transmit)
             message_transmit.add_done_callback(self.check_exceptions)
 
+            rumble = asyncio.create_task(self.controller.rumble())  # plays the on_link_state haptics
+            self._task_set.add(rumble)
+            rumble.add_done_callback(self.check_exceptions)
+
             self.set_controller_state(True)
 
         except Exception as e:
@@ -205,48 +177,39 @@ class MainWindow(QtWidgets.QWidget):
         self.update_plot(*[0, 0, 0, 0])
         self.set_names(["ljx", "ljy", "rjx", "rt"])
         while self.running and self.controller:
-            vals = [
-                self.controller.joystick_left_x,
-                self.controller.joystick_left_y,
-                self.controller.joystick_right_x,
-                self.controller.trigger_right,
-            ]
-            # vals = [val / JOY_MID for val in vals]
-            # print(vals)
-            self.update_plot(*vals)
-            for idx, datal in enumerate(self.lines):
-                datal.setData(self.data[idx])
-
-            self.ctrlpacket = ControlPacket(
-                self.controller.button_a,
-                self.controller.button_b,
-                int(self.controller.trigger_right * RCONST.TRIGGER_MAX),
-                int(self.controller.joystick_left_x * RCONST.JOY_MAX),
-                int(self.controller.joystick_left_y * RCONST.JOY_MAX),
-            )
-            d, h = calc_steer_center(self.ctrlpacket.ljx, self.ctrlpacket.ljy)
-            mvec = calc_motion_vec(self.ctrlpacket, d, h)
-
-            angles = mvec.aFL, mvec.aFR, mvec.aBL, mvec.aBR
-            # print(angles, f"({d:.2f} {h:.2f})")   #DEBUG
-            angles = wheel_angles_to_pg(*angles)
-            # self.update_motion_vector(mvec.aFL, mvec.aFR, mvec.aBL, mvec.aBR, (d, h))
-            self.update_motion_vector(*angles, (d, h))
-
+            self.runtime.stats.tick()
+            self.runtime.step()
+            with profiling.stage("render"):
+                self.plot_engine.render()
             await asyncio.sleep(self.ticksize)
         print("Done running!")
 
+    def on_control_frame(self, frame: ControlFrame):
+        self.update_plot(
+            self.controller.joystick_left_x,
+            self.controller.joystick_left_y,
+            self.controller.joystick_right_x,
+            self.controller.trigger_right,
+        )
+        self.ctrlpacket = frame.packet
+        # print(frame.mvec, frame.steer_center)   #DEBUG
+        self.update_motion_vector(frame.mvec, frame.steer_center)
+
+    def on_link_state(self, old: str, new: str):
+        """Rumble the controller when the link degrades, drops or comes back"""
+        condition = {"lost": "link_lost", "degraded": "link_degraded"}.get(new)
+        if condition is None and old in ("lost", "degraded"):
+            condition = "connected"
+        if condition is not None:
+            self.controller.rumbler.notify(condition)
+        if new == "lost":
+            self.console.output_te.appendPlainText(f" !-- link lost: {self.link.stats.summary()} --!")
+
     async def send_control_packet(self):
-        last_packet_time = perf_counter()
-        last_packet = ControlPacket()
         while self.running and self.controller:
-            if self.console.serial.isOpen() and (
-                self.ctrlpacket != last_packet or perf_counter() - last_packet_time > 5
-            ):
+            if self.console.is_open() and self.runtime.send():
                 print(f"TX: {self.ctrlpacket}")
-                self.console.send_raw(WrapMsgPack(packer, self.ctrlpacket.to_iter()))
-                last_packet_time = perf_counter()
-            await asyncio.sleep(5 * self.ticksize)
+            await asyncio.sleep(self.runtime.packet_interval)
 
     async def catch_interrupts(self):
         signals = (signal.SIGHUP, signal.SIGTERM, signal.SIGINT)
@@ -264,90 +227,22 @@ class MainWindow(QtWidgets.QWidget):
             print(f"NotImplementedError: {traceback.format_exc()}")
         except Exception as e:
             print(f"Exception!\n{traceback.format_exc()}\nquitting...")
+            flight_recorder.dump(f"exception_{type(e).__name__}")
             self.running = False
 
 
-class SerialConsoleWidget(QtWidgets.QWidget):
-    def __init__(self, parent=None):
-        super(SerialConsoleWidget, self).__init__(parent)
-        self.message_le = QtWidgets.QLineEdit()
-        self.send_btn = QtWidgets.QPushButton(text="Send", clicked=self.send)
-        self.output_te = QtWidgets.QTextEdit(readOnly=True)
-        self.button = QtWidgets.QPushButton(
-            text="Connect Serial", checkable=True, toggled=self.on_toggled
-        )
-        lay = QtWidgets.QVBoxLayout(self)
-        hlay = QtWidgets.QHBoxLayout()
-        hlay.addWidget(self.message_le)
-        hlay.addWidget(self.send_btn)
-        lay.addLayout(hlay)
-        lay.addWidget(self.output_te)
-        lay.addWidget(self.button)
-
-        self.serial = QSerialPort(
-            # "/dev/ttyACM0",
-            PicoSerial.find_pico(),
-            baudRate=115200,
-            readyRead=self.receive,
-            flowControl=QSerialPort.FlowControl.NoFlowControl,
-        )
-        self.serial.errorOccurred.connect(self.on_error)
-
-    # @QtCore.pyqtSlot()
-    def receive(self):
-        while self.serial.canReadLine():
-            parse_messages(unpacker, self.serial.readAll().data())
-            # text = self.serial.readLine().data().decode()
-            # text = text.rstrip('\r\n')
-            # self.output_te.append(text)
-        with contextlib.suppress(queue.Empty):
-            for obj in iter(lambda: rxQueue.get(block=True, timeout=0.01), None):
-                if obj is None:
-                    break
-                self.output_te.append(f"~RX({rxQueue.qsize()}):{obj}")
-
-    # @QtCore.pyqtSlot()
-    def send(self):
-        if self.serial.isOpen():
-            self.serial.write(self.message_le.text().encode())
-
-    def send_raw(self, rawdata):
-        if self.serial.isOpen():
-            self.serial.write(rawdata)
-
-    # @QtCore.pyqtSlot(bool)
-    def on_toggled(self, checked):
-        self.button.setText("Disconnect Serial" if checked else "Connect Serial")
-        if checked:
-            if self.serial.isOpen():
-                self.serial.clear()
-                self.serial.setDataTerminalReady(True)
-                self.output_te.append(" -- Connected to device --")
-            elif not self.serial.open(QtCore.QIODevice.OpenModeFlag.ReadWrite):
-                self.button.setChecked(False)
-                self.output_te.append(" !-- Can't open device --!")
-                print("Can't open device!")
-        else:
-            self.serial.close()
-            self.button.setText("Connect Serial")
-
-    def on_error(self, error: QSerialPort.SerialPortError):
-        # self.output_te.append(f"!ERR! {error}")
-        if error == QSerialPort.SerialPortError.NoError:
-            return
-        print(f"Error: {error}")
-        # print(f"Error: {self.serial.errorString(), self.serial.error()}")
-        if self.serial.isOpen():
-            self.serial.close()
-        self.serial.clearError()
-        self.button.setText("Connect Serial")
-
-
 if __name__ == "__main__":
+    import argparse
     import signal
     import sys
 
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser()
+    profiling.add_argument(parser)
+    args, qt_args = parser.parse_known_args()
+    profiling.setup(args)
+    flight_recorder.install()
+
+    app = QApplication(sys.argv[:1] + qt_args)
     event_loop = QEventLoop(app)
     asyncio.set_event_loop(event_loop)
     app_close_event = asyncio.Event()
@@ -360,6 +255,7 @@ if __name__ == "__main__":
     g = Gamepad()
     w = MainWindow(g)
     w.show()
+    app.aboutToQuit.connect(g.erase_rumble)  # stops the rumble task & frees the uploaded effects
 
     with event_loop:
         event_loop.run_until_complete(app_close_event.wait())
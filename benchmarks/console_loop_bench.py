@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Idle CPU and RX-to-display latency of the interactive msgpack console (Linux).
+
+Runs simple_msgpack_console on a pseudo-terminal, with another pty standing in for the Pico's serial port:
+
+- idle CPU: the console's CPU time over a few seconds with no traffic, from /proc/<pid>/stat
+- latency: time from writing a line to the "serial port" until it appears on the console's terminal
+
+    python benchmarks/console_loop_bench.py [--idle 3] [--pings 200]
+"""
+
+import argparse
+import os
+import pty
+import select
+import statistics
+import sys
+import time
+import tty
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")  # utime + stime
+
+
+def read_until(fd: int, marker: bytes, timeout: float) -> bytes:
+    """Read fd until marker shows up; returns everything read"""
+    data = b""
+    deadline = time.perf_counter() + timeout
+    while marker not in data:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+            raise TimeoutError(f"{marker!r} not seen")
+        data += os.read(fd, 65536)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--idle", type=float, default=3.0, help="idle measurement time, s")
+    parser.add_argument("--pings", type=int, default=200, help="latency samples")
+    args = parser.parse_args()
+
+    pico, pico_slave = pty.openpty()
+    tty.setraw(pico_slave)
+    port = os.ttyname(pico_slave)
+
+    pid, term = pty.fork()
+    if pid == 0:
+        os.chdir(REPO)
+        os.execv(sys.executable, [sys.executable, "simple_msgpack_console.py", "--port", port])
+
+    try:
+        read_until(term, b"> ", 10)
+        time.sleep(0.5)  # let startup settle
+
+        start_cpu, start = cpu_seconds(pid), time.perf_counter()
+        time.sleep(args.idle)
+        idle_cpu = (cpu_seconds(pid) - start_cpu) / (time.perf_counter() - start)
+
+        latencies = []
+        for i in range(args.pings):
+            marker = f"ping{i:05d}".encode()
+            t0 = time.perf_counter()
+            os.write(pico, marker + b"\r\n")
+            read_until(term, marker, 5)
+            latencies.append(time.perf_counter() - t0)
+            time.sleep(0.05)  # spaced out, so output batching doesn't hold lines back
+            while select.select([term], [], [], 0)[0]:
+                os.read(term, 65536)
+    finally:
+        os.kill(pid, 2)
+        os.waitpid(pid, 0)
+
+    latencies.sort()
+    print(f"idle CPU         {idle_cpu * 100:6.2f} %")
+    print(
+        f"RX->display      median {statistics.median(latencies) * 1e3:.3f} ms,"
+        f" p95 {latencies[int(0.95 * len(latencies))] * 1e3:.3f} ms, max {latencies[-1] * 1e3:.3f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
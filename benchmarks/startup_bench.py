@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Cold-start time & memory of each entry point.
+
+Each run is a fresh interpreter that imports the entry point module (its __main__ block doesn't run) and reports
+its own peak RSS, so the numbers cover interpreter start + imports: the fixed cost before the rover can drive.
+
+    python benchmarks/startup_bench.py              # all entry points, 5 runs each
+    python benchmarks/startup_bench.py rover -n 20 --importtime
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = [
+    "rover",
+    "control_runtime",
+    "simple_msgpack_console",
+    "GUI_console",
+    "GUI_console_pyjoystick",
+]
+
+# child: import the module, then print peak RSS in kB (ru_maxrss is kB on Linux, bytes on macOS)
+CHILD = """
+import resource, sys
+import {module}
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(rss // 1024 if sys.platform == "darwin" else rss)
+"""
+
+
+def run_once(module: str, python: str = sys.executable) -> tuple[float, int]:
+    """Returns (wall time in s, peak RSS in kB) of one cold import"""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [python, "-c", CHILD.format(module=module)], cwd=REPO, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed")
+    return elapsed, int(proc.stdout.split()[-1])
+
+
+def slowest_imports(module: str, top: int = 10, python: str = sys.executable) -> list[tuple[int, str]]:
+    """The module's direct imports, slowest first, as (cumulative us, name) from python -X importtime"""
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"], cwd=REPO, capture_output=True, text=True
+    )
+    children = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:  # children are listed before their parent
+            if name.strip() == module:
+                return sorted(children, reverse=True)[:top]
+            children = []
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS, help="entry point modules")
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="also list the slowest top-level imports")
+    args = parser.parse_args()
+
+    print(f"{'entry point':<26}{'median ms':>10}{'min ms':>9}{'RSS MB':>9}")
+    for module in args.modules:
+        try:
+            runs = [run_once(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{module:<26}  failed: {e}")
+            continue
+        times = [t for t, _ in runs]
+        rss = max(r for _, r in runs)
+        print(f"{module:<26}{statistics.median(times) * 1e3:10.1f}{min(times) * 1e3:9.1f}{rss / 1024:9.1f}")
+        if args.importtime:
+            for us, name in slowest_imports(module):
+                print(f"    {us / 1e3:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
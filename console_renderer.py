@@ -0,0 +1,106 @@
+"""Batched, rate-limited terminal output for the serial consoles.
+
+Lines are collected and written at most `max_rate` times a second in a single write, with the input line
+redrawn once per flush. Repeats of the same line collapse into one "×N" line. When more lines arrive than can
+usefully be shown, the renderer switches to a summary: the newest lines plus a count of what was skipped.
+"""
+
+import sys
+from collections import deque
+from time import perf_counter
+
+import profiling
+from line_editor import LineEditor
+
+
+class ConsoleRenderer:
+    def __init__(
+        self,
+        editor: LineEditor = None,
+        out=None,
+        max_rate: float = 30,
+        max_lines: int = 100,
+        summary_tail: int = 10,
+    ):
+        """max_lines: most lines written per flush; beyond that, the flush is a summary of the newest
+        summary_tail lines"""
+        self.editor = editor
+        self.out = out or (editor.out if editor is not None else sys.stdout)
+        self.interactive = editor is not None and editor.interactive
+        self.min_interval = 1 / max_rate
+        self.max_lines = max_lines
+        self.summary_tail = summary_tail
+        self.pending: deque[list] = deque(maxlen=max_lines + 1)  # [text, count]
+        self.skipped = 0  # lines that fell out of `pending` since the last flush
+        self.total_skipped = 0
+        self.summary = False  # last flush was a summary
+        self.last_line: str = None  # last line written, and how many times in a row
+        self.last_count = 0
+        self.last_flush = 0.0
+        self._first_pending = 0.0  # when the oldest pending line arrived
+
+    def write(self, text: str):
+        if not self.pending:
+            self._first_pending = perf_counter()
+        for line in str(text).splitlines() or [""]:
+            if self.pending and self.pending[-1][0] == line:
+                self.pending[-1][1] += 1
+                continue
+            if len(self.pending) == self.pending.maxlen:
+                self.skipped += self.pending[0][1]
+            self.pending.append([line, 1])
+
+    def interrupt(self):
+        """Something else wrote to the terminal: the last line is no longer directly above the input line"""
+        self.last_line = None
+
+    def time_to_flush(self, now: float = None) -> float:
+        """Seconds until the next flush is allowed; None if there's nothing to write"""
+        if not self.pending:
+            return None
+        return max(0.0, self.last_flush + self.min_interval - (perf_counter() if now is None else now))
+
+    def flush(self, now: float = None, force: bool = False) -> bool:
+        """Write pending output if the rate limit allows. Returns whether anything was written."""
+        if now is None:
+            now = perf_counter()
+        if not self.pending or not force and now - self.last_flush < self.min_interval:
+            return False
+        with profiling.stage("render"):
+            self._write(now)
+        return True
+
+    def _write(self, now: float):
+        period = max(now - self._first_pending, self.min_interval)
+        self.last_flush = now
+        parts = []
+        if self.interactive:
+            parts.append("\r\033[2K")  # the input line is redrawn after the output
+
+        entries = list(self.pending)
+        self.pending.clear()
+        overloaded = self.skipped > 0 or len(entries) > self.max_lines
+        if overloaded:
+            cut = max(0, len(entries) - self.summary_tail)
+            skipped = self.skipped + sum(count for _, count in entries[:cut])
+            self.total_skipped += skipped
+            entries = entries[cut:]
+            parts.append(f"… {skipped} lines skipped ({skipped / period:.0f} lines/s)\n")
+            self.last_line = None
+        elif self.summary:
+            parts.append(f"… back to full output ({self.total_skipped} lines skipped in total)\n")
+        self.summary = overloaded
+        self.skipped = 0
+
+        for i, (line, count) in enumerate(entries):
+            if i == 0 and line == self.last_line and self.interactive:
+                # same line as the last one written: update its count in place
+                count += self.last_count
+                parts.append("\033[1A\r\033[2K")
+            parts.append(f"{line}  ×{count}\n" if count > 1 else f"{line}\n")
+        if entries:  # none when everything was skipped; the summary is then the last line written
+            self.last_line, self.last_count = line, count
+        if self.interactive:
+            parts.append(self.editor.render())
+        self.out.write("".join(parts))
+        self.out.flush()
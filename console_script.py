@@ -0,0 +1,185 @@
+"""Scripted / piped command mode for the msgpack console.
+
+One command per line; blank lines and # comments are ignored:
+
+    hello pico                  text line, sent as a string packet (like typing it in the console)
+    packet rt=512 ljy=-200      ControlPacket with the given fields (a, b, rt, ljx, ljy, s)
+    raw 0a7e337e93c3c3          raw bytes, hex
+    wait 500ms                  delay the following commands
+    at t=2.5 packet a=1         send at 2.5 s after the start, independent of the rest
+    every 20ms packet rt=100    repeat every 20 ms (from the current point in the script)...
+    every 20ms for 5s ...       ...for 5 s
+    every 1ms x1000 raw 00      ...or 1000 times
+
+Untimed commands go out back to back, as fast as the port accepts them. Times take s, ms or us (default: s for
+at/wait/for, ms for every).
+"""
+
+import heapq
+import itertools
+import shlex
+from dataclasses import dataclass, field
+from time import perf_counter, sleep
+from typing import Callable
+
+from msgpack import Packer
+
+from pico_interface import ControlPacket, WrapMsgPack
+
+UNITS = {"s": 1.0, "ms": 1e-3, "us": 1e-6}
+
+
+def parse_time(text: str, default_unit: str = "s") -> float:
+    for unit in ("ms", "us", "s"):
+        if text.endswith(unit):
+            return float(text[: -len(unit)]) * UNITS[unit]
+    return float(text) * UNITS[default_unit]
+
+
+@dataclass
+class ScriptCommand:
+    data: bytes  # framed bytes to send
+    text: str  # the command, for reports
+    at: float = 0.0  # first send, s after start
+    period: float = None  # repeat period, s
+    until: float = None  # stop repeating after this time (s after start)
+    count: int = None  # or after this many sends
+    line: int = 0
+    # run state
+    sent: int = 0
+    dropped: int = 0  # periods skipped because the link (or the host) couldn't keep up
+    first_sent: float = None
+    last_sent: float = None
+
+    @property
+    def rate(self) -> float:
+        if self.sent < 2 or self.last_sent == self.first_sent:
+            return 0.0
+        return (self.sent - 1) / (self.last_sent - self.first_sent)
+
+
+@dataclass
+class ScriptStats:
+    sent: int = 0
+    bytes: int = 0
+    dropped: int = 0
+    late_max: float = 0.0  # worst lateness of a send vs its schedule, s
+    elapsed: float = 0.0
+    commands: list[ScriptCommand] = field(default_factory=list)
+
+    def report(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        lines = [
+            f"sent {self.sent} packets, {self.bytes} bytes in {self.elapsed:.3f} s:"
+            f" {self.sent / elapsed:.1f} packets/s, {self.bytes / elapsed / 1e3:.2f} kB/s",
+            f"dropped {self.dropped}, max lateness {self.late_max * 1e3:.2f} ms",
+        ]
+        for cmd in self.commands:
+            if cmd.period is not None:
+                lines.append(
+                    f"  line {cmd.line}: {cmd.rate:.1f}/s of {1 / cmd.period:.1f}/s target,"
+                    f" sent {cmd.sent}, dropped {cmd.dropped}  ({cmd.text})"
+                )
+        return "\n".join(lines)
+
+
+def _build(words: list[str], packer: Packer, base_packet: ControlPacket) -> bytes:
+    if words[0] == "raw":
+        return bytes.fromhex("".join(words[1:]))
+    if words[0] == "packet":
+        packet = ControlPacket()
+        for word in words[1:]:
+            key, _, value = word.partition("=")
+            if key not in ("a", "b", "rt", "ljx", "ljy", "s"):
+                raise ValueError(f"unknown packet field {key!r}")
+            setattr(packet, key, value if key == "s" else bool(int(value)) if key in "ab" else int(value))
+        return WrapMsgPack(packer, packet.to_iter())
+    text = " ".join(words[1:] if words[0] == "text" else words)
+    packet = ControlPacket() if base_packet is None else ControlPacket(*base_packet.to_iter())
+    packet.s = text
+    return WrapMsgPack(packer, packet.to_iter())
+
+
+def parse_script(lines, base_packet: ControlPacket = None) -> list[ScriptCommand]:
+    """Parse script lines into commands with absolute start times. Raises ValueError naming the bad line."""
+    packer = Packer()
+    commands = []
+    t = 0.0  # current point of the sequential part of the script
+    for lineno, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            words = shlex.split(line)
+            if words[0] == "wait":
+                t += parse_time(words[1])
+                continue
+            cmd = ScriptCommand(b"", line, at=t, line=lineno)
+            if words[0] == "at":
+                if not words[1].startswith("t="):
+                    raise ValueError("expected at t=<time>")
+                cmd.at = parse_time(words[1][2:])
+                words = words[2:]
+            elif words[0] == "every":
+                cmd.period = parse_time(words[1], "ms")
+                words = words[2:]
+                if words[0] == "for":
+                    cmd.until = t + parse_time(words[1])
+                    words = words[2:]
+                elif words[0].startswith("x") and words[0][1:].isdigit():
+                    cmd.count = int(words[0][1:])
+                    words = words[1:]
+                if cmd.period <= 0:
+                    raise ValueError("period must be > 0")
+            cmd.data = _build(words, packer, base_packet)
+        except (IndexError, ValueError) as e:
+            raise ValueError(f"line {lineno}: {e or 'incomplete command'}: {line}") from None
+        commands.append(cmd)
+    return commands
+
+
+def run_script(
+    commands: list[ScriptCommand],
+    write: Callable[[bytes], object],
+    idle: Callable[[float], object] = None,
+    stop: Callable[[], bool] = None,
+) -> ScriptStats:
+    """Send the commands on schedule. write() may block (that's the link's backpressure).
+    idle(timeout) is called while waiting for the next send, e.g. to show RX; it must return within timeout."""
+    stats = ScriptStats(commands=commands)
+    seq = itertools.count()
+    queue = [(cmd.at, next(seq), cmd) for cmd in commands]  # commands at the same time keep script order
+    heapq.heapify(queue)
+    start = perf_counter()
+    while queue and not (stop is not None and stop()):
+        due, _, cmd = queue[0]
+        now = perf_counter() - start
+        if now < due:
+            if idle is not None:
+                idle(due - now)
+            else:
+                sleep(due - now)
+            continue
+        heapq.heappop(queue)
+        write(cmd.data)
+        sent = perf_counter() - start
+        stats.sent += 1
+        stats.bytes += len(cmd.data)
+        stats.late_max = max(stats.late_max, now - due)
+        cmd.sent += 1
+        if cmd.first_sent is None:
+            cmd.first_sent = sent
+        cmd.last_sent = sent
+
+        if cmd.period is None or cmd.count is not None and cmd.sent >= cmd.count:
+            continue
+        nxt = due + cmd.period
+        if sent > nxt + cmd.period:  # fell behind by whole periods: drop them rather than bursting
+            missed = int((sent - nxt) / cmd.period)
+            cmd.dropped += missed
+            stats.dropped += missed
+            nxt += missed * cmd.period
+        if cmd.until is None or nxt < cmd.until:
+            heapq.heappush(queue, (nxt, next(seq), cmd))
+    stats.elapsed = perf_counter() - start
+    return stats
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Headless control pipeline: input backend -> control packet -> kinematics -> TX.
+
+Runs on asyncio without Qt, so the rover can drive from the Pi alone. The GUIs reuse the same pipeline by
+calling step()/send() from their own timers and registering as observers.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field, replace
+from time import perf_counter
+from typing import Callable
+
+from msgpack import Packer
+
+import metrics
+import profiling
+import session_log
+from flight_recorder import RECORDER
+from gamepad import GamepadState
+from input_backend import InputBackend
+from link_monitor import LinkMonitor
+from loop_timing import TickStats
+from pico_interface import ControlPacket, MotionVector, WrapMsgPack, calc_motion_vec, calc_steer_center
+
+
+@dataclass
+class ControlFrame:
+    """Output of one control tick"""
+
+    packet: ControlPacket = field(default_factory=ControlPacket)
+    mvec: MotionVector = field(default_factory=MotionVector)
+    steer_center: tuple[float, float] = (0, 0)
+    t: float = 0.0  # perf_counter() at the tick
+
+
+class ControlRuntime:
+    def __init__(
+        self,
+        backend: InputBackend = None,
+        state: GamepadState = None,
+        tx: Callable[[bytes], object] = None,
+        period: float = 0.01,
+        packet_interval: float = 0.025,
+        keepalive: float = 5.0,
+        session=None,
+        link: LinkMonitor = None,
+    ):
+        """Either `backend` (polled every tick) or a `state` updated elsewhere provides the input.
+        `tx` is called with each framed control packet, e.g. PicoSerial.write.
+        If a session_log.SessionLog is given, input changes, new packets & motion vectors are logged to it.
+        A LinkMonitor gets ticked on every send(); while it reports the link lost, throttle is held at zero."""
+        self.backend = backend
+        self.state = backend.state if backend is not None else (state or GamepadState())
+        self.tx = tx
+        self.period = period  # control tick
+        self.packet_interval = packet_interval  # packets are sent at most this often...
+        self.keepalive = keepalive  # ...and resent after this long even if unchanged
+        self.packer = Packer()
+        self.frame = ControlFrame()
+        self.last_packet: ControlPacket = None
+        self.last_packet_time = 0.0
+        self.packets_sent = 0
+        self.observers: list[Callable[[ControlFrame], object]] = []
+        self.stats = TickStats(period)
+        self.running = False
+        self.session = session
+        self.link = link
+        self._last_input = None
+
+    def add_observer(self, observer: Callable[[ControlFrame], object]):
+        """Call observer(frame) after every control tick"""
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    def step(self, now: float = None) -> ControlFrame:
+        """Run one control tick: read input, build the packet and compute the motion vector"""
+        t0 = perf_counter()
+        if now is None:
+            now = t0
+        if self.backend is not None:
+            events = self.backend.poll()
+            if events:
+                now_ns = time.monotonic_ns()
+                for event in events:
+                    metrics.INPUT_LATENCY_SECONDS.observe((now_ns - event.t_ns) * 1e-9)
+            self.state = self.backend.state  # may change, e.g. on a multi-controller takeover
+        with profiling.stage("packet"):
+            packet = self.state.make_control_packet()
+        with profiling.stage("kinematics"):
+            d, h = calc_steer_center(packet.ljx, packet.ljy)
+            mvec = calc_motion_vec(packet, d, h)
+        changed = packet != self.frame.packet
+        self.frame = ControlFrame(packet, mvec, (d, h), now)
+        snapshot = self.state.snapshot()
+        if snapshot != self._last_input:
+            self._last_input = snapshot
+            RECORDER.input(snapshot)
+            if self.session is not None:
+                self.session.log(session_log.INPUT, snapshot)
+        if changed:
+            RECORDER.packet(packet)
+            RECORDER.motion(mvec)
+            if self.session is not None:
+                self.session.packet(packet)
+                self.session.motion(mvec)
+        metrics.CONTROL_TICKS.inc()
+        for observer in self.observers:
+            observer(self.frame)
+        metrics.CONTROL_TICK_SECONDS.observe(perf_counter() - t0)
+        return self.frame
+
+    def send(self, now: float = None, force: bool = False) -> bool:
+        """Transmit the current packet if it changed (or the keepalive expired). Returns whether it was sent."""
+        if self.tx is None:
+            return False
+        if now is None:
+            now = perf_counter()
+        packet = self.frame.packet
+        if self.link is not None:
+            was_failsafe = self.link.failsafe
+            self.link.tick(now)
+            if self.link.failsafe:
+                packet = replace(packet, rt=0)
+                force = force or not was_failsafe  # stop the rover now, not at the next change
+        if packet == self.last_packet and not force:
+            if now - self.last_packet_time < self.keepalive:
+                return False
+            metrics.CONTROL_KEEPALIVES.inc()
+        self.tx(WrapMsgPack(self.packer, packet.to_iter()))
+        self.last_packet = packet
+        self.last_packet_time = now
+        self.packets_sent += 1
+        metrics.CONTROL_PACKETS.inc()
+        return True
+
+    async def run(self):
+        """Run the pipeline at a fixed rate until stop(). Ticks are scheduled against absolute deadlines."""
+        loop = asyncio.get_running_loop()
+        if self.backend is not None and not self.backend.running:
+            self.backend.start()
+        self.running = True
+        next_tick = next_send = loop.time()
+        try:
+            while self.running:
+                metrics.LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - next_tick))
+                self.stats.tick()
+                self.step()
+                now = loop.time()
+                if now >= next_send:
+                    self.send()
+                    next_send += self.packet_interval
+                    if next_send < now:
+                        next_send = now + self.packet_interval
+                next_tick += self.period
+                if next_tick < now:  # overran whole periods: skip them rather than bursting
+                    missed = int((now - next_tick) / self.period) + 1
+                    self.stats.drop(missed)
+                    metrics.CONTROL_TICKS_DROPPED.inc(missed)
+                    next_tick += missed * self.period
+                await asyncio.sleep(next_tick - loop.time())
+        finally:
+            self.running = False
+
+    def stop(self):
+        self.running = False
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import flight_recorder
+    from input_backend import ReplayBackend, select_backend
+
+    parser = argparse.ArgumentParser(description="Run the control pipeline without a GUI")
+    parser.add_argument("--backend", help="input backend (default: best available)")
+    parser.add_argument("--replay", help="drive from an input recording instead of a controller")
+    parser.add_argument("--port", help="Pico serial port ('auto' to search); packets are only printed if omitted")
+    parser.add_argument("--rate", type=float, default=100, help="control tick rate, Hz")
+    parser.add_argument("--log", metavar="DIR", help="write a session log to DIR")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this localhost port")
+    parser.add_argument("--metrics-file", help="rewrite this file with the metrics every 10 s (.prom or .json)")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+    flight_recorder.install()
+
+    if args.metrics_port:
+        metrics.serve_http(args.metrics_port)
+    dump = metrics.FileDump(args.metrics_file) if args.metrics_file else None
+
+    async def main():
+        backend = ReplayBackend(args.replay) if args.replay else select_backend(args.backend)
+        tx = None
+        session = session_log.SessionLog(args.log, prefix="rover") if args.log else None
+        if args.port:
+            from pico_interface import PicoSerial
+
+            pico = PicoSerial(None, None if args.port == "auto" else args.port)
+            pico.session = session
+            tx = pico.write
+        runtime = ControlRuntime(backend, tx=tx, period=1 / args.rate, session=session)
+        runtime.add_observer(lambda frame: print(frame.packet, " " * 8, end="\r"))
+        task = asyncio.create_task(runtime.run())
+        while runtime.running or not task.done():
+            if not backend.running or backend.state.button_b:
+                runtime.stop()
+            await asyncio.sleep(0.1)
+        await task
+        backend.stop()
+        if session is not None:
+            session.close()
+        print(f"\n{runtime.stats.summary()}, {runtime.packets_sent} packets sent")
+
+    try:
+        asyncio.run(main())
+    finally:
+        if dump is not None:
+            dump.stop()
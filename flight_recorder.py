@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Always-on flight recorder: the last few thousand input snapshots, control packets, motion vectors and RX
+chunks, kept in a preallocated ring of fixed-size binary slots.
+
+Recording is one struct.pack_into per event (well under a microsecond), so it stays on in normal runs. The ring
+is dumped to disk on an unhandled exception, on link loss, on SIGUSR2, or whenever dump() is called. Dumps use the
+session log file format, so they're read with session_log.py / SessionReader:
+
+    python session_log.py ~/.local/state/rover/flight/flight-20240501-142301-link_lost.rlog
+
+Dumps go to $XDG_STATE_HOME/rover/flight (~/.local/state/rover/flight), not the working directory, so they never
+land in a source tree. Routine exits (KeyboardInterrupt, BrokenPipeError from a closed pipe) aren't dumped.
+"""
+
+import itertools
+import os
+import signal
+import struct
+import sys
+import threading
+import time
+
+import msgpack
+
+import session_log
+
+SLOT = struct.Struct("<qBB")  # t_ns, kind, payload length; the payload follows in the rest of the slot
+SLOT_SIZE = 48
+PAYLOAD_MAX = SLOT_SIZE - SLOT.size
+
+# slot kinds, reusing the session log record types
+INPUT = session_log.INPUT
+PACKET = session_log.PACKET
+MOTION = session_log.MOTION
+RX = session_log.RX
+EVENT = session_log.EVENT
+
+INPUT_FMT = struct.Struct("<6f6?")  # GamepadState.snapshot()
+PACKET_FMT = struct.Struct("<??iii22s")  # ControlPacket.to_iter(), s truncated
+MOTION_FMT = struct.Struct("<8f")  # MotionVector.to_iter()
+# header + payload in one struct, so recording an event is a single pack_into
+_INPUT_SLOT = struct.Struct(SLOT.format + INPUT_FMT.format[1:])
+_PACKET_SLOT = struct.Struct(SLOT.format + PACKET_FMT.format[1:])
+_MOTION_SLOT = struct.Struct(SLOT.format + MOTION_FMT.format[1:])
+
+DEFAULT_DIRECTORY = os.path.join(
+    os.environ.get("XDG_STATE_HOME") or os.path.expanduser(os.path.join("~", ".local", "state")), "rover", "flight"
+)
+ROUTINE_EXCEPTIONS = (KeyboardInterrupt, BrokenPipeError)  # not worth a dump
+
+
+class FlightRecorder:
+    def __init__(self, capacity: int = 16384, directory: str = DEFAULT_DIRECTORY, min_dump_interval: float = 1.0):
+        """capacity: slots in the ring (48 bytes each). Dumps go to `directory`, at most one per
+        min_dump_interval seconds so a flapping link doesn't flood the disk."""
+        self.capacity = capacity
+        self.directory = directory
+        self.min_dump_interval = min_dump_interval
+        self.buf = bytearray(capacity * SLOT_SIZE)
+        self._seq = itertools.count()  # next() is atomic, so writers on different threads never share a slot
+        self._count = 0  # slots written, as of the last write (for dumps)
+        self._last_dump = 0.0
+        self._dump_lock = threading.Lock()
+
+    # recording: any thread
+    def input(self, snapshot: tuple):
+        i = next(self._seq)
+        _INPUT_SLOT.pack_into(
+            self.buf, (i % self.capacity) * SLOT_SIZE, time.monotonic_ns(), INPUT, INPUT_FMT.size, *snapshot
+        )
+        self._count = i + 1
+
+    def packet(self, p):
+        i = next(self._seq)
+        _PACKET_SLOT.pack_into(
+            self.buf,
+            (i % self.capacity) * SLOT_SIZE,
+            time.monotonic_ns(),
+            PACKET,
+            PACKET_FMT.size,
+            p.a,
+            p.b,
+            int(p.rt),  # a float here would make pack_into raise
+            int(p.ljx),
+            int(p.ljy),
+            p.s.encode() if p.s else b"",
+        )
+        self._count = i + 1
+
+    def motion(self, m):
+        i = next(self._seq)
+        _MOTION_SLOT.pack_into(
+            self.buf,
+            (i % self.capacity) * SLOT_SIZE,
+            time.monotonic_ns(),
+            MOTION,
+            MOTION_FMT.size,
+            m.vFL,
+            m.vFR,
+            m.vBL,
+            m.vBR,
+            m.aFL,
+            m.aFR,
+            m.aBL,
+            m.aBR,
+        )
+        self._count = i + 1
+
+    def rx(self, data: bytes):
+        """Raw received bytes; long reads take several slots"""
+        self._raw(RX, data)
+
+    def event(self, text: str):
+        """A marker, e.g. why a dump was taken (truncated to one slot)"""
+        self._raw(EVENT, text.encode()[:PAYLOAD_MAX])
+
+    def _raw(self, kind: int, data: bytes):
+        t_ns = time.monotonic_ns()
+        if len(data) <= PAYLOAD_MAX:
+            i = next(self._seq)
+            off = (i % self.capacity) * SLOT_SIZE
+            SLOT.pack_into(self.buf, off, t_ns, kind, len(data))
+            self.buf[off + SLOT.size : off + SLOT.size + len(data)] = data
+            self._count = i + 1
+            return
+        for start in range(0, len(data), PAYLOAD_MAX):
+            chunk = data[start : start + PAYLOAD_MAX]
+            i = next(self._seq)
+            off = (i % self.capacity) * SLOT_SIZE
+            SLOT.pack_into(self.buf, off, t_ns, kind, len(chunk))
+            self.buf[off + SLOT.size : off + SLOT.size + len(chunk)] = chunk
+            self._count = i + 1
+
+    # reading
+    def records(self):
+        """Yield (session log type, t_ns, payload) for the slots in the ring, oldest first. RX chunks of one read
+        are joined back together."""
+        buf = bytes(self.buf)  # copy first: writers keep going
+        count = self._count
+        first = max(0, count - self.capacity)
+        pending = None  # RX record being joined
+        for i in range(first, count):
+            off = (i % self.capacity) * SLOT_SIZE
+            t_ns, kind, length = SLOT.unpack_from(buf, off)
+            payload = buf[off + SLOT.size : off + SLOT.size + length]
+            if kind == RX:
+                if pending is not None and pending[1] == t_ns:
+                    pending[2] += payload
+                    continue
+                if pending is not None:
+                    yield tuple(pending)
+                pending = [RX, t_ns, payload]
+                continue
+            if pending is not None:
+                yield tuple(pending)
+                pending = None
+            if kind == INPUT:
+                yield kind, t_ns, INPUT_FMT.unpack(payload)
+            elif kind == PACKET:
+                *fields, s = PACKET_FMT.unpack(payload)
+                yield kind, t_ns, (*fields, s.rstrip(b"\0").decode("utf-8", "replace"))
+            elif kind == MOTION:
+                yield kind, t_ns, MOTION_FMT.unpack(payload)
+            elif kind == EVENT:
+                yield kind, t_ns, (payload.decode("utf-8", "replace"), None)
+        if pending is not None:
+            yield tuple(pending)
+
+    def dump(self, reason: str = "manual", force: bool = False) -> str:
+        """Write the ring to a session log file; returns its path, or None if rate-limited or empty"""
+        with self._dump_lock:
+            now = time.monotonic()
+            if not force and now - self._last_dump < self.min_dump_interval or not self._count:
+                return None
+            self._last_dump = now
+            self.event(f"dump: {reason}")
+            os.makedirs(self.directory, exist_ok=True)
+            tag = "".join(c if c.isalnum() or c in "-_" else "_" for c in reason)
+            path = os.path.join(self.directory, f"flight-{time.strftime('%Y%m%d-%H%M%S')}-{tag}.rlog")
+            header = session_log.FILE_HEADER.pack(
+                session_log.MAGIC, session_log.VERSION, time.time_ns(), time.monotonic_ns()
+            )
+            packer = msgpack.Packer()
+            with open(path, "wb") as f:
+                f.write(header)
+                for rtype, t_ns, obj in self.records():
+                    payload = packer.pack(obj)
+                    f.write(session_log.RECORD_HEADER.pack(len(payload), rtype, t_ns))
+                    f.write(payload)
+        print(f"Flight recorder: {reason}, dumped to {path}", file=sys.stderr)
+        return path
+
+
+RECORDER = FlightRecorder()
+
+
+def dump(reason: str = "manual", force: bool = False) -> str:
+    return RECORDER.dump(reason, force)
+
+
+def install(directory: str = None):
+    """Dump the default recorder on unhandled exceptions (any thread, except ROUTINE_EXCEPTIONS) and on SIGUSR2"""
+    if directory is not None:
+        RECORDER.directory = directory
+
+    prev_excepthook = sys.excepthook
+    prev_thread_hook = threading.excepthook
+
+    def excepthook(*exc_info):
+        if not issubclass(exc_info[0], ROUTINE_EXCEPTIONS):
+            RECORDER.dump(f"exception_{exc_info[0].__name__}", force=True)
+        prev_excepthook(*exc_info)
+
+    def thread_excepthook(args):
+        if not issubclass(args.exc_type, ROUTINE_EXCEPTIONS):
+            RECORDER.dump(f"exception_{args.exc_type.__name__}", force=True)
+        prev_thread_hook(args)
+
+    sys.excepthook = excepthook
+    threading.excepthook = thread_excepthook
+    if hasattr(signal, "SIGUSR2"):  # not on Windows
+        signal.signal(signal.SIGUSR2, lambda *_: RECORDER.dump("SIGUSR2", force=True))
+
+
+if __name__ == "__main__":
+    # measure the recording cost
+    from timeit import repeat
+
+    from pico_interface import ControlPacket, MotionVector
+
+    recorder = FlightRecorder()
+    snapshot = (0.5, -0.25, 0.0, 0.0, 0.0, 0.75, True, False, False, False, False, True)
+    packet = ControlPacket(True, False, 512, 1000, -2000)
+    mvec = MotionVector(1, 2, 3, 4, 5, 6, 7, 8)
+    n = 200_000
+    for name, fn in (
+        ("input", lambda: recorder.input(snapshot)),
+        ("packet", lambda: recorder.packet(packet)),
+        ("motion", lambda: recorder.motion(mvec)),
+        ("rx 32 B", lambda: recorder.rx(b"x" * 32)),
+    ):
+        print(f"{name:8} {min(repeat(fn, number=n, repeat=5)) / n * 1e9:6.0f} ns/event")
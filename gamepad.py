@@ -1,16 +1,17 @@
 #!/usr/bin/python3
 
 import asyncio
-from pyjoystick import Key, Joystick
 
 import sys
+from operator import attrgetter
+from typing import TYPE_CHECKING, NamedTuple
 
-# if evdev Gamepad is used: (Linux only)
-if sys.platform == "linux":
-    from evdev import InputDevice, ecodes, ff, list_devices
-    # from evdev import InputDevice, categorize, ecodes
+if TYPE_CHECKING:  # pyjoystick is only needed by the SDL backend, which imports it itself
+    from pyjoystick import Key
 
-from pico_interface import ControlPacket
+from pico_interface import RCONST, ControlPacket
+import profiling
+import rumble
 
 
 TRIGGER_MAX = 1023  # LATER: configure this
@@ -18,6 +19,25 @@ JOY_MAX = 0x7FFF #0xFFFF / 2
 # JOY_MID = 0xFFFF / 2
 JOY_DEADZONE = 0
 
+# InputEvent sources
+SRC_EVDEV = 0  # raw evdev type/code/value
+SRC_SDL = 1  # pyjoystick axis/button number & normalized value
+
+# event types (same values as evdev's ecodes.EV_KEY / EV_ABS)
+EV_KEY = 1
+EV_ABS = 3
+
+
+class InputEvent(NamedTuple):
+    """A single timestamped controller event, independent of the library it came from"""
+
+    t_ns: int  # time.monotonic_ns() when the event was read
+    source: int  # SRC_*
+    evtype: int  # EV_KEY or EV_ABS
+    code: int  # evdev code, or SDL axis/button number
+    value: float
+
+
 #The gamepad values are expected to be a -1 to 1 or 0 to 1 float. They should be mapped to integers before transmitting.
 class GamepadState:
     def __init__(self, file=None):
@@ -38,6 +58,17 @@ class GamepadState:
         self.bump_left = False
         self.bump_right = False
 
+    SNAPSHOT_FIELDS = (
+        "joystick_left_x", "joystick_left_y", "joystick_right_x", "joystick_right_y", "trigger_left",
+        "trigger_right", "button_a", "button_b", "button_x", "button_y", "bump_left", "bump_right",
+    )
+
+    _snapshot = attrgetter(*SNAPSHOT_FIELDS)  # a C-level getter: cheap enough to call every control tick
+
+    def snapshot(self) -> tuple:
+        """Current axes & buttons, in SNAPSHOT_FIELDS order"""
+        return GamepadState._snapshot(self)
+
     def connect(self):
         pass
 
@@ -48,72 +79,194 @@ class GamepadState:
     def __bool__(self):
         return self.is_connected()
 
-    def handle_key_event(self, key: Key):
+    def handle_key_event(self, key: "Key"):
         # print("KEY")
-        if key.keytype == Key.AXIS:
-            match key.number:
-                case 0:
-                    self.joystick_left_x = key.value
-                case 1:
-                    self.joystick_left_y = key.value
-                case 2:
-                    self.trigger_left = key.value
-                case 5:
-                    self.trigger_right = key.value
-            # print(self.joystick_left_x, self.joystick_left_y, self.trigger_left, self.trigger_right)
-        elif key.keytype == Key.BUTTON:
-            # return
-            match key.number:
+        with profiling.stage("input"):
+            if key.keytype == key.AXIS:
+                self.handle_axis(key.number, key.value)
+            elif key.keytype == key.BUTTON:
+                self.handle_button(key.number, key.value)
+
+    def handle_axis(self, number: int, value: float):
+        """Update the state from a pyjoystick (SDL) axis event"""
+        match number:
+            case 0:
+                self.joystick_left_x = value
+            case 1:
+                self.joystick_left_y = value
+            case 2:
+                self.trigger_left = value
+            case 5:
+                self.trigger_right = value
+        # print(self.joystick_left_x, self.joystick_left_y, self.trigger_left, self.trigger_right)
+
+    def handle_button(self, number: int, value):
+        """Update the state from a pyjoystick (SDL) button event"""
+        match number:
+            case 0:
+                self.button_a = value
+            case 1:
+                self.button_b = value
+            case 2:
+                self.button_x = value
+            case 3:
+                self.button_y = value
+            case 4:
+                self.bump_left = value
+            case 5:
+                self.bump_right = value
+
+    def handle_evdev_event(self, evtype: int, code: int, value: int):
+        """Update the state from a raw evdev event (type, code, value)"""
+        if evtype == EV_KEY:  # type is button
+            match code:
+                case 304:  # button "A"
+                    self.button_a = bool(value)
+                case 307:  # button "X"
+                    self.button_x = bool(value)
+                case 308:  # button "Y"
+                    self.button_y = bool(value)
+                case 305:  # button "B"
+                    self.button_b = bool(value)
+                case 311:  # bumper "right"
+                    self.bump_right = bool(value)
+                case 310:  # bumper "left"
+                    self.bump_left = bool(value)
+                case 172:  # home key
+                    pass
+                case 317:  # left stick pressed
+                    pass
+                case 318:  # right stick pressed
+                    pass
+
+        elif evtype == EV_ABS:  # type is analog trigger or joystick
+            match code:
+                # left joystick x-axis
                 case 0:
-                    self.button_a = key.value
+                    # print(f"Case 0: {value}")
+                    self.joystick_left_x = value / JOY_MAX
+                # left joystick y-axis - inverted so -y is down
                 case 1:
-                    self.button_b = key.value
+                    # print(f"Case 1: {value}")
+                    self.joystick_left_y = value / JOY_MAX
+                # elif code == 2:  # left trigger
                 case 2:
-                    self.button_x = key.value
+                    self.trigger_left = value / TRIGGER_MAX
                 case 3:
-                    self.button_y = key.value
+                    self.joystick_right_x = value / JOY_MAX
+                # right joystick y-axis
                 case 4:
-                    self.bump_left = key.value
+                    self.joystick_right_y = value / JOY_MAX
+                # right joystick x-axis
+                # elif code == 5:  # right trigger
                 case 5:
-                    self.bump_right = key.value
+                    self.trigger_right = value / TRIGGER_MAX
+                # elif code == 16:  # right trigger
+                case 16:
+                    if value == -1:
+                        self.dpad_left = True
+                        self.dpad_right = False
+                    elif value == 1:
+                        self.dpad_left = False
+                        self.dpad_right = True
+                    else:
+                        self.dpad_left = False
+                        self.dpad_right = False
+                # elif code == 17:  # left trigger
+                case 17:
+                    if value == -1:
+                        self.dpad_up = True
+                        self.dpad_down = False
+                    elif value == 1:
+                        self.dpad_up = False
+                        self.dpad_down = True
+                    else:
+                        self.dpad_up = False
+                        self.dpad_down = False
+                case _:
+                    ...
+                    # print(code, value)
+
+    def apply_event(self, event: InputEvent):
+        """Update the state from a source-tagged InputEvent (e.g. one replayed from a recording)"""
+        with profiling.stage("input"):
+            if event.source == SRC_EVDEV:
+                self.handle_evdev_event(event.evtype, event.code, event.value)
+            elif event.evtype == EV_ABS:
+                self.handle_axis(event.code, event.value)
+            elif event.evtype == EV_KEY:
+                self.handle_button(event.code, bool(event.value))
 
     def make_control_packet(self) -> ControlPacket:
+        """Map the normalized state to the integer ranges the Pico expects"""
         return ControlPacket(
-            self.button_a,
+            bool(self.button_a),
             # self.button_x,
             # self.button_y,
-            self.button_b,
+            bool(self.button_b),
             # self.bump_left,
             # self.bump_right,
             # self.trigger_left,
-            self.trigger_right,
-            self.joystick_left_x,  # * 32,767,
-            self.joystick_left_y,  # * 32,767,
+            int(self.trigger_right * RCONST.TRIGGER_MAX),
+            int(self.joystick_left_x * RCONST.JOY_MAX),
+            int(self.joystick_left_y * RCONST.JOY_MAX),
             # self.joystick_right_x,
             # self.joystick_right_y,
         )
 
 
-# Evdev gamepad (Linux only)
+# Evdev gamepad (Linux only). evdev is imported where it's used, so importing this module (for GamepadState)
+# doesn't load it
 if sys.platform == "linux": # and False:
 
+    def is_xbox_controller(device) -> bool:
+        name = str.lower(device.name)
+        return "x-box" in name or "xbox" in name
+
+    def find_controller():
+        """Return the first connected xbox controller's InputDevice, or None"""
+        from evdev import InputDevice, list_devices
+
+        for path in list_devices():
+            device = InputDevice(path)
+            if is_xbox_controller(device):
+                return device
+            device.close()
+        return None
+
+    def find_controllers() -> list:
+        """Return the InputDevices of all connected xbox controllers"""
+        from evdev import InputDevice, list_devices
+
+        controllers = []
+        for path in list_devices():
+            device = InputDevice(path)
+            if is_xbox_controller(device):
+                controllers.append(device)
+            else:
+                device.close()
+        return controllers
+
     class Gamepad(GamepadState):
         def __init__(self, file=None):
+            from evdev import InputDevice
+
             super().__init__()
             # self.event_value = 0
             self.listening = False
             self.device_file = InputDevice(file) if file else None
-            self.rumble_effect = 0
-            self.effect1_id = 0  # light rumble, played continuously
-            self.effect2_id = 0  # strong rumble, played once
-            self.load_effects()
+            self.rumbler = rumble.RumbleScheduler(self.device_file)
 
             self.connect()
+            self.load_effects()
 
         def connect(self):  # asyncronus read-out of events
+            from evdev import InputDevice, list_devices
+
             if self.device_file:
+                self.listening = True
                 print("Controller connected.")
-                return
+                return True
             devices = [InputDevice(path) for path in list_devices()]
             print("Connecting to xbox controller...")
             for device in devices:
@@ -121,7 +274,8 @@ if sys.platform == "linux": # and False:
                     # xbox_path = str(device.path)
                     self.device_file = device
                     self.listening = True
-                    self.rumble_effect = 2
+                    self.rumbler.set_device(device)
+                    self.rumbler.notify("connected")
                     print("Controller Connected.")
                     return True
                 else:
@@ -130,6 +284,8 @@ if sys.platform == "linux": # and False:
             return False
 
         def is_connected(self):  # asyncronus read-out of events
+            from evdev import InputDevice, list_devices
+
             path = None
             devices = [InputDevice(path) for path in list_devices()]
             for device in devices:
@@ -146,32 +302,10 @@ if sys.platform == "linux": # and False:
             return self.listening and self.is_connected()
 
         def load_effects(self):
+            """Upload the standard effects to the connected device, so the first rumble plays without delay"""
             if not self.listening:
                 return
-            # effect 1, light rumble
-            rumble = ff.Rumble(strong_magnitude=0x0000, weak_magnitude=0x500)
-            duration_ms = 300
-            effect = ff.Effect(
-                ecodes.FF_RUMBLE,
-                -1,
-                0,
-                ff.Trigger(0, 0),
-                ff.Replay(duration_ms, 0),
-                ff.EffectType(ff_rumble_effect=rumble),
-            )
-            self.effect1_id = self.device_file.upload_effect(effect)
-            # effect 2, strong rumble
-            rumble = ff.Rumble(strong_magnitude=0xC000, weak_magnitude=0x0000)
-            duration_ms = 200
-            effect = ff.Effect(
-                ecodes.FF_RUMBLE,
-                -1,
-                0,
-                ff.Trigger(0, 0),
-                ff.Replay(duration_ms, 0),
-                ff.EffectType(ff_rumble_effect=rumble),
-            )
-            self.effect2_id = self.device_file.upload_effect(effect)
+            self.rumbler.preload(rumble.LIGHT, rumble.STRONG)
 
         # TODO: handle deadzones, (?) calibration
         async def read_gamepad_input(self):  # asyncronus read-out of events
@@ -190,90 +324,19 @@ if sys.platform == "linux": # and False:
                     # print(f'{event.type:<8} {event.code:<8} {event.value:<8}')
                     # print(f'{event.type:<8b} {event.code:<8b} {event.value:<8b}\n')
 
-                    if event.type == 1:  # type is button
-                        match event.code:
-                            case 304:  # button "A"
-                                self.button_a = bool(event.value)
-                            case 307:  # button "X"
-                                self.button_x = bool(event.value)
-                            case 308:  # button "Y"
-                                self.button_y = bool(event.value)
-                            case 305:  # button "B"
-                                self.button_b = bool(event.value)
-                            case 311:  # bumper "right"
-                                self.bump_right = bool(event.value)
-                            case 310:  # bumper "left"
-                                self.bump_left = bool(event.value)
-                            case 172:  # home key
-                                pass
-                            case 317:  # left stick pressed
-                                pass
-                            case 318:  # right stick pressed
-                                pass
-
-                    elif event.type == 3:  # type is analog trigger or joystick
-                        match event.code:
-                            # left joystick x-axis
-                            case 0:
-                                # print(f"Case 0: {event.value}")
-                                self.joystick_left_x = event.value / JOY_MAX
-                            # left joystick y-axis - inverted so -y is down
-                            case 1:
-                                # print(f"Case 1: {event.value}")
-                                self.joystick_left_y = event.value / JOY_MAX
-                            # elif event.code == 2:  # left trigger
-                            case 2:
-                                self.trigger_left = event.value / TRIGGER_MAX
-                            case 3:
-                                self.joystick_right_x = event.value / JOY_MAX
-                            # right joystick y-axis
-                            case 4:
-                                self.joystick_right_y = event.value / JOY_MAX
-                            # right joystick x-axis
-                            # elif event.code == 5:  # right trigger
-                            case 5:
-                                self.trigger_right = event.value / TRIGGER_MAX
-                            # elif event.code == 16:  # right trigger
-                            case 16:
-                                if event.value == -1:
-                                    self.dpad_left = True
-                                    self.dpad_right = False
-                                elif event.value == 1:
-                                    self.dpad_left = False
-                                    self.dpad_right = True
-                                else:
-                                    self.dpad_left = False
-                                    self.dpad_right = False
-                            # elif event.code == 17:  # left trigger
-                            case 17:
-                                if event.value == -1:
-                                    self.dpad_up = True
-                                    self.dpad_down = False
-                                elif event.value == 1:
-                                    self.dpad_up = False
-                                    self.dpad_down = True
-                                else:
-                                    self.dpad_up = False
-                                    self.dpad_down = False
-                            case _:
-                                ...
-                                # print(event.code, event.value)
+                    with profiling.stage("input"):
+                        self.handle_evdev_event(event.type, event.code, event.value)
             except OSError as e:
                 self.device_file = None
                 raise e
 
         async def rumble(self):  # asyncronus control of force feed back effects
-            repeat_count = 1
-            while self.listening:
-                if self.rumble_effect == 1:
-                    self.device_file.write(ecodes.EV_FF, self.effect1_id, repeat_count)
-                elif self.rumble_effect == 2:
-                    self.device_file.write(ecodes.EV_FF, self.effect2_id, repeat_count)
-                    self.rumble_effect = 0  # turn of effect in order to play effect2 only once
-                await asyncio.sleep(0.2)
+            """Run the rumble scheduler; queue effects with self.rumbler.play() or .notify()"""
+            await self.rumbler.run()
 
         def erase_rumble(self):
-            self.device_file.erase_effect(self.effect1_id)
+            self.rumbler.stop()
+            self.rumbler.erase_all()
 
 
     async def controller_test(gamepad: Gamepad):
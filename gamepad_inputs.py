@@ -3,13 +3,14 @@ import math
 import threading
 import time
 
-from pico_interface import ControlPacket
+from pico_interface import RCONST, ControlPacket
 
 class XboxController(object):
     MAX_TRIG_VAL = math.pow(2, 8)
     MAX_JOY_VAL = math.pow(2, 15)
 
-    def __init__(self, delay_start=False):
+    def __init__(self, delay_start=False, event_cbk=None):
+        self.event_cbk = event_cbk  # called with each raw `inputs` event, from the monitor thread
 
         self.LeftJoystickY = 0
         self.LeftJoystickX = 0
@@ -51,8 +52,10 @@ class XboxController(object):
     def _monitor_controller(self):
         #TODO: handle disconnect
         while self.active:
-            events = get_gamepad()
+            events = get_gamepad()  # blocks until the next batch of events
             for event in events:
+                if self.event_cbk is not None:
+                    self.event_cbk(event)
                 match event.code:
                     case 'ABS_Y':
                         self.LeftJoystickY = event.state / XboxController.MAX_JOY_VAL # normalize between -1 and 1
@@ -94,25 +97,19 @@ class XboxController(object):
                         self.UpDPad = event.state
                     case 'BTN_TRIGGER_HAPPY4':
                         self.DownDPad = event.state
+                    case 'SYN_REPORT':  # end of an event batch
+                        pass
                     case _:
                         print(f"Unknown code {event.code}: {event.state}")
-            time.sleep(0.005)
 
     def make_control_packet(self) -> ControlPacket:
         return ControlPacket(
-            self.button_a,
-            # self.button_x,
-            # self.button_y,
-            self.button_b,
-            # self.bump_left,
-            # self.bump_right,
-            # self.trigger_left,
-            self.trigger_right,
-            self.joystick_left_x,  # * 32,767,
-            self.joystick_left_y,  # * 32,767,
-            # self.joystick_right_x,
-            # self.joystick_right_y,
-        )       
+            bool(self.A),
+            bool(self.B),
+            int(self.RightTrigger * RCONST.TRIGGER_MAX),
+            int(self.LeftJoystickX * RCONST.JOY_MAX),
+            int(self.LeftJoystickY * RCONST.JOY_MAX),
+        )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,259 @@
+"""Serial console widget for the GUIs. The port and the message deframer live on a worker QThread;
+decoded messages reach the GUI thread in batches, at most every `batch_interval_ms`."""
+
+import math
+import socket
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+from PySide6 import QtCore, QtWidgets
+from PySide6.QtNetwork import QHostAddress, QUdpSocket
+from PySide6.QtSerialPort import QSerialPort
+
+import flight_recorder
+import metrics
+import profiling
+from flight_recorder import RECORDER
+from pico_interface import MsgDeframer, PicoSerial
+from tx_scheduler import COMMAND, TxScheduler
+
+if TYPE_CHECKING:  # imported where it's used: only the --rover mode needs it
+    from udp_transport import BaseStation
+
+
+class SerialWorker(QtCore.QObject):
+    """Owns the QSerialPort and deframer. Lives on its own thread; talk to it through signals only."""
+
+    messagesReceived = QtCore.Signal(list)
+    opened = QtCore.Signal(bool)
+    errorOccurred = QtCore.Signal(str)
+
+    _open = QtCore.Signal()
+    _close = QtCore.Signal()
+    _write = QtCore.Signal(bytes, int)
+
+    def __init__(self, portname: str, baudrate: int = 115200, batch_interval_ms: int = 50, session=None):
+        super().__init__()
+        self.session = session  # session_log.SessionLog, if traffic should be logged
+        self.message_filter = None  # called with each message on this thread; True = consumed, not shown
+        self.portname = portname
+        self.baudrate = baudrate
+        self.batch_interval_ms = batch_interval_ms
+        self.is_open = False  # mirrored for the GUI thread
+        self.serial: QSerialPort = None
+        self.deframer = MsgDeframer()
+        self._batch = []
+        self._flush_timer: QtCore.QTimer = None
+        self.scheduler = TxScheduler(self._transmit, baudrate)  # control frames go ahead of queued text
+        self._pump_timer: QtCore.QTimer = None
+        metrics.REGISTRY.gauge("serial_rx_pending", "decoded messages waiting for the next GUI batch", lambda: len(self._batch))
+
+        self._open.connect(self._on_open)
+        self._close.connect(self._on_close)
+        self._write.connect(self._on_write)
+
+    # GUI-thread API
+    def open(self):
+        self._open.emit()
+
+    def close(self):
+        self._close.emit()
+
+    def write(self, data: bytes, cls: int = COMMAND):
+        """Send a frame with a tx_scheduler priority class"""
+        if self.is_open:
+            self._write.emit(bytes(data), cls)
+
+    # worker-thread slots
+    @QtCore.Slot()
+    def _on_open(self):
+        if self.serial is None:
+            self.serial = QSerialPort(
+                self.portname,
+                baudRate=self.baudrate,
+                flowControl=QSerialPort.FlowControl.NoFlowControl,
+            )
+            self.serial.readyRead.connect(self._receive)
+            self.serial.errorOccurred.connect(self._on_error)
+            self._flush_timer = QtCore.QTimer(self)
+            self._flush_timer.timeout.connect(self._flush)
+            self._pump_timer = QtCore.QTimer(self)
+            self._pump_timer.setSingleShot(True)
+            self._pump_timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+            self._pump_timer.timeout.connect(self._pump)
+        if not self.serial.isOpen() and not self.serial.open(QtCore.QIODevice.OpenModeFlag.ReadWrite):
+            self.opened.emit(False)
+            return
+        self.serial.clear()
+        self.serial.setDataTerminalReady(True)
+        self.deframer = MsgDeframer()
+        self.is_open = True
+        self._flush_timer.start(self.batch_interval_ms)
+        self.opened.emit(True)
+
+    @QtCore.Slot()
+    def _on_close(self):
+        self.is_open = False
+        if self._flush_timer is not None:
+            self._flush_timer.stop()
+            self._pump_timer.stop()
+        for queue in self.scheduler.queues:  # don't send stale frames on the next open
+            queue.clear()
+        self._flush()
+        if self.serial is not None and self.serial.isOpen():
+            self.serial.close()
+
+    @QtCore.Slot(bytes, int)
+    def _on_write(self, data: bytes, cls: int):
+        self.scheduler.submit(data, cls)
+        self._pump()
+
+    @QtCore.Slot()
+    def _pump(self):
+        delay = self.scheduler.pump()
+        if delay is not None and not self._pump_timer.isActive():
+            self._pump_timer.start(max(1, math.ceil(delay * 1000)))
+
+    def _transmit(self, data: bytes):
+        if self.serial is not None and self.serial.isOpen():
+            t0 = perf_counter()
+            with profiling.stage("write"):
+                self.serial.write(data)
+            metrics.SERIAL_WRITE_SECONDS.observe(perf_counter() - t0)
+            if self.session is not None:
+                self.session.tx(data)
+            metrics.SERIAL_TX_FRAMES.inc()
+            metrics.SERIAL_TX_BYTES.inc(len(data))
+
+    @QtCore.Slot()
+    def _receive(self):
+        data = self.serial.readAll().data()
+        metrics.SERIAL_RX_BYTES.inc(len(data))
+        RECORDER.rx(data)
+        messages = self.deframer.feed(data)
+        if self.session is not None:
+            self.session.rx(data)
+            for obj in messages:
+                self.session.message(obj)
+        if self.message_filter is not None:
+            messages = [obj for obj in messages if not self.message_filter(obj)]
+        self._batch += messages
+
+    @QtCore.Slot()
+    def _flush(self):
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self.messagesReceived.emit(batch)
+
+    def _on_error(self, error: QSerialPort.SerialPortError):
+        if error in (QSerialPort.SerialPortError.NoError, QSerialPort.SerialPortError.UnsupportedOperationError):
+            return  # unsupported: e.g. setting DTR on a virtual port
+        print(f"Error: {error}")
+        flight_recorder.dump(f"link_lost_{error.name}")
+        self.errorOccurred.emit(self.serial.errorString())
+        self._on_close()
+        self.serial.clearError()
+
+
+class SerialConsoleWidget(QtWidgets.QWidget):
+    def __init__(self, parent=None, portname: str = None, max_lines: int = 2000, session=None):
+        super(SerialConsoleWidget, self).__init__(parent)
+        self.message_le = QtWidgets.QLineEdit()
+        self.send_btn = QtWidgets.QPushButton(text="Send", clicked=self.send)
+        self.output_te = QtWidgets.QPlainTextEdit(readOnly=True)
+        self.output_te.setMaximumBlockCount(max_lines)  # caps memory use; oldest lines are dropped
+        self.button = QtWidgets.QPushButton(
+            text="Connect Serial", checkable=True, toggled=self.on_toggled
+        )
+        lay = QtWidgets.QVBoxLayout(self)
+        hlay = QtWidgets.QHBoxLayout()
+        hlay.addWidget(self.message_le)
+        hlay.addWidget(self.send_btn)
+        lay.addLayout(hlay)
+        lay.addWidget(self.output_te)
+        lay.addWidget(self.button)
+
+        self.worker = SerialWorker(portname or PicoSerial.find_pico(), session=session)
+        self.worker_thread = QtCore.QThread(self)
+        self.worker_thread.setObjectName("serial-worker")
+        self.worker.moveToThread(self.worker_thread)
+        self.worker.messagesReceived.connect(self.receive)
+        self.worker.opened.connect(self.on_opened)
+        self.worker.errorOccurred.connect(self.on_error)
+        self.worker_thread.start()
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self.shutdown)
+
+    def is_open(self) -> bool:
+        return self.worker.is_open
+
+    def receive(self, messages: list):
+        """Append a batch of decoded messages in one go"""
+        lines = (f"~RX:{obj.rstrip() if isinstance(obj, str) else obj}" for obj in messages)
+        self.output_te.appendPlainText("\n".join(lines))
+
+    def send(self):
+        self.worker.write(self.message_le.text().encode(), COMMAND)  # one unit: see tx_scheduler
+
+    def send_raw(self, rawdata, cls: int = COMMAND):
+        self.worker.write(rawdata, cls)
+
+    def on_toggled(self, checked):
+        self.button.setText("Disconnect Serial" if checked else "Connect Serial")
+        if checked:
+            self.worker.open()
+        else:
+            self.worker.close()
+
+    def on_opened(self, success: bool):
+        if success:
+            self.output_te.appendPlainText(" -- Connected to device --")
+            return
+        with QtCore.QSignalBlocker(self.button):
+            self.button.setChecked(False)
+        self.button.setText("Connect Serial")
+        self.output_te.appendPlainText(" !-- Can't open device --!")
+        print("Can't open Serial device!")
+
+    def on_error(self, error: str):
+        with QtCore.QSignalBlocker(self.button):
+            self.button.setChecked(False)
+        self.button.setText("Connect Serial")
+        self.output_te.appendPlainText(f" !-- {error} --!")
+
+    def shutdown(self):
+        if self.worker_thread.isRunning():
+            QtCore.QMetaObject.invokeMethod(self.worker, "_on_close", QtCore.Qt.ConnectionType.BlockingQueuedConnection)
+            self.worker_thread.quit()
+            self.worker_thread.wait(1000)
+
+
+class QtDatagramTransport:
+    """Drives an asyncio DatagramProtocol (udp_transport's endpoints) from a QUdpSocket on the Qt event loop"""
+
+    def __init__(self, protocol, parent=None):
+        self.protocol = protocol
+        self.sock = QUdpSocket(parent)
+        self.sock.bind(QHostAddress.SpecialAddress.AnyIPv4, 0)
+        self.sock.readyRead.connect(self._receive)
+        protocol.connection_made(self)
+
+    def sendto(self, data: bytes, addr: tuple):
+        self.sock.writeDatagram(data, QHostAddress(addr[0]), addr[1])
+
+    def _receive(self):
+        while self.sock.hasPendingDatagrams():
+            datagram = self.sock.receiveDatagram()
+            addr = (datagram.senderAddress().toString(), datagram.senderPort())
+            self.protocol.datagram_received(datagram.data().data(), addr)
+
+    def close(self):
+        self.sock.close()
+
+
+def open_udp_base_station(rover: tuple, on_message, parent=None) -> "BaseStation":
+    """A udp_transport.BaseStation on the GUI thread, for driving a rover bridge instead of the serial port"""
+    from udp_transport import BaseStation
+
+    base = BaseStation((socket.gethostbyname(rover[0]), rover[1]), on_message)
+    QtDatagramTransport(base, parent)
+    return base
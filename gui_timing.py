@@ -0,0 +1,122 @@
+"""Qt timers for running the control loop and the display at independent rates.
+
+FixedRateTimer keeps a fixed tick rate by scheduling each tick against an absolute deadline (no drift),
+FramePacer renders at most at the display refresh rate, backs off when frames get expensive, and never
+starts a frame that would make the next control tick late.
+"""
+
+from time import perf_counter
+
+from PySide6 import QtCore, QtGui
+
+import metrics
+from loop_timing import TickStats
+
+
+def _ms(seconds: float) -> int:
+    """QTimer intervals are whole milliseconds"""
+    return max(0, round(seconds * 1000))
+
+
+class FixedRateTimer(QtCore.QObject):
+    def __init__(self, parent, period: float, callback):
+        super().__init__(parent)
+        self.period = period
+        self.callback = callback
+        self.stats = TickStats(period)
+        self.deadline = 0.0
+        self._timer = QtCore.QTimer(self)
+        self._timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._on_timeout)
+
+    def start(self):
+        self.deadline = perf_counter()
+        self._timer.start(0)
+
+    def stop(self):
+        self._timer.stop()
+
+    def isActive(self) -> bool:
+        return self._timer.isActive()
+
+    def time_to_next(self, now: float = None) -> float:
+        if not self._timer.isActive():
+            return float("inf")
+        return self.deadline - (perf_counter() if now is None else now)
+
+    def _on_timeout(self):
+        now = self.stats.tick()
+        metrics.LOOP_LAG_SECONDS.observe(max(0.0, now - self.deadline))
+        self.callback()
+        self.deadline += self.period
+        if now > self.deadline:  # fell behind by whole periods: skip them rather than bursting to catch up
+            missed = int((now - self.deadline) / self.period) + 1
+            self.stats.drop(missed)
+            metrics.CONTROL_TICKS_DROPPED.inc(missed)
+            self.deadline += missed * self.period
+        self._timer.start(_ms(self.deadline - perf_counter()))
+
+
+class FramePacer(QtCore.QObject):
+    def __init__(self, parent, render, max_fps: float = None, min_fps: float = 10, control: FixedRateTimer = None):
+        super().__init__(parent)
+        self.render = render
+        self.control = control
+        if max_fps is None:
+            screen = QtGui.QGuiApplication.primaryScreen()
+            max_fps = screen.refreshRate() if screen is not None and screen.refreshRate() > 0 else 60
+        self.min_interval = 1 / max_fps
+        self.max_interval = 1 / min_fps
+        self.interval = self.min_interval
+        self.render_cost = 0.0  # EWMA of frame render time
+        self.deferred = 0  # frames postponed to keep a control tick on time
+        self.stats = TickStats(self.interval)
+        self._due = 0.0
+        self._timer = QtCore.QTimer(self)
+        self._timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._on_timeout)
+
+    def start(self):
+        self._due = perf_counter()
+        self._timer.start(0)
+
+    def stop(self):
+        self._timer.stop()
+
+    def isActive(self) -> bool:
+        return self._timer.isActive()
+
+    @property
+    def fps(self) -> float:
+        return self.stats.rate
+
+    def _on_timeout(self):
+        start = perf_counter()
+        if self.control is not None:
+            slack = self.control.time_to_next(start)
+            if slack < self.render_cost and start - self._due < self.max_interval:
+                # not enough time to render before the next control tick: defer until just after it.
+                # (a frame that can never fit is still drawn at min_fps rather than starved)
+                self.deferred += 1
+                self._timer.start(_ms(slack) + 1)
+                return
+
+        late = start - self._due
+        if late >= self.interval:  # whole frames that never got drawn
+            self.stats.drop(int(late / self.interval))
+        self.stats.tick(start)
+        self.render()
+        cost = perf_counter() - start
+        self.render_cost += 0.1 * (cost - self.render_cost)
+
+        # degrade gracefully: keep rendering below half of the frame budget, recover when it's cheap again
+        if self.render_cost > 0.5 * self.interval:
+            self.interval = min(self.max_interval, self.interval * 1.25)
+        elif self.render_cost < 0.25 * self.interval:
+            self.interval = max(self.min_interval, self.interval * 0.9)
+        self.stats.set_period(self.interval)
+
+        self._due = start + self.interval
+        self._timer.start(_ms(self._due - perf_counter()))
@@ -0,0 +1,192 @@
+"""Whole-session telemetry history for the data plot.
+
+Level 0 keeps every sample; level k keeps the min & max of each block of factor**k samples, so any time span
+can be drawn from a level holding at most a few thousand points. Levels are append-only column stores, in RAM or
+spilled to memory-mapped files in `spill_dir` (which can be reopened later with HistoryStore.load).
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+class _Series:
+    """Append-only (rows, channels) array that grows in chunks, in RAM or in a memory-mapped file"""
+
+    def __init__(self, channels: int, dtype=np.float32, path: str = None, chunk: int = 1 << 16):
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.chunk = chunk
+        self.n = 0
+        self.data: np.ndarray = None
+        if path is not None:
+            open(path, "wb").close()
+        self._grow(chunk)
+
+    @classmethod
+    def open(cls, path: str, channels: int, rows: int, dtype=np.float32) -> "_Series":
+        """Read-only view of a series spilled by a previous session"""
+        series = cls.__new__(cls)
+        series.channels, series.dtype, series.path, series.chunk = channels, np.dtype(dtype), None, 0
+        series.n = rows
+        series.data = np.memmap(path, dtype, "r", shape=(max(rows, 1), channels)) if rows else np.empty((0, channels))
+        return series
+
+    def _grow(self, rows: int):
+        if self.path is None:
+            data = np.empty((rows, self.channels), dtype=self.dtype)
+            if self.data is not None:
+                data[: self.n] = self.data[: self.n]
+        else:
+            if self.data is not None:
+                self.data.flush()
+            with open(self.path, "r+b") as f:
+                f.truncate(rows * self.channels * self.dtype.itemsize)
+            data = np.memmap(self.path, self.dtype, "r+", shape=(rows, self.channels))
+        self.data = data
+
+    def append(self, row):
+        if self.n == len(self.data):
+            self._grow(len(self.data) + max(self.chunk, len(self.data) // 2))
+        self.data[self.n] = row
+        self.n += 1
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key: slice) -> np.ndarray:
+        return self.data[: self.n][key]
+
+    def close(self):
+        """Trim a spilled file to its contents"""
+        if self.path is not None and self.data is not None:
+            self.data.flush()
+            self.data = None
+            with open(self.path, "r+b") as f:
+                f.truncate(self.n * self.channels * self.dtype.itemsize)
+
+
+class HistoryStore:
+    def __init__(
+        self,
+        channels: int,
+        factor: int = 4,
+        max_levels: int = 12,
+        spill_dir: str = None,
+        dtype=np.float32,
+        names: list[str] = None,
+    ):
+        self.channels = channels
+        self.factor = factor
+        self.max_levels = max_levels
+        self.spill_dir = spill_dir
+        self.dtype = np.dtype(dtype)
+        self.names = names or []
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.raw = _Series(channels, dtype, self._path("raw"))
+        self.levels: list[tuple[_Series, _Series]] = []  # (min, max) for level 1, 2, ...
+
+    def _path(self, name: str) -> str:
+        return None if self.spill_dir is None else os.path.join(self.spill_dir, f"{name}.bin")
+
+    @property
+    def count(self) -> int:
+        return len(self.raw)
+
+    def push(self, samples):
+        """Append one sample per channel"""
+        self.raw.append(samples)
+        n, k, f = self.raw.n, 1, self.factor
+        # each completed block of the level below adds one bucket to the next level up
+        while n % f == 0 and k <= self.max_levels:
+            if k > len(self.levels):
+                self.levels.append(
+                    (_Series(self.channels, self.dtype, self._path(f"L{k}_min")),
+                     _Series(self.channels, self.dtype, self._path(f"L{k}_max")))
+                )
+            lo, hi = self.levels[k - 1]
+            if k == 1:
+                block = self.raw[-f:]
+                lo.append(block.min(axis=0))
+                hi.append(block.max(axis=0))
+            else:
+                below_lo, below_hi = self.levels[k - 2]
+                lo.append(below_lo[-f:].min(axis=0))
+                hi.append(below_hi[-f:].max(axis=0))
+            n //= f
+            k += 1
+
+    def level_for(self, samples: int, max_points: int) -> int:
+        """Coarsest level needed to draw `samples` samples with at most ~max_points points"""
+        k = 0
+        while k < len(self.levels) and samples > max_points * self.factor**k:
+            k += 1
+        return k
+
+    def window(self, start: int, stop: int, max_points: int = 2000) -> tuple[np.ndarray, np.ndarray]:
+        """Samples [start, stop) decimated to at most ~2 * max_points points.
+
+        Returns (x, y): sample indices and values of shape (channels, points). At decimated levels every bucket
+        gives two points, its min and its max, so peaks survive any zoom level."""
+        start, stop = max(0, start), min(self.count, stop)
+        if stop <= start:
+            return np.empty(0), np.empty((self.channels, 0), dtype=self.dtype)
+        k = self.level_for(stop - start, max_points)
+        if k == 0:
+            return np.arange(start, stop, dtype=np.float64), self.raw[start:stop].T
+
+        f = self.factor**k
+        lo, hi = self.levels[k - 1]
+        a, b = start // f, min(-(-stop // f), len(lo))
+        mins, maxs = lo[a:b], hi[a:b]
+        covered = b * f
+        if covered < stop:  # newest partial bucket isn't aggregated yet: take it from the raw samples
+            tail = self.raw[max(covered, start) : stop]
+            mins = np.vstack((mins, tail.min(axis=0)))
+            maxs = np.vstack((maxs, tail.max(axis=0)))
+        buckets = len(mins)
+        y = np.empty((self.channels, 2 * buckets), dtype=self.dtype)
+        y[:, 0::2] = mins.T
+        y[:, 1::2] = maxs.T
+        x = np.repeat(np.arange(a, a + buckets, dtype=np.float64) * f, 2)
+        x[1::2] += f / 2
+        return x, y
+
+    def close(self):
+        """Trim spilled files and write the metadata needed to load() them"""
+        self.raw.close()
+        for lo, hi in self.levels:
+            lo.close()
+            hi.close()
+        if self.spill_dir is not None:
+            meta = {
+                "channels": self.channels,
+                "factor": self.factor,
+                "dtype": self.dtype.str,
+                "names": self.names,
+                "rows": [self.raw.n, *(len(lo) for lo, _ in self.levels)],
+            }
+            with open(os.path.join(self.spill_dir, "meta.json"), "w") as f:
+                json.dump(meta, f)
+
+    @classmethod
+    def load(cls, spill_dir: str) -> "HistoryStore":
+        """Open a spilled session read-only"""
+        with open(os.path.join(spill_dir, "meta.json")) as f:
+            meta = json.load(f)
+        store = cls.__new__(cls)
+        store.channels, store.factor, store.names = meta["channels"], meta["factor"], meta["names"]
+        store.dtype = np.dtype(meta["dtype"])
+        store.spill_dir, store.max_levels = None, 0
+        path = lambda name: os.path.join(spill_dir, f"{name}.bin")  # noqa: E731
+        rows = meta["rows"]
+        store.raw = _Series.open(path("raw"), store.channels, rows[0], store.dtype)
+        store.levels = [
+            (_Series.open(path(f"L{k}_min"), store.channels, n, store.dtype),
+             _Series.open(path(f"L{k}_max"), store.channels, n, store.dtype))
+            for k, n in enumerate(rows[1:], start=1)
+        ]
+        return store
@@ -0,0 +1,417 @@
+"""Common non-blocking interface over the controller readers (evdev, pyjoystick, inputs) and recorded sessions.
+
+Every backend keeps a GamepadState up to date and offers two ways to consume events:
+    poll()          non-blocking; applies and returns the events that arrived since the last poll
+    async events()  async iterator; yields each event as soon as it arrives
+
+Use one of the two per backend instance, not both. `select_backend()` picks the lowest-latency backend
+available on this host, unless the ROVER_INPUT_BACKEND environment variable names one. With several evdev
+controllers connected that's multi_gamepad.ControllerArbiter ("multi"), which arbitrates between them.
+"""
+
+import asyncio
+import importlib.util
+import os
+import sys
+import time
+from collections import deque
+
+import metrics
+
+from gamepad import EV_ABS, EV_KEY, JOY_MAX, SRC_EVDEV, SRC_SDL, TRIGGER_MAX, GamepadState, InputEvent
+from pico_interface import ControlPacket
+
+# `inputs` event codes -> (evdev type, evdev code)
+INPUTS_CODES = {
+    "ABS_X": (EV_ABS, 0),
+    "ABS_Y": (EV_ABS, 1),
+    "ABS_Z": (EV_ABS, 2),
+    "ABS_RX": (EV_ABS, 3),
+    "ABS_RY": (EV_ABS, 4),
+    "ABS_RZ": (EV_ABS, 5),
+    "ABS_HAT0X": (EV_ABS, 16),
+    "ABS_HAT0Y": (EV_ABS, 17),
+    "BTN_SOUTH": (EV_KEY, 304),
+    "BTN_EAST": (EV_KEY, 305),
+    "BTN_NORTH": (EV_KEY, 307),
+    "BTN_WEST": (EV_KEY, 308),
+    "BTN_TL": (EV_KEY, 310),
+    "BTN_TR": (EV_KEY, 311),
+    "BTN_THUMBL": (EV_KEY, 317),
+    "BTN_THUMBR": (EV_KEY, 318),
+}
+
+
+class InputBackend:
+    """Base class for controller readers. Subclasses feed events in through _push() or override poll/events."""
+
+    name = "none"
+    latency_rank = 99  # lower is better; used by select_backend()
+    max_pending = 4096  # events kept for poll()/events() consumers; older ones are dropped
+
+    def __init__(self, state: GamepadState = None):
+        self.state = GamepadState() if state is None else state
+        self.running = False
+        self._pending = deque(maxlen=self.max_pending)
+        self._loop: asyncio.AbstractEventLoop = None
+        self._wakeup: asyncio.Event = None
+        self._wake_scheduled = False
+
+    @classmethod
+    def available(cls) -> bool:
+        return False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+        if self._loop is not None:  # release an events() consumer; may be called from a reader thread
+            try:
+                self._loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                pass
+
+    def is_connected(self) -> bool:
+        return self.running
+
+    def __bool__(self):
+        return self.is_connected()
+
+    def make_control_packet(self) -> ControlPacket:
+        return self.state.make_control_packet()
+
+    def _push(self, event: InputEvent):
+        """Apply an event and queue it for consumers. Safe to call from a reader thread."""
+        self.state.apply_event(event)
+        self._pending.append(event)
+        metrics.INPUT_EVENTS.inc()
+        if self._loop is not None and not self._wake_scheduled:
+            self._wake_scheduled = True  # coalesce wakeups: one loop callback per batch of events
+            try:
+                self._loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:  # loop closed
+                self._loop = None
+
+    def _wake(self):
+        self._wake_scheduled = False
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def poll(self) -> list[InputEvent]:
+        events = []
+        while self._pending:
+            events.append(self._pending.popleft())
+        return events
+
+    async def events(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        try:
+            while self.running:
+                while self._pending:
+                    yield self._pending.popleft()
+                self._wakeup.clear()
+                if not self._pending and self.running:
+                    await self._wakeup.wait()
+        finally:
+            self._loop = None
+            self._wakeup = None
+
+    def __aiter__(self):
+        return self.events()
+
+
+class EvdevBackend(InputBackend):
+    """Reads the xbox controller's evdev device directly. Non-blocking reads, no extra thread (Linux only)."""
+
+    name = "evdev"
+    latency_rank = 0
+
+    def __init__(self, state: GamepadState = None):
+        super().__init__(state)
+        self.device = None
+
+    @classmethod
+    def available(cls) -> bool:
+        if sys.platform != "linux" or importlib.util.find_spec("evdev") is None:
+            return False
+        from gamepad import find_controller
+
+        device = find_controller()
+        if device is None:
+            return False
+        device.close()
+        return True
+
+    def start(self):
+        from gamepad import find_controller
+
+        self.device = find_controller()
+        if self.device is None:
+            raise FileNotFoundError("No xbox controller found!")
+        print(f"Controller connected: {self.device.name}")
+        super().start()
+
+    def stop(self):
+        super().stop()
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+
+    def _apply(self, ev):
+        if ev.type in (EV_KEY, EV_ABS):
+            self._push(InputEvent(time.monotonic_ns(), SRC_EVDEV, ev.type, ev.code, ev.value))
+
+    def poll(self) -> list[InputEvent]:
+        if self.device is None:
+            return []
+        try:
+            for ev in self.device.read():
+                self._apply(ev)
+        except BlockingIOError:  # nothing to read
+            pass
+        except OSError:
+            self.stop()
+            raise
+        return super().poll()
+
+    async def events(self):
+        try:
+            async for ev in self.device.async_read_loop():
+                if not self.running:
+                    break
+                self._apply(ev)
+                while self._pending:
+                    yield self._pending.popleft()
+        except OSError:
+            self.stop()
+            raise
+
+
+class PyJoystickBackend(InputBackend):
+    """pyjoystick (SDL2) reader. SDL's event thread hands events over without polling delays."""
+
+    name = "pyjoystick"
+    latency_rank = 1
+
+    def __init__(self, state: GamepadState = None):
+        super().__init__(state)
+        self.mgr = None
+
+    @classmethod
+    def available(cls) -> bool:
+        if importlib.util.find_spec("pyjoystick") is None:
+            return False
+        from pyjoystick.sdl2 import Joystick
+
+        return bool(Joystick.get_joysticks())
+
+    def start(self):
+        import pyjoystick
+        from pyjoystick.sdl2 import run_event_loop
+
+        self.mgr = pyjoystick.ThreadEventManager(
+            event_loop=run_event_loop,
+            remove_joystick=lambda joy: self.stop(),
+            handle_key_event=self._handle_key_event,
+            button_repeater=None,
+        )
+        self.mgr.start()
+        super().start()
+
+    def stop(self):
+        super().stop()
+        if self.mgr is not None:
+            self.mgr.stop()
+            self.mgr = None
+
+    def _handle_key_event(self, key):
+        evtype = EV_ABS if key.keytype == key.AXIS else EV_KEY if key.keytype == key.BUTTON else None
+        if evtype is not None:
+            self._push(InputEvent(time.monotonic_ns(), SRC_SDL, evtype, key.number, key.value))
+
+
+class InputsBackend(InputBackend):
+    """`inputs` library reader (also works on Windows). Events are translated to evdev codes & ranges."""
+
+    name = "inputs"
+    latency_rank = 2
+
+    def __init__(self, state: GamepadState = None):
+        super().__init__(state)
+        self.controller = None
+        self._trigger_scale = 1.0
+        self._joy_scale = 1.0
+
+    @classmethod
+    def available(cls) -> bool:
+        if importlib.util.find_spec("inputs") is None:
+            return False
+        import inputs
+
+        return bool(inputs.devices.gamepads)
+
+    def start(self):
+        from gamepad_inputs import XboxController
+
+        # rescale from XboxController's ranges to the evdev ranges the decoder expects
+        self._trigger_scale = TRIGGER_MAX / XboxController.MAX_TRIG_VAL
+        self._joy_scale = JOY_MAX / XboxController.MAX_JOY_VAL
+        self.controller = XboxController(event_cbk=self._handle_inputs_event)
+        super().start()
+
+    def stop(self):
+        super().stop()
+        if self.controller is not None:
+            self.controller.active = False  # the monitor thread exits after its next event
+            self.controller = None
+
+    def _handle_inputs_event(self, ev):
+        code = INPUTS_CODES.get(ev.code)
+        if code is None:
+            return
+        evtype, evcode = code
+        value = ev.state
+        if evcode in (2, 5):  # triggers
+            value *= self._trigger_scale
+        elif evtype == EV_ABS and evcode < 16:  # joysticks (not the dpad hat)
+            value *= self._joy_scale
+        self._push(InputEvent(time.monotonic_ns(), SRC_EVDEV, evtype, evcode, value))
+
+
+class ReplayBackend(InputBackend):
+    """Plays back an input_recording log in place of a controller, at `speed` times real time (0 = max speed)"""
+
+    name = "replay"
+    latency_rank = 100  # never auto-selected
+
+    def __init__(self, path, speed: float = 1.0, state: GamepadState = None):
+        super().__init__(state)
+        from input_recording import InputReplay
+
+        self.replay = InputReplay(path)
+        self.speed = speed
+        self._idx = 0
+        self._t0 = 0.0
+
+    def start(self):
+        self._idx = 0
+        self._t0 = time.perf_counter()
+        super().start()
+
+    def _due(self, now: float) -> bool:
+        if self._idx >= len(self.replay):
+            return False
+        if not self.speed:
+            return True
+        offset = (self.replay[self._idx].t_ns - self.replay[0].t_ns) / 1e9 / self.speed
+        return self._t0 + offset <= now
+
+    def poll(self) -> list[InputEvent]:
+        events = []
+        now = time.perf_counter()
+        while self.running and self._due(now):
+            event = self.replay[self._idx]
+            self.state.apply_event(event)
+            events.append(event)
+            self._idx += 1
+        if self._idx >= len(self.replay):
+            self.running = False
+        return events
+
+    async def events(self):
+        while self.running and self._idx < len(self.replay):
+            event = self.replay[self._idx]
+            if self.speed:
+                offset = (event.t_ns - self.replay[0].t_ns) / 1e9 / self.speed
+                delay = self._t0 + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)
+            self.state.apply_event(event)
+            self._idx += 1
+            yield event
+        self.running = False
+
+
+class SharedInputBackend(InputBackend):
+    """Mirrors the gamepad state another process publishes to a shm_state.SharedState (see pipeline.py).
+    Poll-only; stops when the publisher reports the controller disconnected."""
+
+    name = "shm"
+    latency_rank = 100  # never auto-selected
+
+    def __init__(self, shared, state: GamepadState = None):
+        """shared: a shm_state.SharedState, or the pipeline name to attach to"""
+        super().__init__(state)
+        if isinstance(shared, str):
+            from shm_state import SharedState
+
+            shared = SharedState(shared)
+        self.shared = shared
+        self._seq = 0
+
+    def poll(self) -> list[InputEvent]:
+        from shm_state import StaleBlock
+
+        try:
+            update = self.shared.read_input(self._seq)
+        except StaleBlock as e:  # the input process died mid-write: same as a disconnect
+            print(e)
+            self.running = False
+            return []
+        if update is not None:
+            self._seq, (t_ns, connected, snapshot) = update
+            for field, value in zip(GamepadState.SNAPSHOT_FIELDS, snapshot):
+                setattr(self.state, field, value)
+            metrics.INPUT_LATENCY_SECONDS.observe((time.monotonic_ns() - t_ns) * 1e-9)
+            if not connected:
+                self.running = False
+        return []  # only the latest state crosses the process boundary, not the events
+
+
+BACKENDS = {cls.name: cls for cls in (EvdevBackend, PyJoystickBackend, InputsBackend)}
+
+
+def all_backends() -> dict[str, type]:
+    """BACKENDS plus the multi-controller arbiter, which can't be listed above: multi_gamepad imports this module"""
+    from multi_gamepad import ControllerArbiter
+
+    return {**BACKENDS, ControllerArbiter.name: ControllerArbiter}
+
+
+def select_backend(name: str = None, state: GamepadState = None) -> InputBackend:
+    """Return an (unstarted) backend: the named one, $ROVER_INPUT_BACKEND, or the lowest-latency one available"""
+    name = name or os.environ.get("ROVER_INPUT_BACKEND")
+    backends = all_backends()
+    if name:
+        if name not in backends:
+            raise ValueError(f"Unknown input backend {name!r}, expected one of {list(backends)}")
+        return backends[name](state)
+    for cls in sorted(backends.values(), key=lambda cls: cls.latency_rank):
+        try:
+            if cls.available():
+                return cls(state)
+        except Exception as e:  # a broken optional library shouldn't hide the other backends
+            print(f"Input backend {cls.name} unavailable: {e}")
+    raise FileNotFoundError("No gamepad found by any input backend!")
+
+
+if __name__ == "__main__":
+
+    async def main():
+        backend = select_backend(sys.argv[1] if len(sys.argv) > 1 else None)
+        print(f"Using {backend.name} input backend")
+        backend.start()
+        try:
+            async for event in backend:
+                print(event, backend.make_control_packet(), " " * 8, end="\r")
+                if backend.state.button_b:
+                    break
+        finally:
+            backend.stop()
+        print("\ndone")
+
+    asyncio.run(main())
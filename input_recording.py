@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Record gamepad input sessions to a compact binary log and replay them without a controller attached.
+
+Log layout (little-endian):
+    header: magic "RCIR", version (u16), record size (u16), recording start time (i64, monotonic ns)
+    records: fixed-width RECORD structs (see gamepad.InputEvent), 20 bytes each
+
+The fixed record width makes the file directly memory-mappable, e.g. `InputReplay(path).as_array()`.
+"""
+
+import asyncio
+import mmap
+import struct
+import time
+
+from gamepad import SRC_EVDEV, SRC_SDL, EV_ABS, EV_KEY, GamepadState, InputEvent
+
+MAGIC = b"RCIR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHq")
+RECORD = struct.Struct("<qBBHd")  # t_ns, source, evtype, code, value
+
+# numpy view of RECORD, for as_array()
+RECORD_DTYPE = [("t_ns", "<i8"), ("source", "u1"), ("evtype", "u1"), ("code", "<u2"), ("value", "<f8")]
+
+
+class InputRecorder:
+    """Writes InputEvents to a binary log. Attach it to a GamepadState (or Gamepad) to record everything it handles."""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._hooked: list[tuple[GamepadState, tuple[str, ...]]] = []
+        self.file = open(path, "wb")
+        self.start_ns = time.monotonic_ns()
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, self.start_ns))
+
+    def record(self, event: InputEvent):
+        self.file.write(RECORD.pack(*event))
+        self.count += 1
+
+    def attach(self, state: GamepadState):
+        """Hook the state's event handlers so every handled event is also recorded.
+
+        The lowest-level handlers are wrapped (not handle_key_event), so callbacks that were bound before
+        attaching - e.g. the pyjoystick ThreadEventManager's - are recorded too."""
+        evdev_handler = state.handle_evdev_event
+        axis_handler = state.handle_axis
+        button_handler = state.handle_button
+
+        def handle_evdev_event(evtype, code, value):
+            self.record(InputEvent(time.monotonic_ns(), SRC_EVDEV, evtype, code, value))
+            evdev_handler(evtype, code, value)
+
+        def handle_axis(number, value):
+            self.record(InputEvent(time.monotonic_ns(), SRC_SDL, EV_ABS, number, value))
+            axis_handler(number, value)
+
+        def handle_button(number, value):
+            self.record(InputEvent(time.monotonic_ns(), SRC_SDL, EV_KEY, number, value))
+            button_handler(number, value)
+
+        state.handle_evdev_event = handle_evdev_event
+        state.handle_axis = handle_axis
+        state.handle_button = handle_button
+        self._hooked.append((state, ("handle_evdev_event", "handle_axis", "handle_button")))
+
+    def detach(self):
+        for state, names in self._hooked:
+            for name in names:
+                state.__dict__.pop(name, None)  # fall back to the class methods
+        self._hooked.clear()
+
+    def close(self):
+        self.detach()
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class InputReplay:
+    """Memory-maps a recorded log and feeds its events back into a GamepadState"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self.start_ns = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError(f"{path} is not an input recording (magic {magic}, record size {record_size})")
+        if version != VERSION:
+            raise ValueError(f"Unsupported input recording version {version}")
+        self.count = (len(self._mm) - HEADER.size) // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx: int) -> InputEvent:
+        if idx < 0:
+            idx += self.count
+        if not 0 <= idx < self.count:
+            raise IndexError(idx)
+        return InputEvent(*RECORD.unpack_from(self._mm, HEADER.size + idx * RECORD.size))
+
+    def __iter__(self):
+        for fields in RECORD.iter_unpack(memoryview(self._mm)[HEADER.size : HEADER.size + self.count * RECORD.size]):
+            yield InputEvent(*fields)
+
+    def duration(self) -> float:
+        """Length of the recording in seconds"""
+        if not self.count:
+            return 0.0
+        return (self[-1].t_ns - self[0].t_ns) / 1e9
+
+    def as_array(self):
+        """Zero-copy numpy structured array over the records"""
+        import numpy as np
+
+        return np.frombuffer(self._mm, dtype=np.dtype(RECORD_DTYPE), count=self.count, offset=HEADER.size)
+
+    async def play(self, state: GamepadState, speed: float = 1.0):
+        """Apply the recorded events to `state` with their original spacing, `speed` times faster.
+
+        speed=None (or 0) replays as fast as possible, yielding to the event loop between events.
+        Event times are scheduled against the replay start, so sleep overshoot does not accumulate."""
+        if not self.count:
+            return
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        first_ns = self[0].t_ns
+        for event in self:
+            if speed:
+                delay = t0 + (event.t_ns - first_ns) / 1e9 / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)
+            state.apply_event(event)
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Record or replay gamepad input sessions")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    rec = sub.add_parser("record", help="record the evdev xbox controller until B is pressed")
+    rec.add_argument("path")
+    rep = sub.add_parser("replay", help="replay a recording, printing control packets")
+    rep.add_argument("path")
+    rep.add_argument("--speed", type=float, default=1.0, help="playback speed multiplier, 0 for max speed")
+    args = parser.parse_args()
+
+    async def print_packets(state: GamepadState, done: asyncio.Future):
+        while not done.done():
+            print(state.make_control_packet(), end="\r")
+            await asyncio.sleep(50e-3)
+        print()
+
+    async def main():
+        if args.cmd == "record":
+            from gamepad import Gamepad, controller_test
+
+            remote_control = Gamepad()
+            if not remote_control:
+                print("Please connect an Xbox controller then restart the program!")
+                return
+            with InputRecorder(args.path) as recorder:
+                recorder.attach(remote_control)
+                reader = asyncio.create_task(remote_control.read_gamepad_input())
+                await controller_test(remote_control)
+                reader.cancel()
+                print(f"Recorded {recorder.count} events to {args.path}")
+        else:
+            with InputReplay(args.path) as replay:
+                print(f"Replaying {len(replay)} events ({replay.duration():.1f} s) at {args.speed or 'max'}x")
+                state = GamepadState()
+                t_start = time.perf_counter()
+                playback = asyncio.create_task(replay.play(state, args.speed))
+                await asyncio.gather(playback, print_packets(state, playback))
+                print(f"Done in {time.perf_counter() - t_start:.3f} s")
+
+    asyncio.run(main())
@@ -0,0 +1,216 @@
+"""Non-blocking keyboard line editor for the serial consoles (POSIX terminals).
+
+Reads stdin once the selector / asyncio loop it shares with the serial port reports it readable, so it never
+blocks: no input thread, no silence/pause flags. Keeps an editable line with cursor movement and history, and
+redraws the prompt line itself so output can be printed above it.
+"""
+
+import codecs
+import os
+import sys
+
+
+class LineEditor:
+    HISTORY_MAX = 500
+
+    def __init__(self, prompt: str = "> ", infile=None, outfile=None, history: list[str] = None):
+        self.prompt = prompt
+        self.infile = infile or sys.stdin
+        self.out = outfile or sys.stdout
+        self.fd = self.infile.fileno()
+        self.interactive = os.isatty(self.fd)
+        self.buf: list[str] = []
+        self.cursor = 0
+        self.history: list[str] = list(history or [])
+        self._hist_idx = len(self.history)
+        self._saved = ""  # line being edited while browsing history
+        self._esc = ""  # partial escape sequence
+        self._last = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._term_attrs = None
+        self.eof = False
+
+    def fileno(self) -> int:
+        return self.fd
+
+    # terminal setup
+    def start(self):
+        """Put the terminal in cbreak mode: keys arrive one at a time, unechoed, and Ctrl-C still raises
+        KeyboardInterrupt. Non-terminal input (a pipe) is just read line by line. The fd stays blocking: on a tty
+        it's the same file description as stdout, which mustn't start failing writes with EAGAIN."""
+        if self.interactive:
+            import termios
+            import tty
+
+            self._term_attrs = termios.tcgetattr(self.fd)
+            tty.setcbreak(self.fd)
+            self.redraw()
+
+    def stop(self):
+        if self._term_attrs is not None:
+            import termios
+
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self._term_attrs)
+            self._term_attrs = None
+            self.clear()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def attach(self, loop, on_line):
+        """Feed completed lines to on_line(line) from an asyncio loop"""
+        loop.add_reader(self.fd, lambda: [on_line(line) for line in self.read()])
+
+    def detach(self, loop):
+        loop.remove_reader(self.fd)
+
+    # input
+    def read(self) -> list[str]:
+        """Process the keys that are ready; returns the lines completed. Call only when a selector reports the
+        fd readable, then the one read can't block. Raises EOFError on end of input or Ctrl-D on an empty line."""
+        data = os.read(self.fd, 4096)
+        if not data:
+            self.eof = True
+            self._esc = self._last = ""
+            if not self.buf:
+                raise EOFError
+            return [self._submit()]  # the unterminated last line; resets the cursor & history browsing
+        return self.feed(self._decoder.decode(data))
+
+    def feed(self, text: str) -> list[str]:
+        lines = []
+        changed = False
+        for ch in text:
+            last, self._last = self._last, ch
+            if self._esc:
+                self._esc += ch
+                if self._escape_done():
+                    changed |= self._handle_escape(self._esc)
+                    self._esc = ""
+                continue
+            if ch == "\x1b":
+                self._esc = ch
+                continue
+            if ch in "\r\n":
+                if ch == "\n" and last == "\r":
+                    continue  # \r\n
+                lines.append(self._submit())
+                changed = True
+            elif ch in "\x7f\b":
+                changed |= self._backspace()
+            elif ch == "\x04":  # Ctrl-D
+                if not self.buf:
+                    raise EOFError
+                changed |= self._delete()
+            elif ch == "\x01":  # Ctrl-A
+                self.cursor, changed = 0, True
+            elif ch == "\x05":  # Ctrl-E
+                self.cursor, changed = len(self.buf), True
+            elif ch == "\x15":  # Ctrl-U: clear to start
+                del self.buf[: self.cursor]
+                self.cursor, changed = 0, True
+            elif ch == "\x0b":  # Ctrl-K: clear to end
+                del self.buf[self.cursor :]
+                changed = True
+            elif ch.isprintable():
+                self.buf.insert(self.cursor, ch)
+                self.cursor += 1
+                changed = True
+        if changed and self.interactive:
+            self.redraw()
+        return lines
+
+    def _escape_done(self) -> bool:
+        seq = self._esc
+        if len(seq) < 2:
+            return False
+        if seq[1] not in "[O":
+            return True  # Alt+key: ignored
+        return len(seq) > 2 and (seq[-1].isalpha() or seq[-1] == "~")
+
+    def _handle_escape(self, seq: str) -> bool:
+        key = seq[2:]
+        if key == "D" and self.cursor > 0:
+            self.cursor -= 1
+        elif key == "C" and self.cursor < len(self.buf):
+            self.cursor += 1
+        elif key in ("H", "1~"):
+            self.cursor = 0
+        elif key in ("F", "4~"):
+            self.cursor = len(self.buf)
+        elif key == "3~":
+            self._delete()
+        elif key == "A":
+            self._browse(-1)
+        elif key == "B":
+            self._browse(1)
+        else:
+            return False
+        return True
+
+    def _backspace(self) -> bool:
+        if self.cursor == 0:
+            return False
+        self.cursor -= 1
+        del self.buf[self.cursor]
+        return True
+
+    def _delete(self) -> bool:
+        if self.cursor >= len(self.buf):
+            return False
+        del self.buf[self.cursor]
+        return True
+
+    def _browse(self, step: int):
+        idx = self._hist_idx + step
+        if idx < 0 or idx > len(self.history):
+            return
+        if self._hist_idx == len(self.history):
+            self._saved = self.line
+        self._hist_idx = idx
+        self.buf = list(self.history[idx] if idx < len(self.history) else self._saved)
+        self.cursor = len(self.buf)
+
+    def _submit(self) -> str:
+        line = self.line
+        if line and (not self.history or self.history[-1] != line):
+            self.history.append(line)
+            del self.history[: -self.HISTORY_MAX]
+        self._hist_idx = len(self.history)
+        self._saved = ""
+        self.buf = []
+        self.cursor = 0
+        if self.interactive:
+            self.clear()
+            self.out.write(f"{self.prompt}{line}\n")
+        return line
+
+    @property
+    def line(self) -> str:
+        return "".join(self.buf)
+
+    # output
+    def render(self) -> str:
+        """Escape sequence that redraws the prompt line with the cursor in place"""
+        back = len(self.buf) - self.cursor
+        return f"\r\033[2K{self.prompt}{self.line}" + (f"\033[{back}D" if back else "")
+
+    def redraw(self):
+        self.out.write(self.render())
+        self.out.flush()
+
+    def clear(self):
+        self.out.write("\r\033[2K")
+        self.out.flush()
+
+    def print(self, text: str):
+        """Print text above the prompt line"""
+        if self.interactive:
+            self.out.write(f"\r\033[2K{text}\n{self.render()}")
+        else:
+            self.out.write(f"{text}\n")
+        self.out.flush()
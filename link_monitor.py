@@ -0,0 +1,177 @@
+"""Heartbeat & link-health monitor for the Pico serial link.
+
+A tiny heartbeat frame ["h", seq] (about 10 bytes framed) goes out at `rate` Hz; the Pico (or pico_emulator.py)
+echoes it back unchanged. Echoes give the round-trip time; heartbeats with no echo within `timeout` count as lost.
+
+States: "unknown" (no echo yet), "ok", "degraded" (RTT or recent loss over threshold) and "lost" (no echo for
+`lost_after` s, or none at all within `first_echo_timeout` s of the first heartbeat). "degraded" and "lost" trip
+the failsafe: a zero-throttle packet is sent at once and held until the link is "ok" again. For firmware without
+heartbeat support, pass first_echo_timeout=None: the link then stays "unknown" and is never tripped.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable
+
+from msgpack import Packer
+
+import flight_recorder
+import metrics
+from pico_interface import WrapMsgPack
+
+HEARTBEAT_TAG = "h"
+STATES = ("unknown", "ok", "degraded", "lost")
+
+LINK_RTT_SECONDS = metrics.REGISTRY.histogram("link_rtt_seconds", "heartbeat round-trip time")
+HEARTBEATS_SENT = metrics.REGISTRY.counter("heartbeats_sent", "heartbeat frames sent")
+HEARTBEATS_LOST = metrics.REGISTRY.counter("heartbeats_lost", "heartbeats with no echo within the timeout")
+FAILSAFE_TRIPS = metrics.REGISTRY.counter("failsafe_trips", "times the link went degraded or lost")
+
+
+def is_heartbeat(obj) -> bool:
+    return isinstance(obj, (list, tuple)) and len(obj) == 2 and obj[0] == HEARTBEAT_TAG
+
+
+@dataclass
+class LinkStats:
+    sent: int = 0
+    echoed: int = 0
+    lost: int = 0
+    late: int = 0  # echoes that arrived after their heartbeat was counted as lost
+    rtt: float = 0.0  # EWMA, s
+    rtt_min: float = float("inf")
+    rtt_max: float = 0.0
+    jitter: float = 0.0  # EWMA of |rtt - rtt EWMA|
+    last_echo: float = None  # perf_counter() of the last echo
+
+    def summary(self) -> str:
+        if not self.echoed:
+            return f"no echo ({self.sent} heartbeats sent)"
+        return (
+            f"RTT {self.rtt * 1e3:.1f} ms (min {self.rtt_min * 1e3:.1f}, max {self.rtt_max * 1e3:.1f},"
+            f" jitter {self.jitter * 1e3:.1f}), lost {self.lost}/{self.sent}"
+        )
+
+
+class LinkMonitor:
+    def __init__(
+        self,
+        tx: Callable[[bytes], object],
+        rate: float = 5.0,
+        timeout: float = 0.5,
+        lost_after: float = 1.0,
+        max_rtt: float = 0.1,
+        max_loss: float = 0.2,
+        window: int = 20,
+        alpha: float = 0.2,
+        first_echo_timeout: float = 3.0,
+    ):
+        """tx sends a framed heartbeat. Degraded above max_rtt (EWMA, s) or max_loss (fraction of the last
+        `window` heartbeats); lost after lost_after s without an echo, or first_echo_timeout s (None: never) after
+        the first heartbeat if no echo ever came."""
+        self.tx = tx
+        self.interval = 1 / rate
+        self.timeout = timeout
+        self.lost_after = lost_after
+        self.max_rtt = max_rtt
+        self.max_loss = max_loss
+        self.first_echo_timeout = first_echo_timeout
+        self.alpha = alpha
+        self.stats = LinkStats()
+        self.state = "unknown"
+        self.observers: list[Callable[[str, str], object]] = []  # called with (old state, new state)
+        self.packer = Packer()
+        self.seq = 0
+        self._outstanding: dict[int, float] = {}  # seq -> send time
+        self._recent = deque(maxlen=window)  # True = echoed, False = lost
+        self._next_beat = 0.0
+        self._first_beat: float = None
+        metrics.REGISTRY.gauge("link_rtt_ms", "heartbeat RTT EWMA", lambda: round(self.stats.rtt * 1e3, 2))
+
+    @property
+    def failsafe(self) -> bool:
+        """Whether throttle must be held at zero"""
+        return self.state in ("degraded", "lost")
+
+    @property
+    def loss(self) -> float:
+        """Fraction of the recent heartbeats that were lost"""
+        return self._recent.count(False) / len(self._recent) if self._recent else 0.0
+
+    def add_observer(self, observer: Callable[[str, str], object]):
+        self.observers.append(observer)
+
+    def tick(self, now: float = None) -> str:
+        """Send a heartbeat if one is due, expire unanswered ones and update the state. Call often (e.g. every
+        control packet tick); it only sends at `rate`."""
+        if now is None:
+            now = perf_counter()
+        for seq, sent in list(self._outstanding.items()):
+            if now - sent > self.timeout:
+                if self._outstanding.pop(seq, None) is None:  # echoed meanwhile, on the serial thread
+                    continue
+                self.stats.lost += 1
+                self._recent.append(False)
+                HEARTBEATS_LOST.inc()
+        if now >= self._next_beat:
+            self.seq = (self.seq + 1) & 0xFFFF
+            if self._first_beat is None:
+                self._first_beat = now
+            self._outstanding[self.seq] = now
+            self.tx(WrapMsgPack(self.packer, (HEARTBEAT_TAG, self.seq)))
+            self.stats.sent += 1
+            HEARTBEATS_SENT.inc()
+            self._next_beat = max(self._next_beat + self.interval, now)
+        self._set_state(self._evaluate(now))
+        return self.state
+
+    def on_message(self, obj, now: float = None) -> bool:
+        """Feed a received message; returns True if it was a heartbeat echo (which needn't be shown).
+        May be called from a serial reader thread."""
+        if not is_heartbeat(obj):
+            return False
+        if now is None:
+            now = perf_counter()
+        sent = self._outstanding.pop(obj[1], None)
+        if sent is None:
+            self.stats.late += 1
+            return True
+        rtt = now - sent
+        s = self.stats
+        if not s.echoed:
+            s.rtt = rtt
+        s.jitter += self.alpha * (abs(rtt - s.rtt) - s.jitter)
+        s.rtt += self.alpha * (rtt - s.rtt)
+        s.rtt_min = min(s.rtt_min, rtt)
+        s.rtt_max = max(s.rtt_max, rtt)
+        s.echoed += 1
+        s.last_echo = now
+        self._recent.append(True)
+        LINK_RTT_SECONDS.observe(rtt)
+        return True
+
+    def _evaluate(self, now: float) -> str:
+        last = self.stats.last_echo
+        if last is None:
+            grace = self.first_echo_timeout
+            if grace is not None and self._first_beat is not None and now - self._first_beat > grace:
+                return "lost"  # dead from the start
+            return "unknown"
+        if now - last > self.lost_after:
+            return "lost"
+        if self.stats.rtt > self.max_rtt or self.loss > self.max_loss:
+            return "degraded"
+        return "ok"
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        old, self.state = self.state, state
+        if state in ("degraded", "lost") and old not in ("degraded", "lost"):
+            FAILSAFE_TRIPS.inc()
+        if state == "lost":
+            flight_recorder.dump("link_lost")
+        print(f"Link {old} -> {state}: {self.stats.summary()}")
+        for observer in self.observers:
+            observer(old, state)
@@ -0,0 +1,51 @@
+"""Tick timing statistics shared by the GUI timers and the headless control loop"""
+
+from time import perf_counter
+
+
+class TickStats:
+    """Tracks the achieved rate, jitter and dropped ticks of a periodic task with a nominal `period` (s)"""
+
+    def __init__(self, period: float, alpha: float = 0.05):
+        self.period = period
+        self.alpha = alpha  # EWMA weight
+        self.ticks = 0
+        self.dropped = 0  # deadlines skipped entirely (late by a whole period or more, or deferred)
+        self.interval = period  # EWMA of the time between ticks
+        self.jitter = 0.0  # EWMA of |interval - period|
+        self.jitter_max = 0.0
+        self.last = None
+
+    def tick(self, now: float = None) -> float:
+        """Record a tick; returns its timestamp"""
+        if now is None:
+            now = perf_counter()
+        if self.last is not None:
+            interval = now - self.last
+            err = abs(interval - self.period)
+            self.interval += self.alpha * (interval - self.interval)
+            self.jitter += self.alpha * (err - self.jitter)
+            if err > self.jitter_max:
+                self.jitter_max = err
+        self.ticks += 1
+        self.last = now
+        return now
+
+    def drop(self, n: int = 1):
+        self.dropped += n
+
+    def set_period(self, period: float):
+        self.period = period
+
+    @property
+    def rate(self) -> float:
+        return 1 / self.interval if self.interval > 0 else 0.0
+
+    def reset_max(self):
+        self.jitter_max = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.rate:6.1f} Hz (target {1 / self.period:.1f}), jitter {self.jitter * 1e3:.2f} ms"
+            f" (max {self.jitter_max * 1e3:.2f}), dropped {self.dropped}/{self.ticks + self.dropped}"
+        )
@@ -0,0 +1,285 @@
+"""Lightweight process-wide counters, gauges & histograms, read by the perf HUD and the exporters.
+
+Counters and histograms keep one cell per thread, so updating them is lock-free and never loses increments
+between threads; a read sums the cells. They are cheap enough for hot paths (serial RX, deframing, input events).
+
+Export: `serve_http(port)` serves Prometheus text on localhost, `FileDump(path)` rewrites a file periodically
+(for the headless rover; a .prom file suits node_exporter's textfile collector, a .json file is a flat snapshot).
+"""
+
+import json
+import os
+import threading
+from bisect import bisect_left
+from threading import get_ident
+from time import perf_counter
+
+# seconds; used for all latency histograms unless given other buckets
+LATENCY_BUCKETS = (50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3, 100e-3, 250e-3, 1.0)
+
+
+class Counter:
+    """Monotonic count, e.g. frames or bytes transferred"""
+
+    def __init__(self, name: str, doc: str = ""):
+        self.name = name
+        self.doc = doc
+        self._cells: dict[int, list] = {}  # thread id -> [count]; each cell is only written by its thread
+
+    def inc(self, n: int = 1):
+        cell = self._cells.get(get_ident())
+        if cell is None:
+            cell = self._cells.setdefault(get_ident(), [0])
+        cell[0] += n
+
+    @property
+    def value(self) -> int:
+        return sum(cell[0] for cell in list(self._cells.values()))
+
+
+class Gauge:
+    """Current level of something, e.g. a queue depth. Either set() it or give it a function to sample."""
+
+    def __init__(self, name: str, doc: str = "", fn=None):
+        self.name = name
+        self.doc = doc
+        self.fn = fn
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        if self.fn is not None:
+            try:
+                return self.fn()
+            except Exception:
+                return None
+        return self.value
+
+
+class Histogram:
+    """Distribution over fixed buckets, e.g. latencies in seconds"""
+
+    def __init__(self, name: str, doc: str = "", buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(sorted(buckets))  # upper bounds; values above the last go in an overflow bucket
+        self._cells: dict[int, list] = {}  # thread id -> [count per bucket..., overflow, sum]
+
+    def observe(self, value: float):
+        cell = self._cells.get(get_ident())
+        if cell is None:
+            cell = self._cells.setdefault(get_ident(), [0] * (len(self.buckets) + 1) + [0.0])
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def time(self) -> "_Timer":
+        """Context manager observing the duration of its block"""
+        return _Timer(self)
+
+    def snapshot(self) -> tuple[list[int], float]:
+        """(count per bucket incl. overflow, sum of observed values)"""
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for cell in list(self._cells.values()):
+            for i, n in enumerate(cell[:-1]):
+                counts[i] += n
+            total += cell[-1]
+        return counts, total
+
+    @property
+    def count(self) -> int:
+        return sum(self.snapshot()[0])
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf if it's in the overflow bucket)"""
+        counts, _ = self.snapshot()
+        target = q * sum(counts)
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            seen += n
+            if n and seen >= target:
+                return bound
+        return 0.0
+
+
+class _Timer:
+    __slots__ = ("hist", "start")
+
+    def __init__(self, hist: Histogram):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(perf_counter() - self.start)
+
+
+class Registry:
+    def __init__(self):
+        self.counters: dict[str, Counter] = {}
+        self.gauges: dict[str, Gauge] = {}
+        self.histograms: dict[str, Histogram] = {}
+
+    def counter(self, name: str, doc: str = "") -> Counter:
+        """Get or create a counter"""
+        if name not in self.counters:
+            self.counters[name] = Counter(name, doc)
+        return self.counters[name]
+
+    def gauge(self, name: str, doc: str = "", fn=None) -> Gauge:
+        """Get or create a gauge; passing fn (re)binds the function it samples"""
+        if name not in self.gauges:
+            self.gauges[name] = Gauge(name, doc, fn)
+        elif fn is not None:
+            self.gauges[name].fn = fn
+        return self.gauges[name]
+
+    def histogram(self, name: str, doc: str = "", buckets=LATENCY_BUCKETS) -> Histogram:
+        """Get or create a histogram"""
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, doc, buckets)
+        return self.histograms[name]
+
+    def snapshot(self) -> dict:
+        """Flat values: counters, gauges, and per histogram its count, sum and p50/p99 bucket bounds"""
+        values = {name: c.value for name, c in self.counters.items()}
+        values.update((name, g.get()) for name, g in self.gauges.items())
+        for name, h in self.histograms.items():
+            counts, total = h.snapshot()
+            values[f"{name}_count"] = sum(counts)
+            values[f"{name}_sum"] = total
+            values[f"{name}_p50"] = h.quantile(0.5)
+            values[f"{name}_p99"] = h.quantile(0.99)
+        return values
+
+    def prometheus(self, prefix: str = "rover_") -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for name, c in self.counters.items():
+            lines += [f"# HELP {prefix}{name}_total {c.doc}", f"# TYPE {prefix}{name}_total counter"]
+            lines.append(f"{prefix}{name}_total {c.value}")
+        for name, g in self.gauges.items():
+            value = g.get()
+            if value is None:
+                continue
+            lines += [f"# HELP {prefix}{name} {g.doc}", f"# TYPE {prefix}{name} gauge", f"{prefix}{name} {value}"]
+        for name, h in self.histograms.items():
+            lines += [f"# HELP {prefix}{name} {h.doc}", f"# TYPE {prefix}{name} histogram"]
+            counts, total = h.snapshot()
+            cumulative = 0
+            for bound, n in zip(h.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}{name}_bucket{{le="{le}"}} {cumulative}')
+            lines += [f"{prefix}{name}_sum {total}", f"{prefix}{name}_count {cumulative}"]
+        return "\n".join(lines) + "\n"
+
+
+class RateMeter:
+    """Per-second rates of a registry's counters between successive update() calls"""
+
+    def __init__(self, registry: "Registry"):
+        self.registry = registry
+        self.rates: dict[str, float] = {}
+        self._last = {}
+        self._last_time = None
+
+    def update(self, now: float = None) -> dict[str, float]:
+        if now is None:
+            now = perf_counter()
+        values = {name: c.value for name, c in self.registry.counters.items()}
+        if self._last_time is not None and now > self._last_time:
+            dt = now - self._last_time
+            self.rates = {name: (v - self._last.get(name, 0)) / dt for name, v in values.items()}
+        self._last = values
+        self._last_time = now
+        return self.rates
+
+
+def serve_http(port: int = 9108, host: str = "127.0.0.1", registry: Registry = None) -> "ThreadingHTTPServer":
+    """Serve the registry as Prometheus text at http://host:port/metrics from a daemon thread.
+    Call .shutdown() on the returned server to stop it."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # ~40 ms; only when exporting
+
+    registry = registry or REGISTRY
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # scrapes would flood the console
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+class FileDump:
+    """Rewrites `path` with the registry every `interval` seconds from a daemon thread, and once more on stop().
+    Prometheus text, or a JSON snapshot if the path ends in .json. The file is replaced atomically."""
+
+    def __init__(self, path: str, interval: float = 10.0, registry: Registry = None):
+        self.path = path
+        self.interval = interval
+        self.registry = registry or REGISTRY
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-dump", daemon=True)
+        self._thread.start()
+
+    def dump(self):
+        if self.path.endswith(".json"):
+            text = json.dumps(self.registry.snapshot(), indent=1, default=str)
+        else:
+            text = self.registry.prometheus()
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.dump()
+
+
+REGISTRY = Registry()
+
+# serial link
+SERIAL_TX_FRAMES = REGISTRY.counter("serial_tx_frames", "writes to the serial port")
+SERIAL_TX_BYTES = REGISTRY.counter("serial_tx_bytes", "bytes written to the serial port")
+SERIAL_RX_BYTES = REGISTRY.counter("serial_rx_bytes", "bytes read from the serial port")
+SERIAL_TX_DROPPED = REGISTRY.counter("serial_tx_dropped", "frames dropped because the serial port fell behind")
+SERIAL_WRITE_SECONDS = REGISTRY.histogram("serial_write_seconds", "time spent in serial writes")
+# framing
+TX_FRAMES_ENCODED = REGISTRY.counter("tx_frames_encoded", "msgpack frames wrapped for sending")
+DEFRAME_SECONDS = REGISTRY.histogram("deframe_seconds", "time to split & decode one batch of received bytes")
+RX_MESSAGES = REGISTRY.counter("rx_messages", "text lines & msgpack frames decoded")
+RX_PARSE_ERRORS = REGISTRY.counter("rx_parse_errors", "frames with a bad length or undecodable payload")
+# input
+INPUT_EVENTS = REGISTRY.counter("input_events", "controller events applied")
+INPUT_LATENCY_SECONDS = REGISTRY.histogram("input_latency_seconds", "controller event read -> consumed by the control tick")
+# control
+CONTROL_TICKS = REGISTRY.counter("control_ticks", "control pipeline steps")
+CONTROL_PACKETS = REGISTRY.counter("control_packets", "control packets handed to the transport")
+CONTROL_KEEPALIVES = REGISTRY.counter("control_keepalives", "unchanged control packets resent by the keepalive")
+CONTROL_TICKS_DROPPED = REGISTRY.counter("control_ticks_dropped", "control ticks skipped after an overrun")
+CONTROL_TICK_SECONDS = REGISTRY.histogram("control_tick_seconds", "time to run one control tick")
+LOOP_LAG_SECONDS = REGISTRY.histogram("loop_lag_seconds", "how late control ticks start vs their deadline")
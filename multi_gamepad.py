@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""Read several evdev controllers on one asyncio loop and arbitrate which one drives the rover.
+
+Takeover policy:
+  - input on a higher-priority pad (e.g. the supervisor's) takes control immediately
+  - a lower-priority pad only gets control back once the owner has been idle for `takeover_timeout` seconds
+
+Arbitration happens when events arrive, so packet building only ever reads the owning pad's state:
+idle controllers cost nothing per tick, they just sit in the event loop's selector.
+
+As the "multi" input backend it's picked automatically when more than one evdev controller is connected (or with
+--backend multi); the pad whose device path is in $ROVER_SUPERVISOR_PAD gets the supervisor's priority.
+"""
+
+import asyncio
+import importlib.util
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+
+from gamepad import EV_ABS, EV_KEY, JOY_MAX, SRC_EVDEV, TRIGGER_MAX, GamepadState, InputEvent
+from input_backend import InputBackend
+from pico_interface import ControlPacket
+
+
+@dataclass
+class LatencyStats:
+    """Kernel event timestamp -> userspace read latency, in seconds"""
+
+    count: int = 0
+    mean: float = 0.0  # exponentially weighted
+    max: float = 0.0
+    alpha: float = 0.05
+
+    def add(self, latency: float):
+        self.count += 1
+        self.mean += self.alpha * (latency - self.mean) if self.count > 1 else latency
+        if latency > self.max:
+            self.max = latency
+
+
+@dataclass
+class ControllerSlot:
+    device: object  # evdev.InputDevice
+    priority: int = 0
+    name: str = ""
+    state: GamepadState = field(default_factory=GamepadState)
+    last_input: float = 0.0  # monotonic time of the last deliberate input
+    latency: LatencyStats = field(default_factory=LatencyStats)
+    task: asyncio.Task = None
+
+
+class ControllerArbiter(InputBackend):
+    """InputBackend that merges several controllers. `state` always points at the owning controller's state."""
+
+    name = "multi"
+    latency_rank = -1  # evdev underneath; preferred over a single evdev pad when several are connected
+    supervisor_priority = 10
+
+    def __init__(
+        self, state: GamepadState = None, takeover_timeout: float = 2.0, deadband: float = 0.1, supervisor: str = None
+    ):
+        """state is the (neutral) state while nobody is in control. supervisor: device path of the pad with the
+        highest priority, default $ROVER_SUPERVISOR_PAD."""
+        super().__init__(state)
+        self.supervisor = supervisor or os.environ.get("ROVER_SUPERVISOR_PAD")
+        self.takeover_timeout = takeover_timeout
+        self.deadband = deadband  # fraction of full scale; stick/trigger movement below this isn't a takeover request
+        self.slots: list[ControllerSlot] = []
+        self.owner: ControllerSlot = None
+        self.takeovers = 0
+
+    def add(self, device, priority: int = 0, name: str = None) -> ControllerSlot:
+        slot = ControllerSlot(device, priority, name or f"{device.name} ({device.path})")
+        self.slots.append(slot)
+        if self.running:
+            slot.task = asyncio.create_task(self._read(slot))
+        return slot
+
+    def remove(self, slot: ControllerSlot):
+        self.slots.remove(slot)
+        if slot.task is not None:
+            slot.task.cancel()
+        if self.owner is slot:
+            self._set_owner(None)
+
+    @classmethod
+    def available(cls) -> bool:
+        if sys.platform != "linux" or importlib.util.find_spec("evdev") is None:
+            return False
+        from gamepad import find_controllers
+
+        controllers = find_controllers()
+        for device in controllers:
+            device.close()
+        return len(controllers) > 1
+
+    def start(self):
+        """Start reading every added controller, or every connected one if none were added. Must be called from
+        the event loop."""
+        self._loop = asyncio.get_running_loop()
+        if not self.slots:
+            from gamepad import find_controllers
+
+            for device in find_controllers():
+                self.add(device, priority=self.supervisor_priority if device.path == self.supervisor else 0)
+            if not self.slots:
+                raise FileNotFoundError("No xbox controller found!")
+        super().start()
+        for slot in self.slots:
+            if slot.task is None:
+                slot.task = asyncio.create_task(self._read(slot))
+
+    def stop(self):
+        super().stop()
+        for slot in self.slots:
+            if slot.task is not None:
+                slot.task.cancel()
+                slot.task = None
+
+    def make_control_packet(self) -> ControlPacket:
+        if self.owner is None:
+            return ControlPacket()  # nobody in control: neutral packet
+        return self.owner.state.make_control_packet()
+
+    def _set_owner(self, slot: ControllerSlot):
+        if slot is not self.owner:
+            self.takeovers += 1
+            print(f"Control: {slot.name if slot else 'nobody'}")
+        self.owner = slot
+        self.state = slot.state if slot else GamepadState()
+
+    def _is_deliberate(self, ev) -> bool:
+        """Button presses and stick/trigger movement outside the deadband count as wanting control"""
+        if ev.type == EV_KEY:
+            return bool(ev.value)
+        if ev.code in (2, 5):  # triggers
+            return ev.value > self.deadband * TRIGGER_MAX
+        if ev.code in (16, 17):  # dpad
+            return ev.value != 0
+        return abs(ev.value) > self.deadband * JOY_MAX
+
+    def _is_held(self, state: GamepadState) -> bool:
+        """A stick or trigger held outside the deadband, or a button held down. evdev only reports changes, so
+        an owner holding the throttle steady sends no events but is still driving."""
+        ljx, ljy, rjx, rjy, lt, rt, *buttons = state.snapshot()
+        return max(abs(ljx), abs(ljy), abs(rjx), abs(rjy), lt, rt) > self.deadband or any(buttons)
+
+    def _arbitrate(self, slot: ControllerSlot, now: float):
+        owner = self.owner
+        if owner is None or owner is slot:
+            self._set_owner(slot)
+        elif slot.priority > owner.priority:
+            self._set_owner(slot)
+        elif now - owner.last_input > self.takeover_timeout and not self._is_held(owner.state):
+            self._set_owner(slot)
+
+    async def _read(self, slot: ControllerSlot):
+        try:
+            async for ev in slot.device.async_read_loop():
+                if ev.type not in (EV_KEY, EV_ABS):
+                    continue
+                slot.latency.add(time.time() - ev.timestamp())
+                now = time.monotonic()
+                if self._is_deliberate(ev):
+                    slot.last_input = now
+                    self._arbitrate(slot, now)
+                event = InputEvent(time.monotonic_ns(), SRC_EVDEV, ev.type, ev.code, ev.value)
+                if slot is self.owner:
+                    self._push(event)  # self.state is the owner's state
+                else:
+                    slot.state.apply_event(event)
+        except OSError as e:
+            print(f"Controller {slot.name} disconnected: {e}")
+            self.slots.remove(slot)
+            if self.owner is slot:
+                self._set_owner(None)
+
+    def report(self) -> str:
+        lines = []
+        for slot in sorted(self.slots, key=lambda s: -s.priority):
+            marker = "*" if slot is self.owner else " "
+            lines.append(
+                f"{marker} [{slot.priority}] {slot.name}: {slot.latency.count} events, "
+                f"latency {slot.latency.mean * 1e3:.2f} ms avg / {slot.latency.max * 1e3:.2f} ms max"
+            )
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Arbitrate between several xbox controllers")
+    parser.add_argument("--supervisor", help="device path of the supervisor's controller (highest priority)")
+    parser.add_argument("--takeover-timeout", type=float, default=2.0)
+    args = parser.parse_args()
+
+    async def main():
+        arbiter = ControllerArbiter(takeover_timeout=args.takeover_timeout, supervisor=args.supervisor)
+        try:
+            arbiter.start()
+        except FileNotFoundError:
+            print("No controllers found.")
+            return
+        try:
+            while arbiter.running and not arbiter.state.button_b:
+                print(arbiter.make_control_packet(), " " * 8, end="\r")
+                await asyncio.sleep(100e-3)
+        finally:
+            arbiter.stop()
+        print()
+        print(arbiter.report())
+
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""Toggleable performance overlay: loop timing, throughput, parse errors, queue depths and event-loop lag"""
+
+from time import perf_counter
+
+from PySide6 import QtCore, QtGui, QtWidgets
+
+from loop_timing import TickStats
+from metrics import REGISTRY, RateMeter, Registry
+
+
+class PerfHud(QtWidgets.QLabel):
+    def __init__(
+        self,
+        parent: QtWidgets.QWidget,
+        control: TickStats = None,
+        render: TickStats = None,
+        registry: Registry = REGISTRY,
+        interval_ms: int = 500,
+    ):
+        """Overlay drawn over the top-right corner of `parent`. Refreshes every interval_ms while shown."""
+        super().__init__(parent)
+        self.control = control
+        self.render = render
+        self.registry = registry
+        self.rates = RateMeter(registry)
+        self.interval = interval_ms / 1000
+        # event-loop lag: how late our own timer fires
+        self.lag = 0.0
+        self.lag_max = 0.0
+        self._expected = 0.0
+
+        self.setAttribute(QtCore.Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.SystemFont.FixedFont))
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 170); color: #e0e0e0; padding: 6px;")
+        self.setTextFormat(QtCore.Qt.TextFormat.PlainText)
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self.refresh)
+        parent.installEventFilter(self)
+        self.hide()
+
+    def toggle(self, visible: bool = None):
+        self.setVisible(not self.isVisible() if visible is None else visible)
+
+    def showEvent(self, ev):
+        self.rates.update()
+        self.lag_max = 0.0
+        self._expected = perf_counter() + self.interval
+        self._timer.start()
+        self.refresh(measure=False)
+
+    def hideEvent(self, ev):
+        self._timer.stop()
+
+    def eventFilter(self, obj, ev):
+        if obj is self.parent() and ev.type() == QtCore.QEvent.Type.Resize:
+            self._place()
+        return False
+
+    def _place(self):
+        self.adjustSize()
+        self.move(self.parent().width() - self.width() - 8, 8)
+        self.raise_()
+
+    def refresh(self, measure: bool = True):
+        now = perf_counter()
+        if measure:
+            lag = max(0.0, now - self._expected)
+            self.lag += 0.2 * (lag - self.lag)
+            self.lag_max = max(self.lag_max, lag)
+            self._expected = now + self.interval
+            self.rates.update(now)
+        self.setText("\n".join(self.lines()))
+        self._place()
+
+    def lines(self) -> list[str]:
+        rate = self.rates.rates.get
+        out = []
+        if self.control is not None:
+            c = self.control
+            out.append(
+                f"control {c.rate:6.1f} Hz  jitter {c.jitter * 1e3:5.2f} ms (max {c.jitter_max * 1e3:5.2f})"
+                f"  dropped {c.dropped}"
+            )
+        if self.render is not None:
+            out.append(f"render  {self.render.rate:6.1f} fps dropped {self.render.dropped}")
+        out.append(
+            f"TX {rate('serial_tx_frames', 0):6.1f} fr/s {rate('serial_tx_bytes', 0) / 1e3:6.2f} kB/s"
+            f"   RX {rate('rx_messages', 0):6.1f} msg/s {rate('serial_rx_bytes', 0) / 1e3:6.2f} kB/s"
+        )
+        errors = self.registry.counters.get("rx_parse_errors")
+        out.append(
+            f"parse errors {errors.value if errors else 0}   input {rate('input_events', 0):6.1f} ev/s"
+        )
+        keepalives = self.registry.counters.get("control_keepalives")
+        tick = self.registry.histograms.get("control_tick_seconds")
+        if tick is not None and tick.count:
+            out.append(
+                f"tick p99 < {tick.quantile(0.99) * 1e3:g} ms   keepalive resends {keepalives.value if keepalives else 0}"
+            )
+        for name, gauge in self.registry.gauges.items():
+            value = gauge.get()
+            if value is not None:
+                out.append(f"{name} {value}")
+        out.append(f"loop lag {self.lag * 1e3:5.2f} ms (max {self.lag_max * 1e3:5.2f})")
+        return out
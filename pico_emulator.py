@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Stand-in for the Pico on a pseudo-terminal, for running the consoles and rover.py without hardware (POSIX).
+
+Decodes the frames written to it, echoes heartbeats (optionally delayed or dropped, to exercise the link
+monitor), and prints control packets as they change:
+
+    python pico_emulator.py --delay 20 --loss 0.05
+    python rover.py --port /dev/pts/7
+"""
+
+import heapq
+import os
+import pty
+import random
+import selectors
+import time
+import tty
+
+from msgpack import Packer
+
+from link_monitor import is_heartbeat
+from pico_interface import MsgDeframer, WrapMsgPack
+
+
+def run(delay: float = 0.0, loss: float = 0.0, quiet: bool = False):
+    master, slave = pty.openpty()
+    tty.setraw(slave)  # no echo or line editing on the device side
+    print(f"Emulated Pico on {os.ttyname(slave)}")
+    deframer = MsgDeframer()
+    packer = Packer()
+    echoes = []  # heap of (due, frame)
+    last_packet = None
+    sel = selectors.DefaultSelector()
+    sel.register(master, selectors.EVENT_READ)
+    try:
+        while True:
+            timeout = max(0.0, echoes[0][0] - time.monotonic()) if echoes else None
+            if sel.select(timeout):
+                try:
+                    data = os.read(master, 4096)
+                except OSError:  # EIO while nothing has the port open
+                    time.sleep(0.1)
+                    continue
+                for obj in deframer.feed(data):
+                    if is_heartbeat(obj):
+                        if random.random() >= loss:
+                            heapq.heappush(echoes, (time.monotonic() + delay, WrapMsgPack(packer, obj)))
+                    elif obj != last_packet and not quiet:
+                        print(f"RX {obj}")
+                        last_packet = obj
+            now = time.monotonic()
+            while echoes and echoes[0][0] <= now:
+                os.write(master, heapq.heappop(echoes)[1])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sel.close()
+        os.close(master)
+        os.close(slave)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Emulate the Pico's serial link on a pseudo-terminal")
+    parser.add_argument("--delay", type=float, default=0.0, help="heartbeat echo delay, ms")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of heartbeats not echoed")
+    parser.add_argument("--quiet", action="store_true", help="don't print received packets")
+    args = parser.parse_args()
+    run(args.delay / 1000, args.loss, args.quiet)
@@ -1,12 +1,18 @@
+import asyncio
 import logging
+import os
 from asyncio import Queue
+from collections import deque
 from dataclasses import dataclass
-from math import atan, tan
+from math import atan, pi, tan
+from time import perf_counter
 
 import msgpack
-import numpy as np
 import serial
-import serial.tools.list_ports
+
+import metrics
+import profiling
+from flight_recorder import RECORDER
 
 # import crc8
 
@@ -27,10 +33,10 @@ class Rover_Constants:
     STEERCTR_D_MIN: int = 254
     STEERCTR_SCALING: int = 25
     STEERCTR_SCALING2: int = 2
-    STEERANG_MAX_RAD: float = np.pi / 4
-    STEERANG_MIN_RAD: float = 2*np.pi/180   # 1 degree min
+    STEERANG_MAX_RAD: float = pi / 4
+    STEERANG_MIN_RAD: float = 2*pi/180   # 1 degree min
     STEER_RATIO: int = 2
-    RAD2DEG = 180 / np.pi
+    RAD2DEG = 180 / pi
 
 
 RCONST = Rover_Constants()
@@ -53,8 +59,93 @@ RCONST = Rover_Constants()
 
 def WrapMsgPack(packer: msgpack.Packer, data):
     """Wrap the bytes with a start character and length"""
-    bytedata = packer.pack(data)
-    return b"".join((PACKETDELIM, bytes(str(len(bytedata)), "utf-8"), LEN_SEP, bytedata))
+    with profiling.stage("encode"):
+        bytedata = packer.pack(data)
+        frame = b"".join((PACKETDELIM, bytes(str(len(bytedata)), "utf-8"), LEN_SEP, bytedata))
+    metrics.TX_FRAMES_ENCODED.inc()
+    return frame
+
+
+class MsgDeframer:
+    """Splits a serial byte stream into text and msgpack messages framed by WrapMsgPack.
+
+    Partial frames are kept until the rest of the frame arrives."""
+
+    MAX_LEN_DIGITS = 6
+    MAX_TEXT_HOLD = 256  # bytes of unterminated text kept back waiting for the end of the line
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.errors = 0  # frames with a bad length or undecodable payload
+        self._held_newline = False  # buf starts with a "\n" already returned with its text; skipped unless "~" follows
+
+    def feed(self, data: bytes) -> list:
+        """Add received bytes; returns the complete messages: str for text, decoded objects for msgpack frames"""
+        with profiling.stage("parse"):
+            return self._feed(data)
+
+    def _feed(self, data: bytes) -> list:
+        t0 = perf_counter()
+        self.buf += data
+        out = []
+        buf = self.buf
+        pos = 0
+        if self._held_newline and len(buf) > 1:
+            self._held_newline = False
+            if buf[1:2] != PACKETDELIM[1:]:
+                pos = 1  # it ended that line, not a frame delimiter
+        while True:
+            start = buf.find(PACKETDELIM, pos)
+            if start == -1:
+                # flush complete lines of text. Hold back a partial line (unless it's grown long), and a
+                # trailing byte that could be the start of a delimiter
+                held = buf.endswith(PACKETDELIM[:1])
+                limit = len(buf) - 1 if held else len(buf)
+                end = buf.rfind(b"\n", pos, limit) + 1
+                if held and limit > pos:
+                    # the text before a held "\n" is complete either way: return it with its newline, and keep
+                    # the "\n" in case it's also the start of a frame delimiter
+                    out.append(buf[pos:].decode("utf-8", "backslashreplace"))
+                    pos = limit
+                    self._held_newline = True
+                    break
+                if limit - pos > self.MAX_TEXT_HOLD:
+                    end = limit
+                if end > pos:
+                    out.append(buf[pos:end].decode("utf-8", "backslashreplace"))
+                    pos = end
+                break
+            if start > pos:
+                out.append(buf[pos:start].decode("utf-8", "backslashreplace"))
+            len_start = start + len(PACKETDELIM)
+            sep = buf.find(LEN_SEP, len_start, len_start + self.MAX_LEN_DIGITS + 1)
+            if sep == -1:
+                if len(buf) - len_start <= self.MAX_LEN_DIGITS and buf[len_start:].isdigit() or len(buf) == len_start:
+                    pos = start  # length not complete yet
+                    break
+                sep = start  # not a frame after all: the delimiter was just text
+            if sep == start or not buf[len_start:sep].isdigit():
+                self.errors += 1
+                metrics.RX_PARSE_ERRORS.inc()
+                out.append(buf[start:len_start].decode("utf-8", "backslashreplace"))
+                pos = len_start
+                continue
+            mstart = sep + len(LEN_SEP)
+            mend = mstart + int(buf[len_start:sep])
+            if mend > len(buf):
+                pos = start  # payload not complete yet
+                break
+            try:
+                out.append(msgpack.unpackb(buf[mstart:mend]))
+            except Exception:
+                self.errors += 1
+                metrics.RX_PARSE_ERRORS.inc()
+                out.append(bytes(buf[mstart:mend]))
+            pos = mend
+        del buf[:pos]
+        metrics.RX_MESSAGES.inc(len(out))
+        metrics.DEFRAME_SECONDS.observe(perf_counter() - t0)
+        return out
 
 
 # @dataclass
@@ -105,6 +196,7 @@ class PicoSerial:
     def __init__(self, queue: Queue, portname: str = None, baudrate: int = 115200) -> None:
         self.q = queue  # TODO read q
         self.port = None
+        self.session = None  # session_log.SessionLog: all traffic is logged to it if set
         # self.baudrate = baudrate
 
         if portname is None:
@@ -114,6 +206,8 @@ class PicoSerial:
 
     @classmethod
     def find_pico(cls, searchstr="pico"):
+        import serial.tools.list_ports
+
         pico_ports = []
         pico_desc = []
         for portname, desc, hwid in serial.tools.list_ports.comports():
@@ -129,19 +223,102 @@ class PicoSerial:
 
     # TODO: disambiguate
     def write(self, data):
-        print("Writing ", data)
-        self.port.write(data)
+        # print("Writing ", data)  # DEBUG
+        t0 = perf_counter()
+        with profiling.stage("write"):
+            self.port.write(data)
+        metrics.SERIAL_WRITE_SECONDS.observe(perf_counter() - t0)
+        if self.session is not None:
+            self.session.tx(data)
+        metrics.SERIAL_TX_FRAMES.inc()
+        metrics.SERIAL_TX_BYTES.inc(len(data))
 
     def readline(self, *args):
         return self.port.readline(*args)
 
     def read(self, *args):
-        return self.port.read(*args)
+        data = self.port.read(*args)
+        if data:
+            RECORDER.rx(data)
+            if self.session is not None:
+                self.session.rx(data)
+        metrics.SERIAL_RX_BYTES.inc(len(data))
+        return data
 
     def send_control_packet(self, packet: ControlPacket):
         pass
 
 
+class AsyncSerialWriter:
+    """Writes frames to a PicoSerial from an asyncio loop without ever blocking it (POSIX only).
+
+    A frame goes straight to the port if it takes it; otherwise it's queued and written when the port is
+    writable. Only the newest `max_pending` queued frames are kept: an old control packet is worse than none."""
+
+    def __init__(self, pico: PicoSerial, max_pending: int = 4):
+        self.pico = pico
+        self.fd = pico.port.fileno()
+        os.set_blocking(self.fd, False)
+        self.max_pending = max_pending
+        self.pending: deque[bytes] = deque()
+        self.dropped = 0
+        self.error: OSError = None  # last write error, until a write succeeds again
+        self._current: memoryview = None  # frame being written; always finished before the next one
+        self._frame: bytes = None
+        self._loop: asyncio.AbstractEventLoop = None
+
+    def write(self, data: bytes):
+        if self._current is not None:
+            self.pending.append(data)
+            if len(self.pending) > self.max_pending:
+                self.pending.popleft()
+                self.dropped += 1
+                metrics.SERIAL_TX_DROPPED.inc()
+            return
+        self._start(data)
+
+    def _start(self, data: bytes):
+        self._frame = data
+        self._current = memoryview(data)
+        if not self._write_some():
+            self._loop = asyncio.get_running_loop()
+            self._loop.add_writer(self.fd, self._on_writable)
+
+    def _write_some(self) -> bool:
+        """Write what the port takes; returns whether the current frame is done"""
+        with profiling.stage("write"):
+            try:
+                n = os.write(self.fd, self._current)
+            except BlockingIOError:
+                n = 0
+            except OSError as e:  # port gone: drop the frame and keep the control loop running
+                if self.error is None:
+                    print(f"Serial write failed: {e}")
+                self.error = e
+                self.dropped += 1
+                metrics.SERIAL_TX_DROPPED.inc()
+                self._current = None
+                return True
+        self.error = None
+        self._current = self._current[n:]
+        if self._current:
+            return False
+        self._current = None
+        if self.pico.session is not None:
+            self.pico.session.tx(self._frame)
+        metrics.SERIAL_TX_FRAMES.inc()
+        metrics.SERIAL_TX_BYTES.inc(len(self._frame))
+        return True
+
+    def _on_writable(self):
+        while self._write_some():
+            if not self.pending:
+                self._loop.remove_writer(self.fd)
+                return
+            self._frame = self.pending.popleft()
+            self._current = memoryview(self._frame)
+
+
 # def calc_steer_center(joyx, joyy):
 #     d = np.sign(joyx) * RCONST.STEERCTR_D_MIN + RCONST.STEERCTR_SCALING * np.tan(
 #         joyx * np.pi / (2 * RCONST.JOY_MAX) + np.pi / 2
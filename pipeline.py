@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Run the rover as separate processes that exchange the latest state through shared memory (shm_state), so
+input, control and drawing don't share one interpreter's GIL and a stalled GUI can't delay a control packet:
+
+    input    reads the controller and publishes its state          python pipeline.py input --shm NAME
+    control  control loop, serial link & heartbeats                python rover.py --shm NAME
+    gui      plots input, motion & telemetry (read-only)           python shm_viewer.py --shm NAME
+
+Without a role, creates the shared memory, starts all three and stops them together when any one exits:
+
+    python pipeline.py --port auto
+    python pipeline.py --port none --no-gui
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from input_backend import select_backend
+from shm_state import SharedState
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+async def publish_input(shared: SharedState, backend_name: str = None):
+    """Input process: publish the controller state on every event until it disconnects or we're signalled"""
+    backend = select_backend(backend_name)
+    print(f"Input: {backend.name}")
+    loop = asyncio.get_running_loop()
+    for s in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(s, backend.stop)
+    backend.start()
+    shared.write_input(backend.state)
+    try:
+        async for event in backend:
+            shared.write_input(backend.state, event.t_ns)
+    finally:
+        backend.stop()
+        shared.write_input(backend.state, connected=False)  # the control process stops on this
+
+
+def launch(args) -> int:
+    name = f"rover{os.getpid()}"
+    py = sys.executable
+    backend = ["--backend", args.backend] if args.backend else []
+    commands = {
+        "input": [py, os.path.join(HERE, "pipeline.py"), "input", "--shm", name, *backend],
+        "control": [
+            py, os.path.join(HERE, "rover.py"), "--shm", name, "--port", args.port, "--rate", str(args.rate),
+        ],
+    }
+    if not args.no_gui:
+        commands["gui"] = [py, os.path.join(HERE, "shm_viewer.py"), "--shm", name]
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    with SharedState(name, create=True):
+        procs = {role: subprocess.Popen(command) for role, command in commands.items()}
+        try:
+            while not stopping and all(proc.poll() is None for proc in procs.values()):
+                time.sleep(0.2)
+        except KeyboardInterrupt:
+            pass  # the children got the SIGINT too
+        for role, proc in procs.items():
+            if proc.poll() is not None:
+                print(f"{role} process exited ({proc.returncode})")
+            else:
+                proc.send_signal(signal.SIGINT)
+        for role, proc in procs.items():
+            try:
+                proc.wait(timeout=3)
+            except subprocess.TimeoutExpired:
+                print(f"{role} process didn't stop, killing it")
+                proc.kill()
+                proc.wait()
+    return procs["control"].returncode
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run input, control and GUI as separate processes")
+    parser.add_argument("role", nargs="?", choices=["input"], help="run one process of a running pipeline")
+    parser.add_argument("--shm", metavar="NAME", help="pipeline to join (with a role)")
+    parser.add_argument("--backend", help="input backend (default: best available)")
+    parser.add_argument("--port", default="auto", help="Pico serial port, 'auto' to search or 'none' (default: auto)")
+    parser.add_argument("--rate", type=float, default=100, help="control tick rate, Hz (default: 100)")
+    parser.add_argument("--no-gui", action="store_true", help="don't start the GUI process")
+    args = parser.parse_args()
+
+    if args.role == "input":
+        if not args.shm:
+            parser.error("input needs --shm NAME")
+        shared = SharedState(args.shm)
+        try:
+            asyncio.run(publish_input(shared, args.backend))
+        finally:
+            shared.close()
+    else:
+        sys.exit(launch(args))
@@ -0,0 +1,170 @@
+"""Scrolling live-data plot backed by a single 2D circular buffer.
+
+Each sample is written twice, at i and i + capacity, so the latest `capacity` samples of every channel are
+always one contiguous slice of the buffer. Scrolling is done by moving that slice rather than the x axis, so
+pyqtgraph gets zero-copy views and the view range never needs to be reset.
+
+Every sample also goes into a HistoryStore; zooming out past the ring (or pausing to scroll back) draws from
+the history level that matches the visible span instead.
+"""
+
+from math import ceil, floor
+
+import numpy as np
+import pyqtgraph as pg
+from pyqtgraph import PlotDataItem, PlotWidget
+
+from history_store import HistoryStore
+
+
+class RingBuffer2D:
+    def __init__(self, channels: int = 0, capacity: int = 1000, dtype=np.float64):
+        self.capacity = capacity
+        self.count = 0  # total samples pushed
+        self._buf = np.zeros((channels, 2 * capacity), dtype=dtype)
+
+    @property
+    def channels(self) -> int:
+        return self._buf.shape[0]
+
+    def add_channels(self, n: int):
+        """Add n zero-filled channels"""
+        self._buf = np.vstack((self._buf, np.zeros((n, self._buf.shape[1]), dtype=self._buf.dtype)))
+
+    def push(self, samples):
+        """Append one sample per channel"""
+        idx = self.count % self.capacity
+        self._buf[:, idx] = samples
+        self._buf[:, idx + self.capacity] = samples
+        self.count += 1
+
+    def push_block(self, block: np.ndarray):
+        """Append several samples at once; block has shape (channels, n)"""
+        n = block.shape[1]
+        if n > self.capacity:
+            block = block[:, -self.capacity :]
+            self.count += n - self.capacity
+            n = self.capacity
+        idx = (self.count + np.arange(n)) % self.capacity
+        self._buf[:, idx] = block
+        self._buf[:, idx + self.capacity] = block
+        self.count += n
+
+    def _start(self) -> int:
+        return self.count % self.capacity
+
+    def view(self, channel: int) -> np.ndarray:
+        """Latest `capacity` samples of a channel, oldest first. A contiguous view - don't write to it."""
+        start = self._start()
+        return self._buf[channel, start : start + self.capacity]
+
+    def views(self) -> np.ndarray:
+        """Latest `capacity` samples of all channels, shape (channels, capacity). Each row is contiguous."""
+        start = self._start()
+        return self._buf[:, start : start + self.capacity]
+
+    def latest(self) -> np.ndarray:
+        return self._buf[:, self._start() + self.capacity - 1]
+
+
+class PlotEngine:
+    """Draws any number of channels from a RingBuffer2D onto a PlotWidget, scrolling right to left.
+
+    push() only stores samples; render() hands the lines their new views, and only if something changed.
+    The x axis is "samples ago" (0 = newest, or the newest sample when paused) so the view range is set once,
+    not every tick."""
+
+    def __init__(
+        self,
+        plot: PlotWidget,
+        capacity: int = 1000,
+        visible: int = 150,
+        colormap: str = "CET-C2",
+        history: bool = True,
+        spill_dir: str = None,
+        max_points: int = 2000,
+    ):
+        self.plot = plot
+        self.ring = RingBuffer2D(0, capacity)
+        self.lines: list[PlotDataItem] = []
+        self.legend = plot.addLegend()
+        self.cmap = pg.colormap.get(colormap)
+        self.x = np.arange(-capacity + 1, 1, dtype=np.float64)
+        self._dirty = False
+
+        self.use_history = history
+        self.spill_dir = spill_dir
+        self.max_points = max_points  # history is decimated to about this many buckets per line
+        self.history: HistoryStore = None  # created on the first sample, once the channel count is known
+        self.names = []
+        self.paused = False
+        self._anchor = 0  # sample index drawn at x = 0 while paused
+
+        plot.setDownsampling(mode="peak")
+        plot.setClipToView(True)
+        plot.getViewBox().sigXRangeChanged.connect(self._range_changed)
+        self.set_visible(visible)
+
+    def _range_changed(self, *args):
+        self._dirty = True
+
+    def set_paused(self, paused: bool):
+        """Freeze the plot (new samples are still recorded) so the history can be scrolled"""
+        self.paused = paused
+        self._anchor = self.ring.count - 1
+        self._dirty = True
+
+    def set_visible(self, samples: int):
+        self.plot.setXRange(-samples, 0, padding=0.05)
+
+    def _add_lines(self, n: int):
+        self.ring.add_channels(n)
+        if self.use_history:
+            if self.history is not None:
+                print("Plot channels changed, restarting history")
+                self.history.close()
+            self.history = HistoryStore(self.ring.channels, spill_dir=self.spill_dir, names=self.names)
+        colors = self.cmap.getLookupTable(nPts=max(6, self.ring.channels))
+        for idx in range(len(self.lines), self.ring.channels):
+            self.lines.append(self.plot.plot(self.x, self.ring.view(idx), pen=colors[idx], name=f"Data {idx}"))
+
+    def push(self, *samples):
+        if len(samples) > self.ring.channels:
+            self._add_lines(len(samples) - self.ring.channels)
+        elif len(samples) < self.ring.channels:  # missing channels repeat their last value
+            samples = (*samples, *self.ring.latest()[len(samples) :])
+        self.ring.push(samples)
+        if self.history is not None:
+            self.history.push(samples)
+        if not self.paused:
+            self._dirty = True
+
+    def render(self) -> bool:
+        """Update the plot lines if new samples arrived or the view moved. Returns whether anything was drawn."""
+        if not self._dirty:
+            return False
+        self._dirty = False
+        lo, hi = self.plot.getViewBox().viewRange()[0]
+        if self.history is None or not self.paused and lo >= -self.ring.capacity:
+            for idx, line in enumerate(self.lines):
+                line.setData(self.x, self.ring.view(idx), skipFiniteCheck=True)
+            return True
+
+        newest = self._anchor if self.paused else self.ring.count - 1
+        x, y = self.history.window(newest + floor(lo), newest + ceil(hi) + 1, self.max_points)
+        x -= newest
+        for idx, line in enumerate(self.lines):
+            line.setData(x, y[idx], skipFiniteCheck=True)
+        return True
+
+    def close(self):
+        if self.history is not None:
+            self.history.close()
+
+    def set_names(self, names_list):
+        self.names = list(names_list)
+        if self.history is not None:
+            self.history.names = self.names
+        self.legend.clear()
+        for idx, name in enumerate(names_list[: len(self.lines)]):
+            self.legend.addItem(self.lines[idx], name)
@@ -0,0 +1,203 @@
+"""Opt-in profiling for the entry points (--profile).
+
+Stage timers: pipeline code wraps its stages in `with profiling.stage("encode"):`. Until enable() is called,
+stage() hands back a shared no-op context manager, so the timers cost next to nothing in normal runs.
+
+Sampling profiler: with profiling enabled, SIGUSR1 starts/stops a thread that samples every thread's Python
+stack. On stop, the samples are written as collapsed stacks ("thread;module:func;... count", one per line),
+ready for flamegraph.pl, speedscope or inferno. At exit, the per-stage breakdown is printed and saved too.
+
+    kill -USR1 <pid>    # start sampling
+    kill -USR1 <pid>    # stop & write profile-<time>.folded
+"""
+
+import atexit
+import os
+import signal
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from time import perf_counter_ns
+
+# pipeline stages, in pipeline order; the report lists these first
+STAGES = ("input", "packet", "kinematics", "encode", "write", "parse", "render")
+
+ENABLED = False
+_NULL = nullcontext()
+_stats: dict[str, "StageStats"] = {}
+_start_ns = 0
+_output_dir = "."
+_sampler: "Sampler" = None
+
+
+class StageStats:
+    __slots__ = ("name", "count", "total_ns", "max_ns")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, ns: int):
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+
+class _StageTimer:
+    __slots__ = ("stats", "start")
+
+    def __init__(self, stats: StageStats):
+        self.stats = stats
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+
+    def __exit__(self, *exc):
+        self.stats.add(perf_counter_ns() - self.start)
+
+
+def stage(name: str):
+    """Context manager timing one run of a pipeline stage (a no-op unless profiling is enabled)"""
+    if not ENABLED:
+        return _NULL
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats.setdefault(name, StageStats(name))
+    return _StageTimer(stats)
+
+
+def report() -> str:
+    """Per-stage breakdown: runs, total, mean & max time, and share of the wall time since enable()"""
+    wall = max(perf_counter_ns() - _start_ns, 1)
+    names = [s for s in STAGES if s in _stats] + sorted(s for s in _stats if s not in STAGES)
+    lines = [f"{'stage':<12}{'runs':>9}{'total ms':>11}{'mean us':>10}{'max us':>10}{'% wall':>8}"]
+    for name in names:
+        s = _stats[name]
+        lines.append(
+            f"{name:<12}{s.count:>9}{s.total_ns / 1e6:>11.1f}{s.total_ns / max(s.count, 1) / 1e3:>10.1f}"
+            f"{s.max_ns / 1e3:>10.1f}{100 * s.total_ns / wall:>8.2f}"
+        )
+    lines.append(f"wall time {wall / 1e9:.1f} s")
+    return "\n".join(lines)
+
+
+class Sampler:
+    """Samples the Python stacks of all threads from a background thread"""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.stacks: dict[str, int] = {}  # collapsed stack -> samples
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                funcs = []
+                while frame is not None:
+                    code = frame.f_code
+                    funcs.append(f"{os.path.splitext(os.path.basename(code.co_filename))[0]}:{code.co_name}")
+                    frame = frame.f_back
+                funcs.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(funcs))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+
+def start_sampling(interval: float = 0.001):
+    global _sampler
+    if _sampler is not None and _sampler.running:
+        return
+    _sampler = Sampler(interval)
+    _sampler.start()
+    print(f"profiling: sampling every {interval * 1e3:g} ms", file=sys.stderr)
+
+
+def stop_sampling() -> str:
+    """Stop the sampler and write its collapsed stacks; returns the file's path"""
+    global _sampler
+    if _sampler is None:
+        return None
+    _sampler.stop()
+    path = os.path.join(_output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+    _sampler.write(path)
+    print(f"profiling: {_sampler.samples} samples -> {path}", file=sys.stderr)
+    _sampler = None
+    return path
+
+
+def toggle_sampling(*_):
+    if _sampler is not None and _sampler.running:
+        stop_sampling()
+    else:
+        start_sampling()
+
+
+def enable(output_dir: str = "."):
+    """Turn on the stage timers, toggle sampling on SIGUSR1, and report at exit"""
+    global ENABLED, _start_ns, _output_dir
+    if ENABLED:
+        return
+    ENABLED = True
+    _start_ns = perf_counter_ns()
+    _output_dir = output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    if hasattr(signal, "SIGUSR1"):  # not on Windows
+        signal.signal(signal.SIGUSR1, toggle_sampling)
+        print(f"profiling: kill -USR1 {os.getpid()} to start/stop sampling", file=sys.stderr)
+    atexit.register(finish)
+
+
+def finish():
+    """Stop sampling if it's running; print & save the stage breakdown"""
+    if _sampler is not None:
+        stop_sampling()
+    if not _stats:
+        return
+    text = report()
+    print(text, file=sys.stderr)
+    with open(os.path.join(_output_dir, f"stages-{time.strftime('%Y%m%d-%H%M%S')}.txt"), "w") as f:
+        f.write(text + "\n")
+
+
+def add_argument(parser):
+    """Add --profile [DIR] to an entry point's argparse parser"""
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=".",
+        metavar="DIR",
+        help="time the pipeline stages & sample stacks on SIGUSR1; reports go to DIR (default: .)",
+    )
+
+
+def setup(args):
+    if getattr(args, "profile", None) is not None:
+        enable(args.profile)
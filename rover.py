@@ -1,22 +1,21 @@
 #!/usr/bin/env python3
 
+"""On-board control pipeline: gamepad -> integer control packet -> kinematics -> framed, non-blocking serial TX,
+at a fixed rate with drift correction (see control_runtime.ControlRuntime)."""
+
 import asyncio
-from dataclasses import dataclass
-import math
 import signal
-import sys
 import queue
 import logging
 from logging.handlers import QueueHandler, QueueListener
 
 # import RPi.GPIO as GPIO
-from evdev import InputDevice, ecodes, ff, list_devices
-
-import msgpack
-from io import BytesIO
 
-from gamepad import Gamepad
-from pico_interface import PicoSerial, ControlPacket
+import metrics
+from control_runtime import ControlFrame, ControlRuntime
+from input_backend import SharedInputBackend, select_backend
+from link_monitor import LinkMonitor
+from pico_interface import AsyncSerialWriter, MsgDeframer, PicoSerial
 
 # import led
 # import led_strip
@@ -25,15 +24,20 @@ from pico_interface import PicoSerial, ControlPacket
 # from soundplayer import SoundPlayer
 
 logQue = queue.Queue(-1)  # no max size; if max size, prep for queue full exception
-log_queue_handler = QueueHandler(logQue)  # accepts logging messages to allow seperate threads
-handler = logging.StreamHandler()  # TODO - wat dis?
-listener = QueueListener(logQue, handler)
 
-root = logging.getLogger()
-root.addHandler(log_queue_handler)
-formatter = logging.Formatter("%(threadName)s: %(message)s")  # LATER
-handler.setFormatter(formatter)
-listener.start()  # starts background logger thread   #TESTME   #TODO: use logQue somewhere
+
+def setup_logging() -> QueueListener:
+    """Route log records through logQue to a background listener thread. Returns the (started) listener."""
+    log_queue_handler = QueueHandler(logQue)  # accepts logging messages to allow seperate threads
+    handler = logging.StreamHandler()  # TODO - wat dis?
+    listener = QueueListener(logQue, handler)
+
+    root = logging.getLogger()
+    root.addHandler(log_queue_handler)
+    formatter = logging.Formatter("%(threadName)s: %(message)s")  # LATER
+    handler.setFormatter(formatter)
+    listener.start()  # starts background logger thread   #TESTME   #TODO: use logQue somewhere
+    return listener
 
 txQueue = queue.Queue(-1)
 rxQueue = queue.Queue(-1)
@@ -60,103 +64,136 @@ head_light_flag = False
 #     # led.green()
 
 
-# TODO: Refactor to move gamepad functions into gamepad.py
-
-
-async def read_gamepad_inputs(remote_control):
+def tick_report(runtime: ControlRuntime) -> str:
+    """Control rate & jitter, plus the tick time, loop lag & input latency percentiles (bucket upper bounds)"""
+    tick = metrics.CONTROL_TICK_SECONDS
+    lag = metrics.LOOP_LAG_SECONDS
+    latency = metrics.INPUT_LATENCY_SECONDS
+    return (
+        f"control {runtime.stats.summary()}\n"
+        f"  tick p50/p99 <{tick.quantile(0.5) * 1e3:g}/{tick.quantile(0.99) * 1e3:g} ms,"
+        f" lag p50/p99 <{lag.quantile(0.5) * 1e3:g}/{lag.quantile(0.99) * 1e3:g} ms,"
+        f" input latency p99 <{latency.quantile(0.99) * 1e3:g} ms,"
+        f" {runtime.packets_sent} packets ({metrics.SERIAL_TX_DROPPED.value} dropped)"
+    )
+
+
+async def report_ticks(runtime: ControlRuntime, interval: float):
+    while runtime.running:
+        await asyncio.sleep(interval)
+        print(tick_report(runtime))
+
+
+async def main(args):
+    loop = asyncio.get_running_loop()
+    shared = None
+    if args.shm:  # run as the control process of pipeline.py
+        backend = SharedInputBackend(args.shm)
+        shared = backend.shared
+    else:
+        backend = select_backend(args.backend)
+    print(f"Input: {backend.name}")
+
+    tx = link = pico = None
+    if args.port != "none":
+        pico = PicoSerial(logQue, None if args.port == "auto" else args.port)
+        tx = AsyncSerialWriter(pico).write
+        link = LinkMonitor(tx, rate=args.heartbeat_rate)
+        deframer = MsgDeframer()
+
+        def receive():
+            try:
+                data = pico.read(pico.port.in_waiting or 1)
+            except OSError as e:  # port gone; the link monitor notices the missing echoes
+                print(f"Serial read failed: {e}")
+                loop.remove_reader(pico.port.fileno())
+                return
+            for obj in deframer.feed(data):
+                if link.on_message(obj):
+                    continue
+                print(f"~RX:{obj}")
+                if shared is not None:
+                    shared.write_telemetry(link, runtime.packets_sent, obj)
+
+        loop.add_reader(pico.port.fileno(), receive)
+    else:
+        print("No serial port: packets are built but not sent")
+
+    runtime = ControlRuntime(
+        backend, tx=tx, period=1 / args.rate, packet_interval=1 / args.packet_rate, link=link
+    )
+    if shared is not None:
+        def publish(frame):
+            shared.write_control(frame)
+            shared.write_telemetry(link, runtime.packets_sent)  # link state & packet count
+
+        runtime.add_observer(publish)
+
+    for s in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(s, lambda s=s: (print(f"Received exit signal {s.name}..."), runtime.stop()))
+
+    backend.start()
     print("Ready to go!")
-
-    while remote_control.is_connected() and not remote_control.button_b:
-        packet = remote_control.make_control_packet()
-        print(packet)  # DEBUG
-        await asyncio.sleep(50e-3)  # 50ms
-    print("\ndone")
-    return
-
-
-async def removetasks(loop):
-    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
-
-    for task in tasks:
-        # skipping over shielded coro still does not help
-        if task._coro.__name__ == "cant_stop_me":
-            continue
-        task.cancel()
-
-    print("Cancelling outstanding tasks")
-    await asyncio.gather(*tasks, return_exceptions=True)
-    loop.stop()
-
-
-async def shutdown_signal(signal, loop):
-    print(f"Received exit signal {signal.name}...")
-    await removetasks(loop)
-
-
-async def main():
-    # if __name__ == "__main__":
+    control = asyncio.create_task(runtime.run())
+    reporter = asyncio.create_task(report_ticks(runtime, args.stats_interval)) if args.stats_interval else None
     try:
-        loop = asyncio.get_event_loop()
-    except Exception:
-        loop = asyncio.new_event_loop()
-
-    signals = (signal.SIGHUP, signal.SIGTERM, signal.SIGINT)
-
-    remote_control = None
-
-    for s in signals:
-        loop.add_signal_handler(s, lambda s=s: asyncio.create_task(shutdown_signal(s, loop)))
-    try:
-        # setup()
-        remote_control = Gamepad()
-        if not remote_control:
-            print("Please connect an Xbox controller then restart the program!")
-            sys.exit()
-        print("Connected!")
-
-        # tasks = set()#(pad,vibe,readpad))
-        # tasks.add(asyncio.create_task(remote_control.read_gamepad_input()))
-        # tasks.add(asyncio.create_task(remote_control.rumble()))
-        # tasks.add(asyncio.create_task(read_gamepad_inputs()))
-
-        # asyncio.run(remote_control.read_gamepad_input())
-        await asyncio.gather(
-            remote_control.read_gamepad_input(), read_gamepad_inputs(remote_control)
-        )
-        # FIXME - shutdown after read input exit
-
-        # for task in tasks:
-        #     task.add_done_callback(tasks.discard)
-        # try:
-        #     async with asyncio.TaskGroup() as tg:
-        #         t1 = tg.create_task(asyncio.create_task(remote_control.read_gamepad_input()))
-        #         # t2 = tg.create_task(asyncio.create_task(remote_control.rumble()))
-        #         t3 = tg.create_task(asyncio.create_task(read_gamepad_inputs()))
-        #     print('done with tasks')
-        # except Exception as e:
-        #     print('~caught exception:')
-        #     raise e
-
-        # tasks = [remote_control.read_gamepad_input(), remote_control.rumble(), read_gamepad_inputs()]
-
-    except Exception as e:
-        print(f"Error occured: {e}")
+        while not control.done():
+            if not backend.running or backend.state.button_b:  # disconnected, or B to quit
+                runtime.stop()
+            await asyncio.wait({control}, timeout=0.1)
+        await control
     finally:
-        if remote_control:
-            remote_control.listening = False
-            remote_control.erase_rumble()
-
-        print("Closing async loop..")
-
-        try:
-            pending = asyncio.all_tasks()
-            loop.run_until_complete(asyncio.gather(*pending))
-        except Exception:
-            print("No tasks to close")
+        runtime.stop()
+        if reporter is not None:
+            reporter.cancel()
+        backend.stop()
+        if pico is not None:
+            loop.remove_reader(pico.port.fileno())
+        if tx is not None and runtime.packets_sent:
+            runtime.frame = ControlFrame()  # leave the rover stopped: neutral packet
+            runtime.send(force=True)
+            await asyncio.sleep(0.05)
+        print(tick_report(runtime))
+        if link is not None:
+            print(f"link {link.state}: {link.stats.summary()}")
+        if shared is not None:
+            shared.close()
         print("Done..")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    import argparse
+
+    import flight_recorder
+    import profiling
+
+    parser = argparse.ArgumentParser(description="Drive the rover from a gamepad connected to the Pi")
+    parser.add_argument("--port", default="auto", help="Pico serial port, 'auto' to search or 'none' (default: auto)")
+    parser.add_argument("--backend", help="input backend (default: best available)")
+    parser.add_argument("--shm", metavar="NAME", help="take input from, and publish state to, pipeline.py's shared memory")
+    parser.add_argument("--rate", type=float, default=100, help="control tick rate, Hz (default: 100)")
+    parser.add_argument("--packet-rate", type=float, default=40, help="max control packet rate, Hz (default: 40)")
+    parser.add_argument(
+        "--stats-interval", type=float, default=10, help="print tick timing every N s, 0 to disable (default: 10)"
+    )
+    parser.add_argument("--heartbeat-rate", type=float, default=5, help="link heartbeats per second (default: 5)")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this localhost port")
+    parser.add_argument("--metrics-file", help="rewrite this file with the metrics every 10 s (.prom or .json)")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+    flight_recorder.install()
+
+    if args.metrics_port:
+        metrics.serve_http(args.metrics_port)
+    dump = metrics.FileDump(args.metrics_file) if args.metrics_file else None
+
+    listener = setup_logging()
+    try:
+        asyncio.run(main(args))
+    finally:
+        listener.stop()
+        if dump is not None:
+            dump.stop()
     # serial_test()
     # serial_test_msgpack()
@@ -0,0 +1,135 @@
+"""Rover motion display: chassis, wheel vectors, wheel speeds and steering center drawn as one graphics item.
+
+All shapes are QPainterPaths built once and placed with painter transforms, and the item only repaints when
+the quantized motion vector changes - so holding the sticks still costs nothing per frame.
+"""
+
+from math import isfinite
+
+import pyqtgraph as pg
+from PySide6 import QtCore, QtGui
+
+from pico_interface import RCONST, MotionVector
+
+WHEELS = ("FL", "FR", "BL", "BR")
+
+
+def _arrow_path(length: float, head: float) -> QtGui.QPainterPath:
+    """Unit wheel vector pointing along +Y, tail at the origin"""
+    path = QtGui.QPainterPath()
+    path.moveTo(0, 0)
+    path.lineTo(0, length)
+    path.moveTo(-head / 2, length - head)
+    path.lineTo(0, length)
+    path.lineTo(head / 2, length - head)
+    return path
+
+
+class RoverDisplayItem(pg.GraphicsObject):
+    def __init__(self, speed_scale: float = RCONST.TRIGGER_MAX, speed_step: float = 8, sc_step: float = 2):
+        super().__init__()
+        # speed drawn as a full-length vector
+        self.speed_scale = speed_scale
+        # quantization of speeds & steering center position; smaller changes don't trigger a repaint
+        self.speed_step = speed_step
+        self.sc_step = sc_step
+        self.wheel_pos = {
+            "FL": QtCore.QPointF(-RCONST.SCDX, RCONST.SCDY),
+            "FR": QtCore.QPointF(RCONST.SCDX, RCONST.SCDY),
+            "BL": QtCore.QPointF(-RCONST.SCDX, -RCONST.SCDY),
+            "BR": QtCore.QPointF(RCONST.SCDX, -RCONST.SCDY),
+        }
+        self.vec_len = RCONST.SCDY * 1.2
+        self.min_len = 0.25  # fraction of vec_len drawn at zero speed, so the wheel angle stays visible
+
+        self.chassis = QtGui.QPainterPath()
+        self.chassis.addRect(QtCore.QRectF(-RCONST.SCDX, -RCONST.SCDY, 2 * RCONST.SCDX, 2 * RCONST.SCDY))
+        self.arrow = _arrow_path(1.0, 0.25)
+        self.target = QtGui.QPainterPath()
+        self.target.addEllipse(QtCore.QPointF(0, 0), 1.0, 1.0)
+        self.target.moveTo(-1.6, 0)
+        self.target.lineTo(1.6, 0)
+        self.target.moveTo(0, -1.6)
+        self.target.lineTo(0, 1.6)
+
+        self.chassis_pen = pg.mkPen("w", width=2, cosmetic=True)
+        self.wheel_pen = pg.mkPen((80, 200, 255), width=3, cosmetic=True)
+        self.sc_pen = pg.mkPen((255, 200, 0), width=2, cosmetic=True)
+        self.text_pen = pg.mkPen("w")
+
+        self.angles = (0, 0, 0, 0)
+        self.speeds = (0, 0, 0, 0)
+        self.sc = QtCore.QPointF(0, 0)
+        self.repaints = 0
+        self._key = None
+        self._bounds = QtCore.QRectF()
+        self._update_bounds()
+
+    def set_motion(self, mvec: MotionVector, sc: tuple[float, float]) -> bool:
+        """Show a new motion vector & steering center. Returns False (and does nothing) if nothing visible changed."""
+        angles = (int(mvec.aFL), int(mvec.aFR), int(mvec.aBL), int(mvec.aBR))
+        speeds = tuple(
+            int(round(v / self.speed_step)) for v in (mvec.vFL, mvec.vFR, mvec.vBL, mvec.vBR)
+        )
+        scx, scy = (c if isfinite(c) else 0 for c in sc)
+        sc_q = (int(round(scx / self.sc_step)), int(round(scy / self.sc_step)))
+        key = (angles, speeds, sc_q)
+        if key == self._key:
+            return False
+        self._key = key
+
+        self.angles = angles
+        self.speeds = tuple(s * self.speed_step for s in speeds)
+        if sc_q != (int(round(self.sc.x() / self.sc_step)), int(round(self.sc.y() / self.sc_step))):
+            self.prepareGeometryChange()
+            self.sc = QtCore.QPointF(scx, scy)
+            self._update_bounds()
+        self.update()
+        return True
+
+    def _update_bounds(self):
+        margin = self.vec_len * 1.2
+        body = QtCore.QRectF(
+            -RCONST.SCDX - margin, -RCONST.SCDY - margin, 2 * (RCONST.SCDX + margin), 2 * (RCONST.SCDY + margin)
+        )
+        sc_size = 2 * self.vec_len
+        self._bounds = body.united(QtCore.QRectF(self.sc.x() - sc_size, self.sc.y() - sc_size, 2 * sc_size, 2 * sc_size))
+
+    def boundingRect(self) -> QtCore.QRectF:
+        return self._bounds
+
+    def paint(self, p: QtGui.QPainter, *args):
+        self.repaints += 1
+        p.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
+        p.setPen(self.chassis_pen)
+        p.drawPath(self.chassis)
+
+        p.setPen(self.wheel_pen)
+        for wheel, angle, speed in zip(WHEELS, self.angles, self.speeds):
+            length = self.vec_len * (self.min_len + (1 - self.min_len) * min(1.0, abs(speed) / self.speed_scale))
+            p.save()
+            p.translate(self.wheel_pos[wheel])
+            p.rotate(angle)  # wheel angles are CCW from +Y, same as a rotation in the (y-up) view coordinates
+            p.scale(length, length if speed >= 0 else -length)
+            p.drawPath(self.arrow)
+            p.restore()
+
+        p.setPen(self.sc_pen)
+        p.save()
+        p.translate(self.sc)
+        p.scale(self.vec_len / 4, self.vec_len / 4)
+        p.drawPath(self.target)
+        p.restore()
+
+        # speed labels, drawn in device coordinates so the flipped y axis doesn't mirror the text
+        p.setPen(self.text_pen)
+        to_device = p.transform()
+        p.save()
+        p.resetTransform()
+        metrics = p.fontMetrics()
+        for wheel, speed in zip(WHEELS, self.speeds):
+            text = f"{speed:.0f}"
+            # left wheels get their label on the left
+            dx = -6 - metrics.horizontalAdvance(text) if wheel[1] == "L" else 6
+            p.drawText(to_device.map(self.wheel_pos[wheel]) + QtCore.QPointF(dx, -6), text)
+        p.restore()
@@ -0,0 +1,174 @@
+"""Event-driven force-feedback scheduler for evdev gamepads.
+
+Effects are queued with a priority and played as soon as the scheduler task wakes up - there's no polling.
+A higher-priority effect preempts the one playing; a lower-priority one waits until the device is free.
+Uploaded effects are cached per device, so each distinct effect is uploaded once.
+"""
+
+import asyncio
+import heapq
+import itertools
+from collections import OrderedDict
+from dataclasses import dataclass
+
+# evdev (Linux only) is imported only once there's a device to play on; without one, the scheduler still queues
+# effects (nothing is played)
+
+
+@dataclass(frozen=True)
+class RumbleEffect:
+    strong: int = 0  # strong (low frequency) motor magnitude, 0-0xFFFF
+    weak: int = 0  # weak (high frequency) motor magnitude, 0-0xFFFF
+    duration_ms: int = 200
+    repeat: int = 1
+
+    @property
+    def play_time(self) -> float:
+        """Seconds the device is busy playing this effect"""
+        return self.duration_ms * self.repeat / 1000
+
+
+LIGHT = RumbleEffect(strong=0x0000, weak=0x500, duration_ms=300)
+STRONG = RumbleEffect(strong=0xC000, weak=0x0000, duration_ms=200)
+ALERT = RumbleEffect(strong=0xFFFF, weak=0xFFFF, duration_ms=150, repeat=3)
+
+# Telemetry/link conditions -> (effect, priority). Higher priorities preempt lower ones.
+CONDITIONS = {
+    "connected": (STRONG, 1),
+    "link_degraded": (LIGHT, 5),
+    "overcurrent": (ALERT, 8),
+    "link_lost": (ALERT, 10),
+}
+
+
+class RumbleScheduler:
+    def __init__(self, device=None, max_effects: int = None):
+        self.device = device
+        self.running = False
+        self._queue = []  # heap of (-priority, seq, effect)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._loop: asyncio.AbstractEventLoop = None
+        self._effect_ids: dict[str, OrderedDict] = {}  # device path -> {effect: effect id}, in LRU order
+        self._no_ff: set[str] = set()  # paths of devices that refused an effect upload (no force feedback)
+        self._max_effects = max_effects
+        self._playing_id = None
+        self._playing_priority = 0
+        self._busy_until = 0.0
+
+    def set_device(self, device):
+        """Switch to a (re)connected device. Effect ids are only valid for the fd they were uploaded to."""
+        if self.device is not None:
+            self._effect_ids.pop(self.device.path, None)
+        self.device = device
+        self._playing_id = None
+        self._busy_until = 0.0
+
+    def play(self, effect: RumbleEffect, priority: int = 0):
+        """Queue an effect. Call from the event loop's thread (see play_threadsafe)."""
+        heapq.heappush(self._queue, (-priority, next(self._seq), effect))
+        self._wakeup.set()
+
+    def play_threadsafe(self, effect: RumbleEffect, priority: int = 0):
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self.play, effect, priority)
+
+    def notify(self, condition: str):
+        """Play the effect mapped to a telemetry condition (see CONDITIONS)"""
+        if condition in CONDITIONS:
+            self.play(*CONDITIONS[condition])
+
+    def clear(self):
+        self._queue.clear()
+
+    async def run(self):
+        """Scheduler task: sleeps until an effect is queued, then plays it immediately"""
+        self._loop = asyncio.get_running_loop()
+        self.running = True
+        try:
+            while self.running:
+                if not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                neg_priority, _, effect = self._queue[0]
+                remaining = self._busy_until - self._loop.time()
+                if remaining > 0 and -neg_priority < self._playing_priority:
+                    # busy with a more important effect: wait for it to end, or for something new to arrive
+                    self._wakeup.clear()
+                    timer = self._loop.call_later(remaining, self._wakeup.set)
+                    await self._wakeup.wait()
+                    timer.cancel()
+                    continue
+                heapq.heappop(self._queue)
+                self._start(effect, -neg_priority)
+        finally:
+            self.running = False
+            self._loop = None
+
+    def stop(self):
+        self.running = False
+        self._wakeup.set()
+
+    def _start(self, effect: RumbleEffect, priority: int):
+        self._playing_priority = priority
+        self._busy_until = self._loop.time() + effect.play_time
+        if self.device is None or self.device.path in self._no_ff:
+            return
+        from evdev import ecodes
+
+        try:
+            if self._playing_id is not None:
+                self.device.write(ecodes.EV_FF, self._playing_id, 0)  # stop the preempted effect
+            self._playing_id = self._effect_id(effect)
+            self.device.write(ecodes.EV_FF, self._playing_id, effect.repeat)
+        except OSError as e:
+            print(f"Rumble failed: {e}")
+            self._playing_id = None
+
+    def _effect_id(self, effect: RumbleEffect) -> int:
+        """Return the device's id for the effect, uploading it (and evicting the least recently used) if needed"""
+        cache = self._effect_ids.setdefault(self.device.path, OrderedDict())
+        if effect in cache:
+            cache.move_to_end(effect)
+            return cache[effect]
+
+        max_effects = self._max_effects or getattr(self.device, "ff_effects_count", 0) or 16
+        while len(cache) >= max_effects:
+            _, old_id = cache.popitem(last=False)
+            self.device.erase_effect(old_id)
+
+        from evdev import ecodes, ff
+
+        ff_effect = ff.Effect(
+            ecodes.FF_RUMBLE,
+            -1,
+            0,
+            ff.Trigger(0, 0),
+            ff.Replay(effect.duration_ms, 0),
+            ff.EffectType(ff_rumble_effect=ff.Rumble(strong_magnitude=effect.strong, weak_magnitude=effect.weak)),
+        )
+        cache[effect] = self.device.upload_effect(ff_effect)
+        return cache[effect]
+
+    def preload(self, *effects: RumbleEffect):
+        """Upload effects ahead of time so their first play doesn't pay the upload cost"""
+        if self.device is None or self.device.path in self._no_ff:
+            return
+        try:
+            for effect in effects:
+                self._effect_id(effect)
+        except OSError as e:  # e.g. a pad without force feedback
+            print(f"Rumble unavailable on {self.device.path}: {e}")
+            self._no_ff.add(self.device.path)
+
+    def erase_all(self):
+        if self.device is None:
+            return
+        for effect_id in self._effect_ids.pop(self.device.path, {}).values():
+            try:
+                self.device.erase_effect(effect_id)
+            except OSError:
+                pass
+        self._playing_id = None
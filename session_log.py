@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""Append-only binary session log: serial traffic, decoded messages, control packets and input snapshots.
+
+File layout (little-endian):
+    header: magic "RCSL", version (u16), session start (i64, time.time_ns()), first record time (i64, monotonic ns)
+    records: RECORD_HEADER (payload length u32, type u8, monotonic ns i64) followed by a msgpack payload
+
+The record header alone says how long a record is and what it holds, so the reader can skip records of other
+types without decoding them. Writes are queued and done in batches by a background thread; files rotate by size
+and age, e.g. session-20240501-142301-000.rlog, -001, ...
+"""
+
+import glob
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import msgpack
+
+MAGIC = b"RCSL"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sHqq")
+RECORD_HEADER = struct.Struct("<IBq")  # payload length, type, t_ns
+
+# record types
+TX = 1  # raw bytes written to the Pico
+RX = 2  # raw bytes read from the Pico
+MESSAGE = 3  # decoded RX message (text or msgpack object)
+PACKET = 4  # ControlPacket.to_iter()
+INPUT = 5  # GamepadState.snapshot()
+MOTION = 6  # MotionVector.to_iter()
+LOG = 7  # (level, logger name, message)
+EVENT = 8  # free-form (name, data), e.g. connect/disconnect
+
+TYPE_NAMES = {
+    TX: "tx",
+    RX: "rx",
+    MESSAGE: "message",
+    PACKET: "packet",
+    INPUT: "input",
+    MOTION: "motion",
+    LOG: "log",
+    EVENT: "event",
+}
+TYPES = {name: rtype for rtype, name in TYPE_NAMES.items()}
+
+
+class SessionLog:
+    def __init__(
+        self,
+        directory: str,
+        prefix: str = "session",
+        max_bytes: int = 256 << 20,
+        max_age: float = 3600,
+        flush_interval: float = 0.5,
+        max_pending: int = 100_000,
+    ):
+        """Log to rotating files in `directory`. Records are written within flush_interval seconds; if the writer
+        falls more than max_pending records behind, the oldest queued records are dropped (and counted)."""
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        self.name = f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}"
+        self.part = 0
+        self.path: str = None
+        self.file = None
+        self.file_bytes = 0
+        self.file_opened = 0.0
+        self.records = 0
+        self.dropped = 0
+        self._pending = deque(maxlen=max_pending)
+        self._wake_at = max(1, max_pending // 8)  # queue length that wakes the writer early
+        self._wakeup = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="session-log", daemon=True)
+        self._thread.start()
+
+    # producers: cheap, any thread
+    def log(self, rtype: int, obj, t_ns: int = None):
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append((rtype, time.monotonic_ns() if t_ns is None else t_ns, obj))
+        if len(self._pending) == self._wake_at:
+            self._wakeup.set()
+
+    def tx(self, data: bytes):
+        self.log(TX, bytes(data))
+
+    def rx(self, data: bytes):
+        self.log(RX, bytes(data))
+
+    def message(self, obj):
+        self.log(MESSAGE, obj)
+
+    def packet(self, packet):
+        self.log(PACKET, packet.to_iter())
+
+    def input(self, state):
+        self.log(INPUT, state.snapshot())
+
+    def motion(self, mvec):
+        self.log(MOTION, mvec.to_iter())
+
+    def event(self, name: str, data=None):
+        self.log(EVENT, (name, data))
+
+    # writer thread
+    def _open(self):
+        if self.file is not None:
+            self.file.close()
+        self.path = os.path.join(self.directory, f"{self.name}-{self.part:03d}.rlog")
+        self.part += 1
+        self.file = open(self.path, "wb")
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, time.time_ns(), time.monotonic_ns()))
+        self.file_bytes = FILE_HEADER.size
+        self.file_opened = time.monotonic()
+
+    def _write_pending(self):
+        packer = msgpack.Packer(default=repr)  # anything msgpack can't encode is logged as its repr
+        while self._pending:
+            if (
+                self.file is None
+                or self.file_bytes >= self.max_bytes
+                or time.monotonic() - self.file_opened > self.max_age
+            ):
+                self._open()
+            buf = bytearray()
+            while self._pending and self.file_bytes + len(buf) < self.max_bytes:
+                rtype, t_ns, obj = self._pending.popleft()
+                payload = packer.pack(obj)
+                buf += RECORD_HEADER.pack(len(payload), rtype, t_ns)
+                buf += payload
+                self.records += 1
+            self.file.write(buf)
+            self.file_bytes += len(buf)
+        if self.file is not None:
+            self.file.flush()
+
+    def _run(self):
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._write_pending()
+        self._write_pending()
+
+    def flush(self):
+        """Ask the writer to write what's queued now"""
+        self._wakeup.set()
+
+    def close(self):
+        self._running = False
+        self._wakeup.set()
+        self._thread.join()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SessionLogHandler(logging.Handler):
+    """Send log records to a SessionLog as LOG records"""
+
+    def __init__(self, session: SessionLog, level=logging.NOTSET):
+        super().__init__(level)
+        self.session = session
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.session.log(LOG, (record.levelno, record.name, self.format(record)))
+        except Exception:
+            self.handleError(record)
+
+
+class SessionReader:
+    """Iterates the records of one or more session log files, memory-mapped and lazily"""
+
+    def __init__(self, *paths: str):
+        """Paths can be .rlog files or directories (all their .rlog files, in name order)"""
+        self.paths = []
+        for path in paths:
+            if os.path.isdir(path):
+                self.paths += sorted(glob.glob(os.path.join(path, "*.rlog")))
+            else:
+                self.paths.append(path)
+
+    def records(self, types=None, start_ns: int = None, end_ns: int = None, decode: bool = True):
+        """Yield (type, t_ns, payload). `types` filters by record type (ints or names); skipped records are never
+        decoded. With decode=False the payload is the raw msgpack bytes."""
+        if types is not None:
+            types = {TYPES[t] if isinstance(t, str) else t for t in types}
+        for path in self.paths:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size <= FILE_HEADER.size:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    magic, version, _, _ = FILE_HEADER.unpack_from(mm)
+                    if magic != MAGIC or version != VERSION:
+                        raise ValueError(f"{path}: not a session log (version {VERSION})")
+                    yield from self._scan(mm, types, start_ns, end_ns, decode)
+
+    @staticmethod
+    def _scan(mm: mmap.mmap, types, start_ns, end_ns, decode):
+        pos = FILE_HEADER.size
+        end = len(mm)
+        unpack_header = RECORD_HEADER.unpack_from
+        hsize = RECORD_HEADER.size
+        while pos + hsize <= end:
+            length, rtype, t_ns = unpack_header(mm, pos)
+            start = pos + hsize
+            pos = start + length
+            if pos > end:
+                break  # truncated last record, e.g. the writer was killed
+            if types is not None and rtype not in types:
+                continue
+            if start_ns is not None and t_ns < start_ns or end_ns is not None and t_ns > end_ns:
+                continue
+            payload = mm[start:pos]
+            yield rtype, t_ns, msgpack.unpackb(payload) if decode else payload
+
+    def __iter__(self):
+        return self.records()
+
+    def count(self, types=None) -> dict[str, int]:
+        """Number of records of each type, without decoding any payloads"""
+        counts = {}
+        for rtype, _, _ in self.records(types, decode=False):
+            counts[TYPE_NAMES.get(rtype, rtype)] = counts.get(TYPE_NAMES.get(rtype, rtype), 0) + 1
+        return counts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print or summarize session logs")
+    parser.add_argument("paths", nargs="+", help=".rlog files or directories")
+    parser.add_argument("-t", "--type", action="append", choices=sorted(TYPES), help="only these record types")
+    parser.add_argument("--count", action="store_true", help="count records by type instead of printing them")
+    args = parser.parse_args()
+
+    reader = SessionReader(*args.paths)
+    if args.count:
+        for name, n in reader.count(args.type).items():
+            print(f"{name:>8} {n}")
+    else:
+        t0 = None
+        for rtype, t_ns, payload in reader.records(args.type):
+            t0 = t_ns if t0 is None else t0
+            print(f"{(t_ns - t0) / 1e9:12.6f} {TYPE_NAMES.get(rtype, rtype):>8} {payload}")
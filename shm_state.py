@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Latest-value state shared between processes through multiprocessing.shared_memory, each block behind a seqlock.
+
+A block has one writer and any number of readers. The writer makes the block's sequence number odd, packs the
+payload in place and makes it even again; a reader copies the payload and retries if the number was odd or
+changed meanwhile. Neither side ever waits on the other, so a stalled reader (a busy GUI) can't hold up the
+control loop, and an update is one struct.pack_into - nothing is pickled or queued. Readers only ever see the
+newest value; intermediate ones are skipped. A read that finds the writer stuck mid-write for `Seqlock.stale_after`
+seconds (it died there) raises StaleBlock rather than passing for "no update".
+
+A SharedState is three blocks, "<name>_input", "<name>_control" and "<name>_telemetry":
+    input      gamepad snapshot, written by the input process (pipeline.py)
+    control    packet, motion vector & steering center of the latest control tick, written by rover.py --shm
+    telemetry  link state, RTT, packet count & the latest message from the Pico, written by rover.py --shm
+
+The seqlock relies on the writer's stores becoming visible in program order, which x86 guarantees; on the Pi's
+ARM cores a torn read would need the reordering to outlast the interpreter's gap between the stores.
+"""
+
+import multiprocessing
+import os
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import NamedTuple
+
+import msgpack
+
+import metrics
+from gamepad import GamepadState
+from link_monitor import STATES
+from pico_interface import ControlPacket, MotionVector
+
+SEQ = struct.Struct("<Q")
+
+INPUT_FMT = struct.Struct("<q?6f6?")  # t_ns, connected, GamepadState.snapshot()
+CONTROL_FMT = struct.Struct("<q??iii8f2f")  # t_ns, ControlPacket without s, MotionVector, steering center
+MESSAGE_MAX = 200
+TELEMETRY_FMT = struct.Struct(f"<qBfIIH{MESSAGE_MAX}s")  # t_ns, link state, RTT, rx count, packets, msgpack'd message
+
+SHM_READ_RETRIES = metrics.REGISTRY.counter("shm_read_retries", "seqlock reads retried because of a concurrent write")
+SHM_READ_STALE = metrics.REGISTRY.counter("shm_read_stale", "seqlock reads given up on: the writer died mid-write")
+
+
+class StaleBlock(RuntimeError):
+    """A block's writer left it mid-write (the same odd sequence number) for longer than Seqlock.stale_after"""
+
+
+class Telemetry(NamedTuple):
+    t_ns: int
+    link_state: str
+    rtt: float  # s, EWMA
+    rx_count: int  # messages received so far; `message` is the latest one
+    packets_sent: int
+    message: object
+
+
+_shares_tracker: dict[int, bool] = {}  # pid -> whether that process uses its multiprocessing parent's tracker
+_created: set[tuple[int, str]] = set()  # (pid, name) of the blocks created in this process
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attaching registers the block with this process's resource tracker, which would unlink it when this
+    process exits (Python < 3.13 has no track=False); only the creator should. A multiprocessing child whose
+    parent already ran a tracker shares it, and there the creator's registration must stay."""
+    pid = os.getpid()
+    if pid not in _shares_tracker:  # decide before this process's first attach can start a tracker of its own
+        inherited = getattr(resource_tracker._resource_tracker, "_fd", None) is not None
+        _shares_tracker[pid] = inherited and multiprocessing.parent_process() is not None
+    shm = shared_memory.SharedMemory(name)
+    if not _shares_tracker[pid] and (pid, name) not in _created:  # the creator's own registration must stay
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class Seqlock:
+    stale_after = 0.1  # s a read waits on one odd sequence number before deciding the writer died mid-write
+
+    def __init__(self, name: str, fmt: struct.Struct, create: bool = False):
+        size = SEQ.size + fmt.size
+        if create:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+            _created.add((os.getpid(), name))
+        else:
+            self.shm = _attach(name)
+        self.name = name
+        self.fmt = fmt
+        self._seq_fmt = struct.Struct(SEQ.format + fmt.format[1:])  # odd sequence number + payload in one pack
+        self.owner = create
+        self.buf = self.shm.buf
+        self._seq = SEQ.unpack_from(self.buf)[0] + 1 & ~1  # writer side; continue after a previous writer
+
+    def write(self, *values):
+        """Publish a new value. Only one process may write a given block."""
+        self._seq_fmt.pack_into(self.buf, 0, self._seq + 1, *values)  # fields are stored in order: seq first
+        self._seq += 2
+        SEQ.pack_into(self.buf, 0, self._seq)
+
+    def read(self, last: int = 0):
+        """(seq, values) if the block was written since sequence number `last` (0: ever), otherwise None.
+        Raises StaleBlock if no consistent copy could be read."""
+        buf = self.buf
+        stuck = stuck_since = None  # odd sequence number seen, and since when
+        while True:
+            seq = SEQ.unpack_from(buf)[0]
+            if seq == last:
+                return None
+            if not seq & 1:
+                values = self.fmt.unpack_from(buf, SEQ.size)
+                if SEQ.unpack_from(buf)[0] == seq:
+                    return seq, values
+            elif seq != stuck:  # a live writer moves on; only one that stays mid-write is stale
+                stuck, stuck_since = seq, time.perf_counter()
+            elif time.perf_counter() - stuck_since > self.stale_after:
+                SHM_READ_STALE.inc()
+                raise StaleBlock(f"{self.name}: writer stuck mid-write for {self.stale_after:g} s, it died")
+            SHM_READ_RETRIES.inc()
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            _created.discard((os.getpid(), self.name))
+
+
+class SharedState:
+    def __init__(self, name: str, create: bool = False):
+        """Create (the launcher) or attach to the blocks of pipeline `name`. The creator unlinks them on close()."""
+        self.name = name
+        self.input = Seqlock(f"{name}_input", INPUT_FMT, create)
+        self.control = Seqlock(f"{name}_control", CONTROL_FMT, create)
+        self.telemetry = Seqlock(f"{name}_telemetry", TELEMETRY_FMT, create)
+        self._rx_count = 0
+        self._message = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for block in (self.input, self.control, self.telemetry):
+            block.close()
+
+    # writers
+    def write_input(self, state: GamepadState, t_ns: int = None, connected: bool = True):
+        self.input.write(time.monotonic_ns() if t_ns is None else t_ns, connected, *state.snapshot())
+
+    def write_control(self, frame):
+        """Publish a control_runtime.ControlFrame; cheap enough for a ControlRuntime observer"""
+        p, m = frame.packet, frame.mvec
+        self.control.write(
+            time.monotonic_ns(), p.a, p.b, p.rt, p.ljx, p.ljy, *m.to_iter(), *frame.steer_center
+        )
+
+    def write_telemetry(self, link=None, packets_sent: int = 0, message=None):
+        """Publish the link's state & RTT, and `message` if one was just received"""
+        if message is not None:
+            self._rx_count += 1
+            data = msgpack.packb(message)
+            if len(data) > MESSAGE_MAX:
+                data = msgpack.packb(repr(message)[: MESSAGE_MAX - 5])
+            self._message = data
+        state, rtt = (STATES.index(link.state), link.stats.rtt) if link is not None else (0, 0.0)
+        self.telemetry.write(
+            time.monotonic_ns(), state, rtt, self._rx_count, packets_sent, len(self._message), self._message
+        )
+
+    # readers: each returns (seq, value) if there's something newer than `last`, else None
+    def read_input(self, last: int = 0):
+        """(seq, (t_ns, connected, snapshot))"""
+        update = self.input.read(last)
+        if update is None:
+            return None
+        seq, (t_ns, connected, *snapshot) = update
+        return seq, (t_ns, connected, tuple(snapshot))
+
+    def read_control(self, last: int = 0):
+        """(seq, (t_ns, ControlPacket, MotionVector, steering center))"""
+        update = self.control.read(last)
+        if update is None:
+            return None
+        seq, (t_ns, *values) = update
+        return seq, (t_ns, ControlPacket(*values[:5]), MotionVector(*values[5:13]), tuple(values[13:]))
+
+    def read_telemetry(self, last: int = 0):
+        update = self.telemetry.read(last)
+        if update is None:
+            return None
+        seq, (t_ns, state, rtt, rx_count, packets_sent, length, data) = update
+        message = msgpack.unpackb(data[:length]) if length else None
+        return seq, Telemetry(t_ns, STATES[state], rtt, rx_count, packets_sent, message)
+
+
+if __name__ == "__main__":
+    # measure the update cost, and check a reader in another process never sees a torn value
+    from timeit import repeat
+
+    name = f"shmbench{os.getpid()}"
+
+    def reader(name: str, n: int):
+        shared = SharedState(name)
+        seq = torn = 0
+        while True:
+            update = shared.input.read(seq)
+            if update is None:
+                continue
+            seq, (t_ns, connected, *values) = update
+            if len(set(values[:6])) != 1:  # the writer puts the same number in every axis
+                torn += 1
+            if not connected:
+                break
+        print(f"reader: {SHM_READ_RETRIES.value} retries, {torn} torn reads")
+        shared.close()
+
+    with SharedState(name, create=True) as shared:
+        state = GamepadState()
+        n = 200_000
+        print(f"write_input  {min(repeat(lambda: shared.write_input(state, 0), number=n, repeat=5)) / n * 1e9:6.0f} ns")
+        print(f"read_input   {min(repeat(lambda: shared.read_input(), number=n, repeat=5)) / n * 1e9:6.0f} ns")
+
+        proc = multiprocessing.Process(target=reader, args=(name, n))
+        proc.start()
+        time.sleep(0.5)
+        fields = ("joystick_left_x", "joystick_left_y", "joystick_right_x", "joystick_right_y")
+        for i in range(1_000_000):
+            for field in fields + ("trigger_left", "trigger_right"):
+                setattr(state, field, i)
+            shared.write_input(state)
+        shared.write_input(state, connected=False)
+        proc.join()
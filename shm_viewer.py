@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""GUI process of pipeline.py: plots the shared gamepad state and draws the rover's motion & link telemetry.
+
+It only reads seqlocked shared memory (shm_state), so however long a frame takes, the input and control
+processes never wait for it. Messages from the Pico are shown as they're sampled: when several arrive within a
+frame, only the latest is shown.
+"""
+
+import signal
+import sys
+
+import pyqtgraph as pg
+from PySide6 import QtCore, QtWidgets
+
+from pico_interface import RCONST
+from plot_engine import PlotEngine
+from rover_display import RoverDisplayItem
+from shm_state import SharedState, StaleBlock
+
+
+class ShmViewer(QtWidgets.QWidget):
+    def __init__(self, shared: SharedState, fps: float = 60):
+        super().__init__()
+        self.shared = shared
+        self.setWindowTitle(f"Rover - {shared.name}")
+        self._input_seq = self._control_seq = self._telemetry_seq = 0
+        self._rx_count = 0
+        self._stale = set()  # blocks reported as abandoned mid-write
+        self.snapshot = (0.0,) * 6
+
+        self.status = QtWidgets.QLabel("waiting for the control process")
+        self.dataplot = pg.PlotWidget()
+        self.dataplot.setMinimumWidth(400)
+        self.rdisp = pg.PlotWidget()
+        self.messages = QtWidgets.QPlainTextEdit(readOnly=True)
+        self.messages.setMaximumBlockCount(2000)
+
+        lay = QtWidgets.QVBoxLayout(self)
+        lay.addWidget(self.status)
+        hlay = QtWidgets.QHBoxLayout()
+        hlay.addWidget(self.dataplot)
+        vlay = QtWidgets.QVBoxLayout()
+        vlay.addWidget(self.rdisp)
+        vlay.addWidget(self.messages)
+        hlay.addLayout(vlay)
+        hlay.setStretch(0, 4)
+        hlay.setStretch(1, 3)
+        lay.addLayout(hlay)
+
+        self.plot_engine = PlotEngine(self.dataplot, capacity=1000, visible=150)
+        self.plot_engine.set_names(["ljx", "ljy", "rjx", "rt"])
+        self.rover_item = RoverDisplayItem()
+        self.rdisp.addItem(self.rover_item)
+        self.rdisp.setXRange(min=RCONST.SCDX * -15, max=RCONST.SCDX * 15)
+        self.rdisp.setYRange(min=RCONST.SCDY * -15, max=RCONST.SCDY * 15)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(round(1000 / fps))
+
+    def _read(self, read, last: int):
+        try:
+            return read(last)
+        except StaleBlock as e:
+            if read not in self._stale:  # once: it stays stale until the writer is restarted
+                self._stale.add(read)
+                self.messages.appendPlainText(f" !-- {e} --!")
+            return None
+
+    def refresh(self):
+        """Sample the shared blocks and draw them"""
+        update = self._read(self.shared.read_input, self._input_seq)
+        if update is not None:
+            self._input_seq, (t_ns, connected, self.snapshot) = update
+        ljx, ljy, rjx, rjy, lt, rt = self.snapshot[:6]
+        self.plot_engine.push(ljx, ljy, rjx, rt)  # one sample a frame: a steady time axis
+
+        update = self._read(self.shared.read_control, self._control_seq)
+        if update is not None:
+            self._control_seq, (t_ns, packet, mvec, steer_center) = update
+            self.rover_item.set_motion(mvec, steer_center)
+
+        update = self._read(self.shared.read_telemetry, self._telemetry_seq)
+        if update is not None:
+            self._telemetry_seq, telemetry = update
+            self.status.setText(
+                f"link {telemetry.link_state}, RTT {telemetry.rtt * 1e3:.1f} ms,"
+                f" {telemetry.packets_sent} packets sent, {telemetry.rx_count} messages received"
+            )
+            if telemetry.rx_count != self._rx_count and telemetry.message is not None:
+                self._rx_count = telemetry.rx_count
+                self.messages.appendPlainText(f"~RX:{telemetry.message}")
+        self.plot_engine.render()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Display a running pipeline.py's shared state")
+    parser.add_argument("--shm", metavar="NAME", required=True, help="pipeline name")
+    parser.add_argument("--fps", type=float, default=60)
+    args, qt_args = parser.parse_known_args()
+
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
+    shared = SharedState(args.shm)
+    for s in (signal.SIGINT, signal.SIGTERM):  # handled on the next frame, when Python runs again
+        signal.signal(s, lambda *_: app.quit())
+    w = ShmViewer(shared, args.fps)
+    w.show()
+    app.exec()
+    w.timer.stop()
+    w.plot_engine.close()
+    shared.close()
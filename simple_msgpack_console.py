@@ -5,31 +5,47 @@
 
 # import ast
 import contextlib
+from dataclasses import replace
 import logging
+import os
 import queue
-import re
+import selectors
+import sys
 import traceback
+from time import perf_counter
 from logging.handlers import (
     QueueHandler,  # LATER -- use & test logs
     QueueListener,
 )
 
-import click
-import msgpack
-from msgpack import OutOfData, Packer, Unpacker
+from msgpack import Packer
 
-from console_input import ThreadedKeyboardInput
-from pico_interface import LEN_SEP, PACKETDELIM, ControlPacket, WrapMsgPack, PicoSerial
+import flight_recorder
+import metrics
+import profiling
+from console_renderer import ConsoleRenderer
+from console_script import parse_script, run_script
+from line_editor import LineEditor
+from session_log import SessionLog, SessionLogHandler
+from tx_scheduler import COMMAND, TxScheduler
+from pico_interface import ControlPacket, MsgDeframer, WrapMsgPack, PicoSerial
 
 logQue = queue.Queue(-1)  # no max size; if max size, prep for queue full exception
-log_queue_handler = QueueHandler(logQue)  # accepts logging messages to allow seperate threads
-handler = logging.StreamHandler()  # TODO - wat dis?
-listener = QueueListener(logQue, handler)
 
-root = logging.getLogger()
-root.addHandler(log_queue_handler)
-formatter = logging.Formatter("%(threadName)s: %(message)s")  # LATER
-handler.setFormatter(formatter)
+
+def setup_logging() -> QueueListener:
+    """Route log records through logQue to a background listener thread. Returns the (started) listener."""
+    log_queue_handler = QueueHandler(logQue)  # accepts logging messages to allow seperate threads
+    handler = logging.StreamHandler()  # TODO - wat dis?
+    listener = QueueListener(logQue, handler)
+
+    root = logging.getLogger()
+    root.addHandler(log_queue_handler)
+    formatter = logging.Formatter("%(threadName)s: %(message)s")  # LATER
+    handler.setFormatter(formatter)
+    listener.start()  # starts background logger thread   #TESTME   #TODO: use logQue somewhere
+    return listener
+
 
 # def logexception(self, msg, /, *args, **kwargs):
 #     """
@@ -39,10 +55,10 @@ handler.setFormatter(formatter)
 #     msg, kwargs = self.process(msg, kwargs)
 #     self.logger.debug(msg, *args, **kwargs)
 
-listener.start()  # starts background logger thread   #TESTME   #TODO: use logQue somewhere
-
 txQueue = queue.Queue(-1)
 rxQueue = queue.Queue(-1)
+metrics.REGISTRY.gauge("tx_queue_depth", "packets waiting in txQueue", txQueue.qsize)
+metrics.REGISTRY.gauge("rx_queue_depth", "messages waiting in rxQueue", rxQueue.qsize)
 
 
 def get_data_packet(
@@ -56,9 +72,7 @@ def get_data_packet(
 
 
 def send_string_packet(packer: Packer, text: str, base_packet: ControlPacket = None):
-    click.echo(f"  Writing {text} into control packet\r")
-    msg = ControlPacket() if base_packet is None else base_packet
-    msg.s = text  # bytes(text, "utf-8")
+    msg = ControlPacket(s=text) if base_packet is None else replace(base_packet, s=text)  # base_packet is shared
     return WrapMsgPack(packer, msg.to_iter())
     # bytemsg = WrapMsgPack(packer, msg.to_iter())
     # click.echo(f'Packed {msg} to\r\n\t{packer.pack(msg.to_iter())} as\r\n\t{bytemsg}')    #DEBUG
@@ -68,131 +82,180 @@ def send_string_packet(packer: Packer, text: str, base_packet: ControlPacket = N
 base_packet = ControlPacket(True, True, 0, 125, 126)
 
 
-def msgpack_console():
+class WakeupPipe:
+    """Self-pipe that makes a selector wait return, e.g. when another thread queues TX data"""
+
+    def __init__(self):
+        self.r, self.w = os.pipe()
+        os.set_blocking(self.r, False)
+        os.set_blocking(self.w, False)
+
+    def fileno(self) -> int:
+        return self.r
+
+    def set(self):
+        with contextlib.suppress(BlockingIOError):  # pipe full: a wakeup is already pending
+            os.write(self.w, b"\0")
+
+    def clear(self):
+        with contextlib.suppress(BlockingIOError):
+            while os.read(self.r, 4096):
+                pass
+
+    def close(self):
+        os.close(self.r)
+        os.close(self.w)
+
+
+tx_wakeup: WakeupPipe = None
+
+
+def queue_tx(data: bytes, cls: int = COMMAND):
+    """Queue a frame for the console to send, with a tx_scheduler priority class. Safe to call from any thread."""
+    txQueue.put((cls, data))
+    if tx_wakeup is not None:
+        tx_wakeup.set()
+
+
+def msgpack_console(portname: str = None, session: SessionLog = None):
+    """Interactive console. Sleeps in one selector wait on the serial port, the keyboard and the TX wakeup
+    pipe, so it uses no CPU when idle and handles RX as soon as it arrives."""
+    global tx_wakeup
     # rx_bytes = bytearray(128)
-    unpacker = Unpacker()
+    deframer = MsgDeframer()
     packer = Packer()
-    PSer = PicoSerial(logQue)
-    kthread = ThreadedKeyboardInput(
-        lambda txt: txQueue.put(send_string_packet(packer, txt, base_packet))
-    )
-    while True:
-        first_print = True
-        with contextlib.suppress(queue.Empty):  # and PSer is not None:
-            for obj in iter(lambda: txQueue.get(block=True, timeout=0.01), None):
-                if obj is None:
-                    continue
-                if first_print:
-                    kthread.toggle_silence()
-                    first_print = False
-                PSer.port.write(obj)
-                click.echo(f">TX: {obj}\r")
-        if not first_print:
-            kthread.toggle_silence()
-
-        # for o in unpacker:
-        #     rxQueue.put(o)
-
+    PSer = PicoSerial(logQue, portname)
+    PSer.session = session
+    editor = LineEditor("> ")
+    out = ConsoleRenderer(editor)
+    tx_wakeup = WakeupPipe()
+
+    def transmit(data: bytes):
+        PSer.write(data)
+        out.write(f">TX: {data}")
+
+    sched = TxScheduler(transmit, PSer.port.baudrate)
+    tx_delay = None
+    sel = selectors.DefaultSelector()
+    sel.register(editor, selectors.EVENT_READ, "keyboard")
+    sel.register(PSer.port.fileno(), selectors.EVENT_READ, "serial")
+    sel.register(tx_wakeup, selectors.EVENT_READ, "tx")
+    with editor:
         try:
-            parse_messages(unpacker, PSer.port.read(PSer.port.in_waiting))
-        except Exception as e:
-            kthread.pause = True
-            print("-" * 78)
-            click.echo(bytes(traceback.format_exc(), "utf-8"), err=True)
-            # print(traceback.format_exc())
-            # click.echo(
-            #     interactive_parse(
-            #         e.__cause__.args[0] if e and e.__cause__ and e.__cause__.args else e
-            #     ),
-            #     err=True,
-            # )
-            # click.echo(click.wrap_text(e,initial_indent="",subsequent_indent="  ",preserve_paragraphs=True))
-            # click.echo(mbytes, err=True)
-            # click.echo("-"*78, err=True)
-
-        obj = None
-        first_print = True  # silence input while printing
-        if rxQueue.qsize() != 0:
-            with contextlib.suppress(queue.Empty):
-                for obj in iter(lambda: rxQueue.get(block=True, timeout=0.01), None):
-                    if obj is None:
-                        break
-                    if first_print:
-                        kthread.toggle_silence()
-                        first_print = False
-                    click.echo(f"~RX({rxQueue.qsize()}):{obj}\r")
-        if not first_print:
-            kthread.toggle_silence()
-        if kthread.exc_info:
-            if isinstance(kthread.exc_info[1], KeyboardInterrupt):
-                print("Exiting Console.")
-                break
-            raise kthread.exc_info[1].with_traceback(kthread.exc_info[2])
-
-
-def isolate_msgpacket(mbytes: bytearray) -> tuple[bytearray, object, int]:
-    """Extract a single message packet from data.
-
-    Returns data prior to the message, the object (if any), and the index of any remaining data (-1 if none)"""
-
-    start_idx = mbytes.find(PACKETDELIM)
-    if start_idx == -1:
-        return (mbytes, None, len(mbytes))
-
-    prefix_data = mbytes[:start_idx]
-    obj = None
-
-    # if there's another message, get its start idx in case of an extraction error.
-    # Otherwise, set fin_idx to end
-    fin_idx = mbytes.find(PACKETDELIM, start_idx + len(PACKETDELIM))
-    if fin_idx == -1:
-        fin_idx = len(mbytes)
-
-    # if LEN_SEP cannot be found, received an invalid packet
-    if mbytes.find(LEN_SEP) < 0:
-        return (mbytes[:fin_idx], None, fin_idx)
-
-    # grab packet length & extract packet
-    len_match = re.search(b"([0-9]+)", mbytes)
-    try:
-        packlen = int(mbytes[len(PACKETDELIM) : len_match.span()[1]])
-    except Exception:
-        # could not cast packet length to int; received invalid packet
-        prefix_data = mbytes[:fin_idx]
-        fin_idx = fin_idx
-    else:
-        mstart = len_match.span()[1] + len(LEN_SEP)
-        obj = mbytes[mstart : mstart + packlen]
-
-    return (prefix_data, obj, fin_idx)
-
-
-def parse_messages(unpacker: Unpacker, mbytes: bytearray):
-    """Isolate string and messagepack messages. Assumes messagepack messages are prepended by TERMSEQ, lengthm and LEN_SEP"""
-    more_packed = True
-    while more_packed:
-        prefix_data, obj, fin_idx = isolate_msgpacket(mbytes)
-
-        if prefix_data:
-            rxQueue.put(prefix_data.decode("utf-8", "backslashreplace"))
-        if obj:
-            unpacker.feed(obj)
-            rxQueue.put(obj)  # DEBUG - put message bytes in RX Queue prior to unpacking
-            obj2 = unpacker.unpack()
-            # rxQueue.put(unpacker.unpack())
-            try:
-                rxQueue.put(obj2)
-            except Exception as e:
-                print(f"Exception while unpacking RX message: {obj}")
-                print(e)
-                with contextlib.suppress(OutOfData):
-                    unpacker.skip()
+            while True:
+                # sleep until there's input, until held-back output may be flushed, or until the link is free
+                # for the next queued frame
+                timeout = min((t for t in (out.time_to_flush(), tx_delay) if t is not None), default=None)
+                for key, _ in sel.select(timeout=timeout):
+                    if key.data == "keyboard":
+                        for line in editor.read():
+                            out.interrupt()
+                            sched.submit_text(line, lambda s: send_string_packet(packer, s, base_packet), COMMAND)
+                            out.write(f"  Writing {line} into control packet")
+                    elif key.data == "serial":
+                        try:
+                            for obj in deframer.feed(PSer.read(max(1, PSer.port.in_waiting))):  # times itself
+                                rxQueue.put(obj)
+                        except Exception as e:
+                            out.write("-" * 78)
+                            out.write(traceback.format_exc())
+                            flight_recorder.dump(f"exception_{type(e).__name__}")
+                            # out.write(
+                            #     interactive_parse(
+                            #         e.__cause__.args[0] if e and e.__cause__ and e.__cause__.args else e
+                            #     ),
+                            # )
+                    else:
+                        tx_wakeup.clear()
+
+                with contextlib.suppress(queue.Empty):
+                    while True:
+                        cls, data = txQueue.get_nowait()
+                        sched.submit(data, cls)
+                tx_delay = sched.pump()
+
+                # for o in unpacker:
+                #     rxQueue.put(o)
+
+                with contextlib.suppress(queue.Empty):
+                    while True:
+                        obj = rxQueue.get_nowait()
+                        if session is not None:
+                            session.message(obj)
+                        out.write(f"~RX:{obj}")
+                out.flush()
+        except (KeyboardInterrupt, EOFError):
+            out.flush(force=True)
+            editor.clear()
+            print(f"TX latency by class:\n{sched.report()}")
+            print("Exiting Console.")
+    sel.close()
+    tx_wakeup.close()
+    tx_wakeup = None
+
+
+def batch_console(lines, portname: str = None, linger: float = 0.5, session: SessionLog = None):
+    """Run a command script (see console_script) against the Pico, showing RX as it arrives, then report the
+    achieved rates. Waits `linger` seconds after the last command for responses."""
+    commands = parse_script(lines, base_packet)
+    deframer = MsgDeframer()
+    PSer = PicoSerial(logQue, portname)
+    PSer.session = session
+    out = ConsoleRenderer()
+    sel = selectors.DefaultSelector()
+    sel.register(PSer.port.fileno(), selectors.EVENT_READ)
+
+    def show_rx(timeout: float):
+        if sel.select(timeout):
+            for obj in deframer.feed(PSer.read(PSer.port.in_waiting)):
                 rxQueue.put(obj)
+        with contextlib.suppress(queue.Empty):
+            while True:
+                obj = rxQueue.get_nowait()
+                if session is not None:
+                    session.message(obj)
+                out.write(f"~RX:{obj}")
+        out.flush()
+
+    stats = run_script(commands, PSer.write, idle=show_rx)
+    end = perf_counter() + linger
+    while (remaining := end - perf_counter()) > 0:
+        show_rx(min(remaining, 0.05))
+    out.flush(force=True)
+    print(stats.report())
+    sel.close()
+    return stats
 
-        if fin_idx != len(mbytes):
-            mbytes = mbytes[fin_idx:]
-        else:
-            return
 
 if __name__ == "__main__":
-    msgpack_console()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="msgpack serial console for the rover's Pico")
+    parser.add_argument("--port", help="serial port (default: search for a Pico)")
+    parser.add_argument(
+        "--script", help="run commands from a file ('-' for stdin) instead of interactively; see console_script"
+    )
+    parser.add_argument("--log", metavar="DIR", help="write a session log of all traffic to DIR")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+    flight_recorder.install()
+
+    listener = setup_logging()
+    session = None
+    if args.log:
+        session = SessionLog(args.log, prefix="console")
+        logging.getLogger().addHandler(SessionLogHandler(session))
+    try:
+        if args.script is not None or not sys.stdin.isatty():
+            if args.script in (None, "-"):
+                batch_console(sys.stdin, args.port, session=session)
+            else:
+                with open(args.script) as f:
+                    batch_console(f, args.port, session=session)
+        else:
+            msgpack_console(args.port, session)
+    finally:
+        listener.stop()
+        if session is not None:
+            session.close()
@@ -21,7 +21,7 @@ def connect(): # asyncronus read-out of events
             if str.lower(device.name) == 'xbox wireless controller':
                 xbox_path = str(device.path)
                 remote_control = gamepad.gamepad(file = xbox_path)
-                remote_control.rumble_effect = 2
+                remote_control.rumbler.notify("connected")
                 return remote_control
         return None
 
@@ -0,0 +1,49 @@
+import io
+
+from console_renderer import ConsoleRenderer
+
+
+def test_repeats_collapse():
+    out = io.StringIO()
+    r = ConsoleRenderer(out=out)
+    for line in ("a", "b", "b", "b", "c"):
+        r.write(line)
+    assert r.flush(force=True)
+    assert out.getvalue() == "a\nb  ×3\nc\n"
+
+
+def test_rate_limit():
+    out = io.StringIO()
+    r = ConsoleRenderer(out=out, max_rate=10)
+    r.write("a")
+    assert r.flush(now=1.0)
+    r.write("b")
+    assert not r.flush(now=1.05)
+    assert r.time_to_flush(now=1.05) > 0
+    assert r.flush(now=1.1)
+    assert out.getvalue() == "a\nb\n"
+
+
+def test_overload_summary():
+    out = io.StringIO()
+    r = ConsoleRenderer(out=out, max_lines=5, summary_tail=2)
+    for i in range(20):
+        r.write(str(i))
+    r.flush(force=True)
+    summary, *tail = out.getvalue().splitlines()
+    assert summary.startswith("… 18 lines skipped")
+    assert tail == ["18", "19"]
+    assert r.total_skipped == 18
+    r.write("next")
+    r.flush(force=True)
+    assert "back to full output (18 lines skipped in total)" in out.getvalue()
+
+
+def test_summary_of_nothing_but_skipped_lines():
+    out = io.StringIO()
+    r = ConsoleRenderer(out=out, max_lines=3, summary_tail=0)
+    for i in range(10):
+        r.write(str(i))
+    assert r.flush(force=True)
+    assert "10 lines skipped" in out.getvalue()
+    assert r.last_line is None
@@ -0,0 +1,53 @@
+import random
+
+from msgpack import Packer
+
+from pico_interface import MsgDeframer, WrapMsgPack
+
+
+def frame(obj) -> bytes:
+    return WrapMsgPack(Packer(), obj)
+
+
+def test_text_and_frames():
+    d = MsgDeframer()
+    assert d.feed(b"hello" + frame([1, 2]) + b"bye\n") == ["hello", [1, 2], "bye\n"]
+
+
+def test_line_returned_without_waiting_for_the_next_read():
+    d = MsgDeframer()
+    assert d.feed(b"hello\n") == ["hello\n"]
+    assert d.feed(b"world\n") == ["world\n"]  # the held "\n" ended "hello"; it doesn't start a frame
+    assert d.feed(frame(7)[1:]) == [7]  # ... unless "~" follows
+
+
+def test_partial_frame_is_kept():
+    d = MsgDeframer()
+    data = frame({"rpm": [1, 2, 3]})
+    assert d.feed(data[:4]) == []
+    assert d.feed(data[4:]) == [{"rpm": [1, 2, 3]}]
+
+
+def test_chunking_doesnt_change_the_messages():
+    rng = random.Random(3)
+    stream = b"".join(
+        frame([i, "x" * rng.randrange(40)]) if rng.random() < 0.5 else b"line %d\n" % i for i in range(200)
+    )
+
+    def decode(chunks) -> list:
+        """The messages, with the text between frames joined. A line before a frame may end with the "\n" that
+        starts the delimiter when the read ended there, so that's stripped."""
+        messages = []
+        d = MsgDeframer()
+        for m in (m for chunk in chunks for m in d.feed(chunk)):
+            if isinstance(m, str) and messages and isinstance(messages[-1], str):
+                messages[-1] += m
+            else:
+                messages.append(m)
+        return [m.rstrip("\n") if isinstance(m, str) else m for m in messages]
+
+    whole = decode([stream])
+    for _ in range(20):
+        cuts = sorted(rng.sample(range(1, len(stream)), 50))
+        chunks = [stream[a:b] for a, b in zip([0] + cuts, cuts + [len(stream)])]
+        assert decode(chunks) == whole
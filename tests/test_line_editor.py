@@ -0,0 +1,35 @@
+import io
+import os
+
+import pytest
+
+from line_editor import LineEditor
+
+
+@pytest.fixture
+def editor():
+    r, w = os.pipe()
+    with os.fdopen(r, "rb", buffering=0) as infile, os.fdopen(w, "wb", buffering=0) as writer:
+        yield LineEditor(infile=infile, outfile=io.StringIO()), writer
+
+
+def test_line_endings(editor):
+    ed, _ = editor
+    assert ed.feed("a\r\nb\nc\rd\r") == ["a", "b", "c", "d"]
+    assert ed.feed("\n\n") == [""]  # the "\r\n" split across reads is one line end; the next "\n" is another
+
+
+def test_crlf_is_not_remembered_across_an_escape(editor):
+    ed, _ = editor
+    assert ed.feed("x\r\x1b[D\n") == ["x", ""]
+
+
+def test_unterminated_last_line_at_eof(editor):
+    ed, writer = editor
+    writer.write(b"one\ntwo")
+    assert ed.read() == ["one"]
+    writer.close()
+    assert ed.read() == ["two"]
+    assert ed.eof
+    with pytest.raises(EOFError):
+        ed.read()
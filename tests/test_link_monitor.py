@@ -0,0 +1,54 @@
+from link_monitor import LinkMonitor
+
+
+def echo_all(link: LinkMonitor, sent: list, now: float):
+    while sent:
+        sent.pop(0)
+        link.on_message(("h", link.seq), now)
+
+
+def test_ok_when_echoes_are_fast():
+    sent = []
+    link = LinkMonitor(sent.append, rate=10)
+    for i in range(10):
+        link.tick(i * 0.1)
+        echo_all(link, sent, i * 0.1 + 0.01)
+    assert link.tick(1.0) == "ok"
+    assert not link.failsafe
+
+
+def test_slow_echoes_trip_the_failsafe():
+    sent = []
+    link = LinkMonitor(sent.append, rate=10, max_rtt=0.1)
+    link.tick(0.0)
+    echo_all(link, sent, 0.3)
+    assert link.tick(0.3) == "degraded"
+    assert link.failsafe
+
+
+def test_silence_trips_the_failsafe_and_an_echo_clears_it():
+    sent = []
+    link = LinkMonitor(sent.append, rate=10, lost_after=1.0)
+    link.tick(0.0)
+    echo_all(link, sent, 0.01)
+    assert link.tick(1.5) == "lost"
+    assert link.failsafe
+    sent.clear()
+    for i in range(20):  # a window's worth of echoes pushes the losses out
+        link.tick(2.0 + i * 0.1)
+        echo_all(link, sent, 2.01 + i * 0.1)
+    assert link.tick(4.0) == "ok"
+    assert not link.failsafe
+
+
+def test_a_link_that_never_echoes_is_lost_after_the_grace_period():
+    link = LinkMonitor(lambda frame: None, rate=10, first_echo_timeout=3.0)
+    assert link.tick(0.0) == "unknown"
+    assert link.tick(2.9) == "unknown"
+    assert link.tick(3.1) == "lost"
+    assert link.failsafe
+
+    untracked = LinkMonitor(lambda frame: None, rate=10, first_echo_timeout=None)
+    untracked.tick(0.0)
+    assert untracked.tick(60.0) == "unknown"
+    assert not untracked.failsafe
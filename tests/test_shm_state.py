@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from gamepad import GamepadState
+from shm_state import SEQ, SharedState, StaleBlock
+
+
+@pytest.fixture
+def shared():
+    with SharedState(f"test{os.getpid()}", create=True) as state:
+        yield state
+
+
+def test_latest_value(shared):
+    assert shared.read_input() is None  # never written
+    state = GamepadState()
+    state.joystick_left_x = 0.5
+    shared.write_input(state, t_ns=1)
+    seq, (t_ns, connected, snapshot) = shared.read_input()
+    assert (t_ns, connected, snapshot) == (1, True, state.snapshot())
+    assert shared.read_input(seq) is None  # nothing newer
+    shared.write_input(state, t_ns=2)
+    shared.write_input(state, t_ns=3)
+    assert shared.read_input(seq)[1][0] == 3
+
+
+def test_reader_attaches_by_name(shared):
+    shared.write_telemetry(message={"rpm": [1, 2]})
+    reader = SharedState(shared.name)
+    try:
+        _, telemetry = reader.read_telemetry()
+        assert telemetry.message == {"rpm": [1, 2]}
+        assert telemetry.rx_count == 1
+    finally:
+        reader.close()
+
+
+def test_writer_dead_mid_write(shared, monkeypatch):
+    shared.write_input(GamepadState())
+    seq = SEQ.unpack_from(shared.input.buf)[0]
+    SEQ.pack_into(shared.input.buf, 0, seq + 1)  # as left by a writer that died inside write()
+    monkeypatch.setattr(shared.input, "stale_after", 0.01)
+    with pytest.raises(StaleBlock):
+        shared.read_input(seq)
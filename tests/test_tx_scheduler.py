@@ -0,0 +1,47 @@
+from tx_scheduler import BULK, COMMAND, CONTROL, SAFETY, TxScheduler
+
+
+def drain(sched: TxScheduler, now: float = 0.0) -> float:
+    while sched.pending():
+        delay = sched.pump(now)
+        now += delay or 0.0
+    return now
+
+
+def test_control_goes_ahead_of_queued_text():
+    out = []
+    sched = TxScheduler(out.append, baudrate=115200, chunk_size=64)
+    sched.submit_chunks(b"x" * 200, BULK, now=0.0)
+    sched.pump(0.0)  # the first chunk goes out, the rest wait for the link
+    sched.submit(b"ctl", CONTROL, now=0.001)
+    sched.pump(0.001)
+    assert out == [b"x" * 64, b"ctl"]
+
+
+def test_newest_control_frame_supersedes_a_queued_one():
+    out = []
+    sched = TxScheduler(out.append)
+    sched.submit(b"a", CONTROL, now=0.0)
+    sched.submit(b"b", CONTROL, now=0.0)
+    sched.submit(b"hb", SAFETY, now=0.0)
+    drain(sched)
+    assert out == [b"hb", b"b"]
+    assert sched.stats[CONTROL].superseded == 1
+
+
+def test_commands_are_never_split():
+    out = []
+    sched = TxScheduler(out.append, chunk_size=64)
+    assert sched.submit_chunks(b"c" * 150, COMMAND) == 1
+    assert sched.submit_text("t" * 150, lambda s: s.encode(), COMMAND) == 1
+    drain(sched)
+    assert out == [b"c" * 150, b"t" * 150]
+
+
+def test_bulk_text_is_chunked():
+    out = []
+    sched = TxScheduler(out.append, chunk_size=64)
+    assert sched.submit_text("é" * 100, lambda s: b"[" + s.encode() + b"]", BULK) == 4
+    drain(sched)
+    assert all(len(frame) <= 64 for frame in out)
+    assert "".join(frame[1:-1].decode() for frame in out) == "é" * 100
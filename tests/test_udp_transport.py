@@ -0,0 +1,131 @@
+"""Base station <-> rover bridge over loopback UDP, with the Pico replaced by a function"""
+
+import asyncio
+import random
+import socket
+import time
+from functools import partial
+
+import udp_transport
+from link_monitor import LinkMonitor, is_heartbeat
+from pico_interface import MsgDeframer
+from tx_scheduler import CONTROL, SAFETY
+from udp_transport import FRAME, HEADER, MAGIC
+
+
+async def open_pair(write, on_message=None, impair=None, **bridge_kwargs):
+    bridge = await udp_transport.open_bridge(("127.0.0.1", 0), write, **bridge_kwargs)
+    rover = bridge.transport.get_extra_info("sockname")
+    base = await udp_transport.open_base_station(rover, on_message, **(impair or {}))
+    return bridge, base
+
+
+def test_control_frames_latest_wins():
+    random.seed(1)
+    forwarded = []
+
+    async def main():
+        bridge, base = await open_pair(forwarded.append, impair=dict(jitter=0.01))
+        for i in range(200):
+            base.send_frame(b"c%d" % i, CONTROL)
+            if i % 10 == 0:
+                base.send_frame(b"s%d" % i, SAFETY)
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.1)
+        base.close()
+        bridge.close()
+        return bridge
+
+    bridge = asyncio.run(main())
+    control = [int(f[1:]) for f in forwarded if f.startswith(b"c")]
+    safety = sorted(int(f[1:]) for f in forwarded if f.startswith(b"s"))
+    assert control == sorted(set(control))  # never an older control frame after a newer one
+    assert control[-1] == 199
+    assert bridge.stats.superseded == 200 - len(control) > 0
+    assert safety == list(range(0, 200, 10))  # heartbeats are never superseded
+
+
+def test_heartbeat_echoes():
+    deframer = MsgDeframer()
+
+    async def main():
+        def pico_write(frame):
+            for obj in deframer.feed(frame):
+                if is_heartbeat(obj):
+                    bridge.send_telemetry(obj)
+
+        link = None
+        bridge, base = await open_pair(pico_write, lambda obj: link.on_message(obj))
+        link = LinkMonitor(partial(base.send_frame, cls=SAFETY), rate=50)
+        for _ in range(30):
+            link.tick()
+            await asyncio.sleep(0.01)
+        base.close()
+        bridge.close()
+        return link
+
+    link = asyncio.run(main())
+    assert link.stats.echoed >= 10
+    assert link.stats.lost == 0
+    assert link.state == "ok"
+
+
+def test_stream_stats_under_impairment():
+    random.seed(2)
+    arrivals = []  # seqs in the order the bridge forwarded them: every frame is sent with the seq as payload
+
+    async def main():
+        bridge, base = await open_pair(lambda f: arrivals.append(int(f)), impair=dict(loss=0.2, jitter=0.005))
+        for i in range(300):
+            base.send_frame(b"%d" % i, SAFETY)
+            await asyncio.sleep(0.0005)
+        await asyncio.sleep(0.05)
+
+        # replay the newest datagram: a duplicate, which must not be forwarded again
+        newest = max(arrivals)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            header = HEADER.pack(MAGIC, FRAME, SAFETY, newest, time.time_ns())
+            sock.sendto(header + b"%d" % newest, bridge.transport.get_extra_info("sockname"))
+        await asyncio.sleep(0.05)
+        base.close()
+        bridge.close()
+        return bridge.stats
+
+    stats = asyncio.run(main())
+    received = sorted(arrivals)
+    assert len(received) == len(set(received)) == stats.received
+    assert 0.6 * 300 < stats.received < 0.95 * 300
+    assert stats.lost == (received[-1] - received[0] + 1) - len(received)
+    newest = -1
+    reordered = 0
+    for seq in arrivals:
+        if seq < newest:
+            reordered += 1
+        newest = max(newest, seq)
+    assert stats.reordered == reordered > 0
+    assert stats.duplicates == 1
+
+
+def test_bridge_failsafe():
+    writes = []
+
+    async def main():
+        bridge, base = await open_pair(writes.append, failsafe_after=0.1)
+        runner = asyncio.create_task(bridge.run(stats_interval=0.05, check_interval=0.02))
+        base.send_frame(b"go", CONTROL)
+        await asyncio.sleep(0.3)
+        tripped = bridge.failsafe
+        writes_while_quiet = list(writes)
+        base.send_frame(b"again", CONTROL)
+        await asyncio.sleep(0.05)
+        runner.cancel()
+        base.close()
+        bridge.close()
+        return bridge, base, tripped, writes_while_quiet
+
+    bridge, base, tripped, writes_while_quiet = asyncio.run(main())
+    assert tripped
+    assert writes_while_quiet == [b"go", bridge.neutral_frame]  # sent once, not every check
+    assert not bridge.failsafe
+    assert writes[-1] == b"again"
+    assert base.remote_stats is not None and base.remote_stats["received"] >= 1
@@ -0,0 +1,127 @@
+"""Priority TX scheduler for the Pico serial link.
+
+Frames are queued by class: safety (heartbeats, failsafe) > control (ControlPackets) > commands > bulk text.
+Safety and control frames are written as soon as they're submitted. Commands and bulk text only go out while the
+link is idle, estimated from the bytes already written and the baud rate, so nothing low-priority piles up in
+the OS/driver buffer ahead of a control frame.
+
+A command is always sent as one unit: the Pico has no reassembly, so a command split around a control frame (which
+starts with "\n~") would arrive cut in two. A control frame can therefore wait one command's transmit time. Only
+bulk data is split into chunks of at most `chunk_size` bytes, so behind bulk a control frame waits for at most one
+chunk (~5.6 ms for 64 bytes at 115200 baud). Bulk data must be a stream whose receiver concatenates the pieces
+and doesn't treat a frame boundary as the end of a line.
+
+Only the newest queued control frame is kept: a newer packet supersedes one that hasn't gone out yet.
+Per-class queueing latency (submit -> handed to the port) is kept in metrics histograms.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable
+
+import metrics
+
+SAFETY, CONTROL, COMMAND, BULK = range(4)
+CLASS_NAMES = ("safety", "control", "command", "bulk")
+
+
+@dataclass
+class ClassStats:
+    name: str
+    latency: metrics.Histogram
+    sent: int = 0
+    bytes: int = 0
+    superseded: int = 0  # control frames replaced by a newer one before they were sent
+    latency_max: float = 0.0
+
+    def summary(self) -> str:
+        if not self.sent:
+            return f"{self.name:8} -"
+        return (
+            f"{self.name:8} {self.sent} frames, {self.bytes} bytes, latency p50 <{self.latency.quantile(0.5) * 1e3:g}"
+            f" p99 <{self.latency.quantile(0.99) * 1e3:g} max {self.latency_max * 1e3:.2f} ms"
+            + (f", {self.superseded} superseded" if self.superseded else "")
+        )
+
+
+class TxScheduler:
+    def __init__(self, write: Callable[[bytes], object], baudrate: int = 115200, chunk_size: int = 64):
+        """write(data) hands a frame to the port and must not block for long. Call pump() after submitting and
+        again when the delay it returns has passed."""
+        self.write = write
+        self.byte_time = 10 / baudrate  # 8N1: 10 bits a byte
+        self.chunk_size = chunk_size
+        self.queues: list[deque] = [deque() for _ in CLASS_NAMES]  # (submit time, frame)
+        self.stats = [
+            ClassStats(name, metrics.REGISTRY.histogram(f"tx_latency_{name}_seconds", f"{name} frame queueing delay"))
+            for name in CLASS_NAMES
+        ]
+        self._busy_until = 0.0  # when the link will have sent everything written so far (estimate)
+        metrics.REGISTRY.gauge("tx_queued", "frames waiting in the TX scheduler", lambda: sum(map(len, self.queues)))
+
+    def submit(self, data: bytes, cls: int = COMMAND, now: float = None):
+        if now is None:
+            now = perf_counter()
+        queue = self.queues[cls]
+        if cls == CONTROL and queue:
+            queue.clear()  # a newer packet makes the queued one worthless
+            self.stats[cls].superseded += 1
+        queue.append((now, bytes(data)))
+
+    def submit_chunks(self, data: bytes, cls: int = BULK, now: float = None) -> int:
+        """Queue raw bytes (unframed text), as pieces of at most chunk_size bytes if they're bulk data; returns the
+        number of pieces"""
+        if cls != BULK:
+            self.submit(data, cls, now)
+            return 1
+        pieces = [data[i : i + self.chunk_size] for i in range(0, len(data), self.chunk_size)]
+        for piece in pieces:
+            self.submit(piece, cls, now)
+        return len(pieces)
+
+    def submit_text(self, text: str, frame: Callable[[str], bytes], cls: int = BULK, now: float = None) -> int:
+        """Queue text as frame(text), or for bulk text as frame(piece) frames of at most chunk_size bytes each;
+        returns the number of frames"""
+        if cls != BULK:
+            self.submit(frame(text), cls, now)
+            return 1
+        room = max(1, self.chunk_size - len(frame("")))
+        pieces = []
+        while text:
+            piece = text[:room]
+            while len(piece.encode()) > room and len(piece) > 1:  # multi-byte characters
+                piece = piece[:-1]
+            pieces.append(piece)
+            text = text[len(piece) :]
+        for piece in pieces or [""]:
+            self.submit(frame(piece), cls, now)
+        return len(pieces) or 1
+
+    def pump(self, now: float = None) -> float:
+        """Write what may go out now. Returns seconds until low-priority frames can continue, or None if
+        nothing is queued."""
+        if now is None:
+            now = perf_counter()
+        for cls, queue in enumerate(self.queues):
+            while queue:
+                backlog = self._busy_until - now
+                if cls > CONTROL and backlog > 0:
+                    return backlog  # wait for the link to go idle
+                submitted, data = queue.popleft()
+                self.write(data)
+                self._busy_until = max(self._busy_until, now) + len(data) * self.byte_time
+                latency = now - submitted
+                stats = self.stats[cls]
+                stats.sent += 1
+                stats.bytes += len(data)
+                stats.latency.observe(latency)
+                if latency > stats.latency_max:
+                    stats.latency_max = latency
+        return None
+
+    def pending(self) -> int:
+        return sum(map(len, self.queues))
+
+    def report(self) -> str:
+        return "\n".join(stats.summary() for stats in self.stats)
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""UDP transport between a base station (gamepad + GUI) and an on-rover bridge that owns the Pico serial port.
+
+Each datagram is a header and one payload:
+    base -> rover   FRAME      a serial frame (WrapMsgPack), forwarded to the Pico unchanged
+    rover -> base   TELEMETRY  one message received from the Pico, msgpack'd (heartbeat echoes included)
+    rover -> base   STATS      the bridge's receive statistics, once a second
+
+Sequence numbers give loss, reordering & duplicate counts per direction. Control frames are latest-wins: the
+bridge drops one that's older than a control frame it already forwarded. Heartbeats (tx_scheduler.SAFETY) and
+commands are always forwarded. If nothing arrives from the base for `failsafe_after` s, the bridge sends the
+Pico a neutral control packet.
+
+    python udp_transport.py bridge --port auto --listen 0.0.0.0:5005     # on the rover
+    python udp_transport.py base --rover rover.local:5005                # at the base station
+    python udp_transport.py demo --loss 0.05 --delay 20 --jitter 10      # both ends on loopback
+
+tests/test_udp_transport.py checks both ends on loopback: latest-wins forwarding, heartbeat echoes, the StreamStats
+counts under loss & jitter, and the bridge failsafe.
+"""
+
+import asyncio
+import random
+import struct
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+import msgpack
+
+import metrics
+from pico_interface import ControlPacket, WrapMsgPack
+from tx_scheduler import CONTROL, SAFETY
+
+MAGIC = 0xAC
+HEADER = struct.Struct("<BBBIq")  # magic, kind, tx_scheduler class, seq, sender time.time_ns()
+FRAME, TELEMETRY, STATS = range(3)
+SEQ_MOD = 1 << 32
+
+UDP_RX_DATAGRAMS = metrics.REGISTRY.counter("udp_rx_datagrams", "datagrams received")
+UDP_LOST = metrics.REGISTRY.counter("udp_lost", "datagrams missing from the sequence")
+UDP_REORDERED = metrics.REGISTRY.counter("udp_reordered", "datagrams that arrived after a later one")
+UDP_SUPERSEDED = metrics.REGISTRY.counter("udp_superseded", "control frames dropped for being older than one forwarded")
+UDP_TRANSIT_SECONDS = metrics.REGISTRY.histogram("udp_transit_seconds", "receive time - send time (see StreamStats)")
+
+
+@dataclass
+class StreamStats:
+    """Receive statistics of one direction.
+
+    Transit is receive time - the sender's timestamp: the one-way latency when both ends share a clock (loopback,
+    or hosts synced by NTP/PTP), otherwise offset by the difference between the clocks. Jitter (RFC 3550) and
+    `transit - transit_min` (queueing delay) don't depend on the offset."""
+
+    received: int = 0
+    lost: int = 0  # gaps in the sequence, less the datagrams that turned up late
+    reordered: int = 0
+    duplicates: int = 0
+    superseded: int = 0
+    jitter: float = 0.0  # s
+    transit: float = 0.0  # s, latest
+    transit_min: float = float("inf")
+    transit_sum: float = 0.0
+    next_seq: int = None
+
+    def update(self, seq: int, sent_ns: int, now_ns: int) -> bool:
+        """Account for a datagram; returns False for a duplicate"""
+        if self.next_seq is not None:
+            ahead = (seq - self.next_seq) % SEQ_MOD
+            if ahead >= SEQ_MOD // 2:  # older than the newest seen: late, or a repeat
+                if seq in self._recent:
+                    self.duplicates += 1
+                    return False
+                self.reordered += 1
+                UDP_REORDERED.inc()
+                if (seq - self._first) % SEQ_MOD < SEQ_MOD // 2:  # it was counted as lost
+                    self.lost -= 1
+                    UDP_LOST.inc(-1)
+            else:
+                self.lost += ahead
+                UDP_LOST.inc(ahead)
+                self.next_seq = (seq + 1) % SEQ_MOD
+        else:
+            self._first = seq
+            self.next_seq = (seq + 1) % SEQ_MOD
+        self._recent.append(seq)
+        transit = (now_ns - sent_ns) * 1e-9
+        if self.received:
+            self.jitter += (abs(transit - self.transit) - self.jitter) / 16
+        self.transit = transit
+        self.transit_min = min(self.transit_min, transit)
+        self.transit_sum += transit
+        self.received += 1
+        UDP_RX_DATAGRAMS.inc()
+        UDP_TRANSIT_SECONDS.observe(max(0.0, transit))
+        return True
+
+    def __post_init__(self):
+        self._recent = deque(maxlen=64)  # for telling duplicates from late datagrams
+        self._first = 0  # first seq seen; earlier ones were never counted as lost
+
+    @property
+    def loss(self) -> float:
+        total = self.received + self.lost
+        return self.lost / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "lost": self.lost,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+            "superseded": self.superseded,
+            "jitter": self.jitter,
+            "transit_min": self.transit_min if self.received else 0.0,
+            "transit_avg": self.transit_sum / self.received if self.received else 0.0,
+        }
+
+    @staticmethod
+    def format(d: dict) -> str:
+        if not d["received"]:
+            return "nothing received"
+        total = d["received"] + d["lost"]
+        return (
+            f"{d['received']} received, lost {d['lost']} ({d['lost'] / total:.1%}), reordered {d['reordered']},"
+            f" duplicates {d['duplicates']}, superseded {d['superseded']}, jitter {d['jitter'] * 1e3:.2f} ms,"
+            f" transit min/avg {d['transit_min'] * 1e3:.2f}/{d['transit_avg'] * 1e3:.2f} ms"
+        )
+
+    def summary(self) -> str:
+        return self.format(self.as_dict())
+
+
+class UdpEndpoint(asyncio.DatagramProtocol):
+    def __init__(self, loss: float = 0.0, delay: float = 0.0, jitter: float = 0.0):
+        """loss, delay & jitter (s) impair what this end sends, to exercise the other end on loopback"""
+        self.transport: asyncio.DatagramTransport = None
+        self.peer = None  # address datagrams are sent to
+        self.stats = StreamStats()
+        self.seq = 0
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.last_rx = None  # time.monotonic() of the last valid datagram
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def send(self, kind: int, payload: bytes, cls: int = 0):
+        if self.transport is None or self.peer is None:
+            return
+        data = HEADER.pack(MAGIC, kind, cls, self.seq, time.time_ns()) + payload
+        self.seq = (self.seq + 1) % SEQ_MOD
+        if self.loss and random.random() < self.loss:
+            return
+        delay = self.delay + random.random() * self.jitter
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.transport.sendto, data, self.peer)
+        else:
+            self.transport.sendto(data, self.peer)
+
+    def datagram_received(self, data: bytes, addr):
+        if len(data) < HEADER.size:
+            return
+        magic, kind, cls, seq, sent_ns = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            return
+        self.last_rx = time.monotonic()
+        if self.stats.update(seq, sent_ns, time.time_ns()):
+            self.received(kind, cls, seq, memoryview(data)[HEADER.size :], addr)
+
+    def received(self, kind: int, cls: int, seq: int, payload: memoryview, addr):
+        pass
+
+    def error_received(self, exc):
+        # e.g. ECONNREFUSED while the other end isn't running yet; loss statistics cover the effect
+        pass
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+
+class BaseStation(UdpEndpoint):
+    """Base end: sends frames to the bridge; messages from the Pico are passed to on_message"""
+
+    def __init__(self, rover: tuple, on_message: Callable[[object], object] = None, **impair):
+        super().__init__(**impair)
+        self.peer = rover
+        self.on_message = on_message
+        self.remote_stats: dict = None  # the bridge's receive statistics: the uplink
+
+    def send_frame(self, frame: bytes, cls: int = CONTROL):
+        """A tx callable for ControlRuntime / LinkMonitor (with cls=SAFETY)"""
+        self.send(FRAME, frame, cls)
+
+    def received(self, kind, cls, seq, payload, addr):
+        if kind == TELEMETRY:
+            if self.on_message is not None:
+                self.on_message(msgpack.unpackb(payload))
+        elif kind == STATS:
+            self.remote_stats = msgpack.unpackb(payload)
+
+    def report(self) -> str:
+        uplink = StreamStats.format(self.remote_stats) if self.remote_stats else "no report from the bridge"
+        return f"uplink   {uplink}\ndownlink {self.stats.summary()}"
+
+
+class RoverBridge(UdpEndpoint):
+    """Rover end: forwards frames to the Pico through write(frame) and sends telemetry to the latest base"""
+
+    def __init__(self, write: Callable[[bytes], object], failsafe_after: float = 1.0, **impair):
+        super().__init__(**impair)
+        self.write = write
+        self.failsafe_after = failsafe_after
+        self.failsafe = False
+        self.neutral_frame = WrapMsgPack(msgpack.Packer(), ControlPacket().to_iter())
+        self._last_control = None  # seq of the newest control frame forwarded
+
+    def received(self, kind, cls, seq, payload, addr):
+        if kind != FRAME:
+            return
+        self.peer = addr
+        if cls == CONTROL:
+            if self._last_control is not None and (seq - self._last_control) % SEQ_MOD >= SEQ_MOD // 2:
+                self.stats.superseded += 1
+                UDP_SUPERSEDED.inc()
+                return
+            self._last_control = seq
+        if self.failsafe:
+            self.failsafe = False
+            print("Base station back")
+        self.write(bytes(payload))
+
+    def send_telemetry(self, obj):
+        self.send(TELEMETRY, msgpack.packb(obj))
+
+    def check(self):
+        """Trip the failsafe if the base has gone quiet; call periodically"""
+        if self.last_rx is None or self.failsafe:
+            return
+        if time.monotonic() - self.last_rx > self.failsafe_after:
+            self.failsafe = True
+            print(f"Base station silent for {self.failsafe_after:g} s: stopping the rover")
+            self.write(self.neutral_frame)
+
+    async def run(self, stats_interval: float = 1.0, check_interval: float = 0.1):
+        """Failsafe checks & stats reports to the base, until cancelled"""
+        next_stats = time.monotonic() + stats_interval
+        while True:
+            await asyncio.sleep(check_interval)
+            self.check()
+            if time.monotonic() >= next_stats:
+                next_stats += stats_interval
+                self.send(STATS, msgpack.packb(self.stats.as_dict()))
+
+
+def parse_address(text: str, default_host: str = "0.0.0.0", default_port: int = 5005) -> tuple:
+    host, _, port = text.rpartition(":")
+    return (host or default_host, int(port) if port else default_port)
+
+
+async def open_bridge(local: tuple, write: Callable[[bytes], object], **kwargs) -> RoverBridge:
+    loop = asyncio.get_running_loop()
+    _, bridge = await loop.create_datagram_endpoint(lambda: RoverBridge(write, **kwargs), local_addr=local)
+    return bridge
+
+
+async def open_base_station(rover: tuple, on_message=None, **impair) -> BaseStation:
+    loop = asyncio.get_running_loop()
+    _, base = await loop.create_datagram_endpoint(
+        lambda: BaseStation(rover, on_message, **impair), local_addr=("0.0.0.0", 0)
+    )
+    return base
+
+
+async def run_bridge(args):
+    """On the rover: UDP <-> PicoSerial"""
+    from pico_interface import AsyncSerialWriter, MsgDeframer, PicoSerial
+
+    loop = asyncio.get_running_loop()
+    pico = PicoSerial(None, None if args.port == "auto" else args.port)
+    bridge = await open_bridge(parse_address(args.listen), AsyncSerialWriter(pico).write)
+    deframer = MsgDeframer()
+
+    def receive():
+        try:
+            data = pico.read(pico.port.in_waiting or 1)
+        except OSError as e:
+            print(f"Serial read failed: {e}")
+            loop.remove_reader(pico.port.fileno())
+            return
+        for obj in deframer.feed(data):
+            bridge.send_telemetry(obj)
+
+    loop.add_reader(pico.port.fileno(), receive)
+    print(f"Bridging UDP {args.listen} <-> {pico.port.port}")
+    try:
+        await bridge.run()
+    finally:
+        loop.remove_reader(pico.port.fileno())
+        bridge.write(bridge.neutral_frame)
+        await asyncio.sleep(0.05)  # let it reach the port
+        print(f"uplink   {bridge.stats.summary()}")
+        bridge.close()
+
+
+async def run_base(args, backend=None, state=None, duration: float = None, **impair) -> BaseStation:
+    """At the base station: gamepad -> ControlRuntime -> UDP, with heartbeats through to the Pico"""
+    from functools import partial
+
+    from control_runtime import ControlRuntime
+    from input_backend import select_backend
+    from link_monitor import LinkMonitor
+
+    if backend is None and state is None:
+        backend = select_backend(args.backend)
+        print(f"Input: {backend.name}")
+    link = None
+
+    def on_message(obj):
+        if not link.on_message(obj):
+            print(f"~RX:{obj}")
+
+    base = await open_base_station(parse_address(args.rover, "127.0.0.1"), on_message, **impair)
+    link = LinkMonitor(partial(base.send_frame, cls=SAFETY), rate=args.heartbeat_rate)
+    runtime = ControlRuntime(backend, state, tx=base.send_frame, period=1 / args.rate, link=link)
+    control = asyncio.create_task(runtime.run())
+    start = time.monotonic()
+    try:
+        while not control.done():
+            if backend is not None and (not backend.running or backend.state.button_b):
+                runtime.stop()
+            if duration is not None and time.monotonic() - start > duration:
+                runtime.stop()
+            await asyncio.wait({control}, timeout=0.1)
+        await control
+    finally:
+        runtime.stop()
+        if backend is not None:
+            backend.stop()
+        print(f"control  {runtime.stats.summary()}, {runtime.packets_sent} packets")
+        print(f"link     {link.state}: {link.stats.summary()}")
+        print(base.report())
+        base.close()
+    return base
+
+
+async def run_demo(args):
+    """Both ends on loopback, with an in-process Pico that echoes heartbeats, and a synthetic gamepad"""
+    from math import sin
+
+    from gamepad import GamepadState
+    from link_monitor import is_heartbeat
+    from pico_interface import MsgDeframer
+
+    deframer = MsgDeframer()
+    received = []
+
+    def pico_write(frame: bytes):
+        for obj in deframer.feed(frame):
+            if is_heartbeat(obj):
+                bridge.send_telemetry(obj)
+            else:
+                received.append(obj)
+
+    impair = dict(loss=args.loss, delay=args.delay / 1000, jitter=args.jitter / 1000)
+    bridge = await open_bridge(parse_address(args.rover, "127.0.0.1"), pico_write, **impair)
+    bridge_task = asyncio.create_task(bridge.run())
+
+    state = GamepadState()
+
+    async def wiggle():
+        t0 = time.monotonic()
+        while True:
+            t = time.monotonic() - t0
+            state.joystick_left_x = sin(t)
+            state.trigger_right = 0.5 + 0.5 * sin(t / 3)
+            await asyncio.sleep(0.005)
+
+    wiggler = asyncio.create_task(wiggle())
+    try:
+        await run_base(args, state=state, duration=args.duration, **impair)
+    finally:
+        wiggler.cancel()
+        bridge_task.cancel()
+        bridge.close()
+    print(f"Pico got {len(received)} control packets")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import flight_recorder
+
+    parser = argparse.ArgumentParser(description="Drive the rover over UDP")
+    parser.add_argument("role", choices=["bridge", "base", "demo"])
+    parser.add_argument("--port", default="auto", help="bridge: Pico serial port, or 'auto' (default: auto)")
+    parser.add_argument("--listen", default="0.0.0.0:5005", help="bridge: UDP address to listen on")
+    parser.add_argument("--rover", default="127.0.0.1:5005", help="base/demo: the bridge's UDP address")
+    parser.add_argument("--backend", help="base: input backend (default: best available)")
+    parser.add_argument("--rate", type=float, default=100, help="base: control tick rate, Hz (default: 100)")
+    parser.add_argument("--heartbeat-rate", type=float, default=5, help="base: heartbeats per second (default: 5)")
+    parser.add_argument("--duration", type=float, default=5, help="demo: seconds to run (default: 5)")
+    parser.add_argument("--loss", type=float, default=0.0, help="demo: fraction of datagrams dropped, each way")
+    parser.add_argument("--delay", type=float, default=0.0, help="demo: added one-way delay, ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="demo: random extra delay up to this, ms")
+    args = parser.parse_args()
+    flight_recorder.install()
+
+    try:
+        asyncio.run({"bridge": run_bridge, "base": run_base, "demo": run_demo}[args.role](args))
+    except KeyboardInterrupt:
+        pass